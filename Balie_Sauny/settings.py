@@ -19,6 +19,9 @@ env = environ.Env()
 environ.Env.read_env()
 ENVIRONMENT = env('ENVIRONMENT', default='production')
 
+# 'wsgi' (sync workers) or 'asgi' (uvicorn workers, async read endpoints).
+SERVER_MODE = env('SERVER_MODE', default='wsgi')
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -74,6 +77,7 @@ INSTALLED_APPS = [
 
     'rest_framework',
     'rest_framework.authtoken',
+    'rest_framework_simplejwt.token_blacklist',
     'corsheaders',
     
     'base',
@@ -81,6 +85,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'base.metrics.metrics_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -92,6 +97,11 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# WhiteNoise is WSGI only: one sync middleware makes Django run every ASGI request
+# through a thread. Balie_Sauny.asgi serves the static files in front of Django instead.
+if SERVER_MODE == 'asgi':
+    MIDDLEWARE.remove('whitenoise.middleware.WhiteNoiseMiddleware')
+
 ROOT_URLCONF = 'Balie_Sauny.urls'
 
 TEMPLATES = [
@@ -128,6 +138,16 @@ if ENVIRONMENT == 'production' or POSTGRES_LOCALLY == True:
     DATABASES['default'] = dj_database_url.parse(env('DATABASE_URL'))
 
 
+# Cache
+# locmemcache:// (default) or filecache:///path locally, redis://host:port/db in production.
+
+CACHES = {
+    'default': env.cache_url('CACHE_URL', default='locmemcache://'),
+}
+
+API_CACHE_TIMEOUT = env.int('API_CACHE_TIMEOUT', default=300)
+
+
 # REST_FRAMEWORK = {
 #     'DEFAULT_PERMISSION_CLASSES': {
 #         'rest_framework.permissions.IsAuthenticated',
@@ -196,10 +216,19 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 
 if ENVIRONMENT == 'production' or POSTGRES_LOCALLY == True:
-    DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
+    STORAGES = {
+        'default': {'BACKEND': 'cloudinary_storage.storage.MediaCloudinaryStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    }
+    UPLOAD_BACKEND = env('UPLOAD_BACKEND', default='cloudinary')
 
 else:
     MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+    UPLOAD_BACKEND = env('UPLOAD_BACKEND', default='local')
+
+# Direct uploads: 'cloudinary' signs uploads straight to Cloudinary, 'local' is an offline stand-in.
+UPLOAD_TICKET_MAX_AGE = env.int('UPLOAD_TICKET_MAX_AGE', default=15 * 60)
+UPLOAD_MAX_BYTES = env.int('UPLOAD_MAX_BYTES', default=10 * 1024 * 1024)
 
 CLOUDINARY_STORAGE = {
     'CLOUD_NAME': env('CLOUD_NAME'),
@@ -213,12 +242,22 @@ AUTH_USER_MODEL = 'custom_auth.CustomUser'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'custom_auth.authentication.StatelessJWTAuthentication',
     ],
     
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+
+    'DEFAULT_PAGINATION_CLASS': 'base.pagination.KeysetPagination',
+    'PAGE_SIZE': env.int('API_PAGE_SIZE', default=50),
+
+    # Quotes tell whether a discount code exists, so anonymous clients must not sweep codes through them.
+    'DEFAULT_THROTTLE_RATES': {
+        'quotes': env('QUOTE_THROTTLE_RATE', default='30/min'),
+    },
 }
 
+API_MAX_PAGE_SIZE = env.int('API_MAX_PAGE_SIZE', default=200)
+
 
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Balie Sauny API',
@@ -227,19 +266,38 @@ SPECTACULAR_SETTINGS = {
     'SERVE_INCLUDE_SCHEMA': False,
 }
 
+# Threads per process that build image derivatives (base.images) off the request path; 0 builds inline.
+# Builds are deduplicated through the cache, so workers only share them with a shared CACHE_URL.
+DERIVATIVE_WORKERS = env.int('DERIVATIVE_WORKERS', default=2)
+
+# Written by `manage.py build_openapi_schema` in the release step, generated in-process when missing.
+OPENAPI_SCHEMA_DIR = env('OPENAPI_SCHEMA_DIR', default=os.path.join(BASE_DIR, 'openapi'))
+OPENAPI_SCHEMA_MAX_AGE = env.int('OPENAPI_SCHEMA_MAX_AGE', default=24 * 60 * 60)
+
+# Request metrics (base.metrics). Workers of one gunicorn master share snapshots through
+# METRICS_DIR, which gunicorn.conf.py sets; without it /metrics covers this process only.
+METRICS_DIR = env('METRICS_DIR', default=None)
+METRICS_FLUSH_INTERVAL = env.float('METRICS_FLUSH_INTERVAL', default=5.0)
+METRICS_SERVER_TIMING = env.bool('METRICS_SERVER_TIMING', default=True)
+
 
 from datetime import timedelta
 
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),
-    'REFRESH_TOKEN_LIFE_TIME': timedelta(days=7),
-    'ROTATE_REFRESH_TOKENs': True,
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
+    'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
 }
 
+# Per-process Bloom pre-filter for blacklisted refresh tokens (custom_auth.blacklist),
+# used only with a shared CACHE_URL; with the local memory cache every check queries.
+JWT_BLACKLIST_FILTER_CAPACITY = env.int('JWT_BLACKLIST_FILTER_CAPACITY', default=1_000_000)
+JWT_BLACKLIST_FILTER_ERROR_RATE = env.float('JWT_BLACKLIST_FILTER_ERROR_RATE', default=0.01)
+
 HONEYPOT_VERIFIER = 'honeypot.verifiers.HoneypotFieldVerifier'
 HONEYPOT_MESSAGE = 'Nice try, bot!'
 
@@ -18,7 +18,9 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
+from drf_spectacular.views import SpectacularSwaggerView, SpectacularRedocView
+from base.schema import PrebuiltSchemaView
+from base.views import MetricsView
 
 
 urlpatterns = [
@@ -27,9 +29,10 @@ urlpatterns = [
     path('api/', include('base.urls')),
     path('auth/', include('custom_auth.urls')),
     
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
-    path('api/schema/swagger-ui/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
-    path('api/schema/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+    path('api/schema/', PrebuiltSchemaView.as_view(), name='schema'),
+    path('api/schema/swagger-ui/', SpectacularSwaggerView.as_view(url='/api/schema/?format=json'), name='swagger-ui'),
+    path('api/schema/redoc/', SpectacularRedocView.as_view(url='/api/schema/?format=json'), name='redoc'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
 
 if settings.DEBUG:
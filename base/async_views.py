@@ -0,0 +1,121 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotAllowed
+from django.shortcuts import aget_object_or_404
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.views import exception_handler
+
+from .availability import atub_availability, parse_window
+from .filters import filter_tubs, AVAILABILITY_PARAMS
+from .models import Tub, Rating, Faq
+from .pagination import KeysetPagination, TubPagination
+from .response_cache import cached
+from .serializers import TubSerializer, RatingSerializer, FaqSerializer
+from .stamps import conditional
+
+
+class AsyncAPIView(View):
+    """
+    Async counterpart of DRF's APIView for the public read endpoints served
+    in ASGI mode. GET/HEAD handlers are coroutines returning DRF Responses,
+    rendered as JSON; errors go through DRF's exception handler so clients
+    see the same bodies as from the sync views. Any other method is handed
+    to ``fallback``, the sync view that owns the URL in WSGI mode.
+    """
+    fallback = None
+    renderer_class = JSONRenderer
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Like APIView: CSRF is left to the authentication classes of the fallback view.
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            if self.fallback is None:
+                return HttpResponseNotAllowed(['GET', 'HEAD'])
+            return await sync_to_async(self.fallback)(request, *args, **kwargs)
+
+        request = Request(request, authenticators=())
+        try:
+            response = await self.get(request, *args, **kwargs)
+        except Exception as exc:
+            response = exception_handler(exc, {'view': self, 'args': args, 'kwargs': kwargs, 'request': request})
+            if response is None:
+                raise
+
+        if isinstance(response, Response):
+            response.accepted_renderer = self.renderer_class()
+            response.accepted_media_type = response.accepted_renderer.media_type
+            response.renderer_context = {'view': self, 'args': args, 'kwargs': kwargs, 'request': request, 'response': response}
+        return response
+
+    async def paginated_response(self, queryset, serializer_class, request, pagination_class=KeysetPagination):
+        paginator = pagination_class()
+        page_queryset = paginator.get_page_queryset(queryset, request, view=self)
+        if page_queryset is None:
+            rows = [obj async for obj in queryset]
+            return Response(serializer_class(rows, many=True, context={'request': request}).data)
+
+        page = paginator.set_page([obj async for obj in page_queryset])
+        return paginator.get_paginated_response(serializer_class(page, many=True, context={'request': request}).data)
+
+
+class AsyncTubListView(AsyncAPIView):
+    async def get(self, request):
+        try:
+            queryset = filter_tubs(Tub.objects.prefetch_related('images'), request.query_params)
+        except ValueError as e:
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if any(request.query_params.get(name) for name in AVAILABILITY_PARAMS):
+            return await self.tub_list(request, queryset)
+        return await self.cached_tub_list(request, queryset)
+
+    @conditional('tubs')
+    @cached('tubs')
+    async def cached_tub_list(self, request, queryset):
+        return await self.tub_list(request, queryset)
+
+    async def tub_list(self, request, queryset):
+        return await self.paginated_response(queryset, TubSerializer, request, pagination_class=TubPagination)
+
+
+class AsyncTubDetailView(AsyncAPIView):
+    @conditional('tub:{pk}')
+    @cached('tub:{pk}')
+    async def get(self, request, pk):
+        tub = await aget_object_or_404(Tub.objects.prefetch_related('images'), pk=pk)
+        return Response(TubSerializer(tub, context={'request': request}).data)
+
+
+class AsyncRatingListView(AsyncAPIView):
+    async def get(self, request, pk):
+        tub = await aget_object_or_404(Tub, pk=pk)
+        ratings = Rating.objects.select_related('tub').filter(tub=tub)
+        return await self.paginated_response(ratings, RatingSerializer, request)
+
+
+class AsyncPublishedFaqListView(AsyncAPIView):
+    @conditional('faq')
+    @cached('faq')
+    async def get(self, request):
+        return await self.paginated_response(Faq.objects.filter(is_published=True), FaqSerializer, request)
+
+
+class AsyncAvailabilityView(AsyncAPIView):
+    async def get(self, request):
+        try:
+            tub_ids, start_date, end_date = parse_window(request.query_params)
+        except ValueError as e:
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'from': start_date,
+            'to': end_date,
+            'tubs': await atub_availability(tub_ids, start_date, end_date),
+        }, status=status.HTTP_200_OK)
@@ -0,0 +1,162 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Tub, Reservation, ReservedDay
+
+
+MAX_WINDOW_DAYS = 366
+
+# SQLSTATE raised by the reservation_no_overlap exclusion constraint (migration 0018).
+EXCLUSION_VIOLATION = '23P01'
+
+
+class TubUnavailable(Exception):
+    pass
+
+
+def _as_date(value):
+    # Reservation.objects.create() keeps whatever was passed in, often an ISO string.
+    return Reservation._meta.get_field('start_date').to_python(value)
+
+
+def date_range(start, end):
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+def sync_reserved_days(reservation):
+    """
+    Rebuild the day index rows of a single reservation so they match its
+    tub, dates and status; only pending and accepted reservations hold days.
+    """
+    ReservedDay.objects.filter(reservation=reservation).delete()
+
+    start_date = _as_date(reservation.start_date)
+    end_date = _as_date(reservation.end_date)
+    if not reservation.tub_id or not start_date or not end_date or reservation.status not in Reservation.ACTIVE_STATUSES:
+        return
+
+    ReservedDay.objects.bulk_create([
+        ReservedDay(
+            tub_id=reservation.tub_id,
+            reservation_id=reservation.pk,
+            day=day,
+            accepted=reservation.status == Reservation.Status.ACCEPTED,
+        )
+        for day in date_range(start_date, end_date)
+    ])
+
+
+def booked_days(tub_ids, start, end):
+    """
+    Return ``{tub_id: {day: accepted}}`` for every booked day of the given
+    tubs inside ``[start, end]``, using a single query on the day index.
+    """
+    return _group_booked(_booked_rows(tub_ids, start, end))
+
+
+async def abooked_days(tub_ids, start, end):
+    return _group_booked([row async for row in _booked_rows(tub_ids, start, end)])
+
+
+def _booked_rows(tub_ids, start, end):
+    return ReservedDay.objects.filter(tub_id__in=tub_ids, day__range=(start, end)).values_list('tub_id', 'day', 'accepted')
+
+
+def _group_booked(rows):
+    booked = defaultdict(dict)
+    for tub_id, day, accepted in rows:
+        booked[tub_id][day] = booked[tub_id].get(day, False) or accepted
+    return booked
+
+
+def tub_availability(tub_ids, start, end):
+    return _availability(tub_ids, start, end, booked_days(tub_ids, start, end))
+
+
+async def atub_availability(tub_ids, start, end):
+    return _availability(tub_ids, start, end, await abooked_days(tub_ids, start, end))
+
+
+def _availability(tub_ids, start, end, booked):
+    days = list(date_range(start, end))
+    result = []
+    for tub_id in tub_ids:
+        tub_booked = booked.get(tub_id, {})
+        result.append({
+            'tub': tub_id,
+            'free_days': [day for day in days if day not in tub_booked],
+            'booked_days': [{'day': day, 'accepted': tub_booked[day]} for day in days if day in tub_booked],
+        })
+    return result
+
+
+def _parse_day(value):
+    # parse_date() returns None for text that is not a date at all, which would quietly fall back to the default.
+    if not value:
+        return None
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(value)
+    return day
+
+
+def parse_window(query_params):
+    """
+    Read ``?tubs=1,2&from=&to=`` into ``(tub_ids, start, end)``. The window
+    defaults to the next 30 days; raises ValueError with a client message.
+    """
+    try:
+        tub_ids = [int(pk) for pk in query_params.get('tubs', '').split(',') if pk.strip()]
+        start = _parse_day(query_params.get('from')) or timezone.localdate()
+        end = _parse_day(query_params.get('to')) or start + timedelta(days=30)
+    except ValueError:
+        raise ValueError('Tubs must be a comma separated list of ids and dates must be YYYY-MM-DD')
+
+    if not tub_ids:
+        raise ValueError('At least one tub id is required')
+
+    if end < start or (end - start).days >= MAX_WINDOW_DAYS:
+        raise ValueError(f'The date window must be between 1 and {MAX_WINDOW_DAYS} days')
+    return tub_ids, start, end
+
+
+def is_booked(tub_id, start, end):
+    return ReservedDay.objects.filter(tub_id=tub_id, day__range=(start, end)).exists()
+
+
+def lock_tub(tub_id):
+    # SELECT ... FOR UPDATE is a no-op on SQLite, a no-op UPDATE takes the write lock on every backend.
+    Tub.objects.filter(pk=tub_id).update(price_per_day=F('price_per_day'))
+
+
+def book_tub(tub, start_date, end_date, **fields):
+    """
+    Insert a reservation for ``tub`` or raise ``TubUnavailable`` if it
+    overlaps an existing one. Must run inside ``transaction.atomic()``.
+
+    On PostgreSQL the exclusion constraint rejects overlapping rows, so
+    concurrent bookings of different tubs never wait on each other. Other
+    backends lock the tub row and check the day index before inserting.
+    """
+    if connection.vendor == 'postgresql':
+        try:
+            with transaction.atomic():
+                return Reservation.objects.create(tub=tub, start_date=start_date, end_date=end_date, **fields)
+        except IntegrityError as e:
+            cause = e.__cause__
+            if getattr(cause, 'pgcode', None) == EXCLUSION_VIOLATION or getattr(cause, 'sqlstate', None) == EXCLUSION_VIOLATION:
+                raise TubUnavailable() from e
+            raise
+
+    lock_tub(tub.pk)
+    if is_booked(tub.pk, start_date, end_date):
+        raise TubUnavailable()
+    return Reservation.objects.create(tub=tub, start_date=start_date, end_date=end_date, **fields)
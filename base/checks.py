@@ -0,0 +1,44 @@
+from django.core.checks import Error, Tags, register
+from django.db import DEFAULT_DB_ALIAS, connection
+
+from .search import SEARCH_QUERIES, SEARCH_SCOPES
+
+
+@register(Tags.compatibility)
+def check_search_backend(app_configs, **kwargs):
+    """base.search has a query per database vendor; refuse to start on any other."""
+    if connection.vendor in SEARCH_QUERIES:
+        return []
+    return [Error(
+        f'Full-text search is not set up for {connection.vendor}',
+        hint=f'Use one of: {", ".join(SEARCH_QUERIES)}, or add a query for it to base.search.SEARCH_QUERIES and an index to migration 0025.',
+        id='base.E001',
+    )]
+
+
+@register(Tags.database)
+def check_search_triggers(app_configs, databases=None, **kwargs):
+    """
+    On SQLite the FTS5 tables are kept in sync by triggers, which a migration
+    rebuilding the indexed table drops without a word. Tables whose FTS5
+    index is not there yet (migrations not applied) are skipped.
+    """
+    if not databases or DEFAULT_DB_ALIAS not in databases or connection.vendor != 'sqlite':
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT type, name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existing = set(cursor.fetchall())
+
+    errors = []
+    for _, table, _, _, _ in SEARCH_SCOPES.values():
+        fts = f'{table}_fts'
+        if ('table', fts) not in existing:
+            continue
+        missing = [f'{fts}_{suffix}' for suffix in ('ai', 'ad', 'au') if ('trigger', f'{fts}_{suffix}') not in existing]
+        if missing:
+            errors.append(Error(
+                f'{table} is missing the search index triggers {", ".join(missing)}, search results will go stale',
+                hint='A migration that rebuilt the table dropped them; create them again as migration 0025 does.',
+                id='base.E002',
+            ))
+    return errors
@@ -0,0 +1,84 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+RESERVATION_EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('tub', 'tub_id'),
+    ('tub_name', 'tub__name'),
+    ('user', 'user_id'),
+    ('username', 'user__username'),
+    ('start_date', 'start_date'),
+    ('end_date', 'end_date'),
+    ('price', 'price'),
+    ('counted_price', 'counted_price'),
+    ('status', 'status'),
+    ('city', 'address_to_reservation__city'),
+    ('street', 'address_to_reservation__street'),
+    ('home_number', 'address_to_reservation__home_number'),
+]
+
+DISCOUNT_EXPORT_COLUMNS = [
+    ('code', 'main'),
+    ('tub', 'tub_id'),
+    ('value', 'value'),
+    ('batch', 'batch'),
+]
+
+CHUNK_SIZE = 2000
+BUFFER_SIZE = 64 * 1024
+
+
+class Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def _rows(queryset, columns):
+    return queryset.values_list(*[lookup for _, lookup in columns]).iterator(chunk_size=CHUNK_SIZE)
+
+
+def _buffered(lines):
+    # The first line goes out on its own so the client gets bytes right away,
+    # after that rows are batched instead of sending one socket write per row.
+    for line in lines:
+        yield line
+        break
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= BUFFER_SIZE:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def csv_lines(queryset, columns):
+    writer = csv.writer(Echo())
+    yield writer.writerow([header for header, _ in columns])
+    for row in _rows(queryset, columns):
+        yield writer.writerow(row)
+
+
+def ndjson_lines(queryset, columns):
+    headers = [header for header, _ in columns]
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for row in _rows(queryset, columns):
+        yield encoder.encode(dict(zip(headers, row))) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', csv_lines),
+    'ndjson': ('application/x-ndjson', ndjson_lines),
+}
+
+
+def export_stream(queryset, columns, export_format):
+    """Return ``(content_type, iterator of str chunks)`` for a streaming response."""
+    content_type, lines = EXPORT_FORMATS[export_format]
+    return content_type, _buffered(lines(queryset, columns))
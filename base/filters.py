@@ -0,0 +1,75 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Exists, OuterRef
+from django.utils.dateparse import parse_date
+
+from .availability import MAX_WINDOW_DAYS
+from .models import Reservation
+
+
+# ?ordering= -> keyset ordering; each one is served by an index from migration 0024.
+TUB_ORDERINGS = {
+    'id': ('id',),
+    'price': ('price_per_day', 'id'),
+    '-price': ('-price_per_day', '-id'),
+    'rating': ('rating_average', 'id'),
+    '-rating': ('-rating_average', '-id'),
+}
+
+AVAILABILITY_PARAMS = ('from', 'to')
+
+
+def _decimal(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        value = Decimal(value)
+    except InvalidOperation:
+        value = None
+    if value is None or not value.is_finite():
+        raise ValueError(f'{name} must be a number')
+    return value
+
+
+def tub_ordering(params):
+    ordering = params.get('ordering') or 'id'
+    if ordering not in TUB_ORDERINGS:
+        raise ValueError(f'Ordering must be one of: {", ".join(TUB_ORDERINGS)}')
+    return TUB_ORDERINGS[ordering]
+
+
+def filter_tubs(queryset, params):
+    """
+    Narrow ``queryset`` by ``min_price``/``max_price`` (daily rate),
+    ``min_rating`` and a ``from``/``to`` window the tub must be free for.
+    Everything ends up in the tubs query itself, the window as a ``NOT
+    EXISTS`` over the pending and accepted reservations of each tub.
+    Raises ValueError with a client message on bad input, ``ordering``
+    included.
+    """
+    tub_ordering(params)
+    min_price, max_price, min_rating = _decimal(params, 'min_price'), _decimal(params, 'max_price'), _decimal(params, 'min_rating')
+    if min_price is not None:
+        queryset = queryset.filter(price_per_day__gte=min_price)
+    if max_price is not None:
+        queryset = queryset.filter(price_per_day__lte=max_price)
+    if min_rating is not None:
+        queryset = queryset.filter(rating_average__gte=min_rating)
+
+    if any(params.get(name) for name in AVAILABILITY_PARAMS):
+        try:
+            start_date = parse_date(params.get('from') or '')
+            end_date = parse_date(params.get('to') or '')
+        except ValueError:
+            start_date = end_date = None
+        if start_date is None or end_date is None:
+            raise ValueError('Both from and to are required, as YYYY-MM-DD')
+        if end_date < start_date or (end_date - start_date).days >= MAX_WINDOW_DAYS:
+            raise ValueError(f'The date window must be between 1 and {MAX_WINDOW_DAYS} days')
+
+        booked = Reservation.objects.filter(
+            tub=OuterRef('pk'), start_date__lte=end_date, end_date__gte=start_date, status__in=Reservation.ACTIVE_STATUSES,
+        )
+        queryset = queryset.filter(~Exists(booked))
+    return queryset
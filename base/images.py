@@ -0,0 +1,206 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.urls import reverse
+from PIL import Image as PILImage, ImageOps, UnidentifiedImageError
+
+from .models import Tub, Image
+from .stamps import bump
+
+
+logger = logging.getLogger(__name__)
+
+# Long enough for the slowest build; a crashed build frees the object again after it.
+BUILD_LOCK_TIMEOUT = 5 * 60
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+# Longest side in pixels; sources are never upscaled.
+DERIVATIVE_SIZES = {
+    'thumbnail': 320,
+    'medium': 800,
+    'large': 1600,
+}
+
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# (model, image field, derivatives JSON field) per kind used in derivative URLs.
+DERIVATIVE_TARGETS = {
+    'image': (Image, 'image', 'derivatives'),
+    'logo': (Tub, 'logo_img', 'logo_derivatives'),
+}
+
+
+def derivative_name(source_name, size, fmt):
+    stem = os.path.splitext(source_name)[0]
+    return f'derivatives/{stem}/{size}.{fmt}'
+
+
+def _encode(image, fmt):
+    pil_format, options = DERIVATIVE_FORMATS[fmt]
+    if fmt == 'jpeg' and image.mode != 'RGB':
+        # JPEG has no alpha channel, flatten onto white.
+        background = PILImage.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    buffer = BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def build_derivatives(field_file, previous=None):
+    """
+    Render every size and format of ``field_file`` with Pillow, store them
+    through the file's storage and return the map saved on the model:
+    ``{'source': name, size: {'width': px, fmt: stored name, ...}, ...}``.
+    """
+    storage = field_file.storage
+    with field_file.open('rb') as f:
+        source = PILImage.open(f)
+        source.load()
+    source = ImageOps.exif_transpose(source)
+    if source.mode not in ('RGB', 'RGBA'):
+        source = source.convert('RGBA' if 'transparency' in source.info else 'RGB')
+
+    for size, names in (previous or {}).items():
+        if size in DERIVATIVE_SIZES:
+            for fmt in DERIVATIVE_FORMATS:
+                if names.get(fmt):
+                    storage.delete(names[fmt])
+
+    derivatives = {'source': field_file.name}
+    for size, longest_side in DERIVATIVE_SIZES.items():
+        image = source.copy()
+        image.thumbnail((longest_side, longest_side), PILImage.LANCZOS)
+        derivatives[size] = {'width': image.width}
+        for fmt in DERIVATIVE_FORMATS:
+            name = derivative_name(field_file.name, size, fmt)
+            derivatives[size][fmt] = storage.save(name, ContentFile(_encode(image, fmt)))
+    return derivatives
+
+
+def is_current(instance, field_name, map_field):
+    field_file = getattr(instance, field_name)
+    return bool(field_file) and getattr(instance, map_field).get('source') == field_file.name
+
+
+def ensure_derivatives(instance, field_name, map_field):
+    """
+    Build the derivatives of ``instance`` if they are missing or belong to an
+    older upload. Returns True when the stored map is current afterwards.
+    Call it through ``schedule_derivatives()``, which holds the build lock.
+    """
+    field_file = getattr(instance, field_name)
+    if not field_file:
+        return False
+    if is_current(instance, field_name, map_field):
+        return True
+
+    try:
+        derivatives = build_derivatives(field_file, previous=getattr(instance, map_field))
+    except (OSError, UnidentifiedImageError, PILImage.DecompressionBombError):
+        logger.warning('Could not build derivatives for %s', field_file.name, exc_info=True)
+        return False
+
+    setattr(instance, map_field, derivatives)
+    # update() skips post_save, so the save hook that scheduled us is not re-entered.
+    type(instance).objects.filter(pk=instance.pk).update(**{map_field: derivatives})
+    # Only the tub's own stamp: a backfill must not flush the cached catalogue once per
+    # image. Cached list pages keep the lazy URLs, which redirect to the new files.
+    bump(f'tub:{instance.pk if isinstance(instance, Tub) else instance.tub_id}')
+    return True
+
+
+def _lock_key(kind, pk):
+    return f'derivatives:build:{kind}:{pk}'
+
+
+def _build(kind, pk):
+    model, field_name, map_field = DERIVATIVE_TARGETS[kind]
+    try:
+        instance = model.objects.filter(pk=pk).first()
+        if instance is not None:
+            ensure_derivatives(instance, field_name, map_field)
+    finally:
+        cache.delete(_lock_key(kind, pk))
+
+
+def _build_in_worker(kind, pk):
+    try:
+        _build(kind, pk)
+    except Exception:
+        logger.exception('Building derivatives of %s %s failed', kind, pk)
+    finally:
+        # Worker threads get their own connection, nothing else would close it.
+        connection.close()
+
+
+def _executor():
+    # One pool per process: threads of a pool made before gunicorn forks do not exist in the workers.
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(max_workers=settings.DERIVATIVE_WORKERS, thread_name_prefix='derivatives')
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def schedule_derivatives(kind, pk):
+    """
+    Build the derivatives of one ``DERIVATIVE_TARGETS`` object in a
+    background thread, off the request and save path. The ``cache.add()``
+    lock makes concurrent callers (first hits of the lazy endpoint, saves)
+    start one build, not one each that would leave orphaned files behind;
+    across gunicorn workers that takes a shared ``CACHE_URL``, the default
+    local memory cache only dedupes within a process. With
+    ``DERIVATIVE_WORKERS = 0`` the build runs in the caller.
+    """
+    if not cache.add(_lock_key(kind, pk), 1, BUILD_LOCK_TIMEOUT):
+        return
+    if settings.DERIVATIVE_WORKERS:
+        _executor().submit(_build_in_worker, kind, pk)
+    else:
+        _build(kind, pk)
+
+
+def srcset(instance, field_name, map_field, kind, request=None):
+    """
+    ``{fmt: 'url 320w, url 800w, ...'}`` for an image field. Derivatives
+    that do not exist yet point at the lazy derivative endpoint, which starts
+    building them on first hit.
+    """
+    field_file = getattr(instance, field_name)
+    if not field_file:
+        return None
+
+    current = is_current(instance, field_name, map_field)
+    derivatives = getattr(instance, map_field)
+    result = {}
+    for fmt in DERIVATIVE_FORMATS:
+        entries = []
+        for size, longest_side in DERIVATIVE_SIZES.items():
+            if current:
+                url = field_file.storage.url(derivatives[size][fmt])
+                width = derivatives[size]['width']
+            else:
+                url = reverse('image-derivative', kwargs={'kind': kind, 'pk': instance.pk, 'size': size, 'fmt': fmt})
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                width = longest_side
+            entries.append(f'{url} {width}w')
+        result[fmt] = ', '.join(entries)
+    return result
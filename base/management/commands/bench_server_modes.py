@@ -0,0 +1,206 @@
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+SERVER_MODES = ('wsgi', 'asgi')
+
+DEFAULT_PATHS = ['/api/tubs/', '/api/faq/', '/api/availability/?tubs=1']
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def _request(port, path, timeout):
+    started = time.perf_counter()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    try:
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nAccept: application/json\r\nConnection: close\r\n\r\n'.encode())
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    status_code = int(response.split(b' ', 2)[1]) if response.startswith(b'HTTP/') else 0
+    return status_code, time.perf_counter() - started
+
+
+def _worker_memory(master_pid):
+    """Average ``(pss_mb, rss_mb)`` of the master's children, read from /proc (Linux only)."""
+    try:
+        with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+            children = f.read().split()
+        samples = []
+        for pid in children:
+            with open(f'/proc/{pid}/smaps_rollup') as f:
+                fields = dict(line.split(':', 1) for line in f if line.startswith(('Rss:', 'Pss:')))
+            samples.append((int(fields['Pss'].split()[0]), int(fields['Rss'].split()[0])))
+    except (OSError, KeyError, ValueError):
+        return None, None
+    if not samples:
+        return None, None
+    return tuple(round(sum(sample[i] for sample in samples) / len(samples) / 1024, 1) for i in (0, 1))
+
+
+async def _slow_client(port, stop):
+    """Hold a connection open by trickling request headers, like a client on a bad mobile link."""
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    except OSError:
+        return
+    try:
+        writer.write(b'GET /api/tubs/ HTTP/1.1\r\nHost: localhost\r\n')
+        while not stop.is_set():
+            writer.write(b'X-Slow: 1\r\n')
+            await writer.drain()
+            await asyncio.sleep(1)
+    except OSError:
+        pass
+    finally:
+        writer.close()
+
+
+async def _load(port, paths, concurrency, duration, slow_clients, timeout):
+    stop = asyncio.Event()
+    slow = [asyncio.create_task(_slow_client(port, stop)) for _ in range(slow_clients)]
+    await asyncio.sleep(0.5 if slow_clients else 0)
+
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def client(offset):
+        nonlocal errors
+        i = offset
+        while time.perf_counter() < deadline:
+            try:
+                status_code, latency = await _request(port, paths[i % len(paths)], timeout)
+            except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                errors += 1
+            else:
+                if status_code == 200:
+                    latencies.append(latency)
+                else:
+                    errors += 1
+            i += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await asyncio.gather(*slow)
+
+    def percentile(p):
+        if len(latencies) < 2:
+            return round(latencies[0] * 1000, 1) if latencies else None
+        return round(statistics.quantiles(latencies, n=100, method='inclusive')[p - 1] * 1000, 1)
+
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Starts gunicorn with gunicorn.conf.py in WSGI (gthread workers) and ASGI (uvicorn workers) '
+        'mode against the configured database and measures cold start, worker memory, throughput and '
+        'latency at rising concurrency, optionally with slow clients holding connections open'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', default='wsgi,asgi')
+        parser.add_argument('--workers', type=int, help='Defaults to the gunicorn.conf.py value')
+        parser.add_argument('--concurrency', default='1,8,32,128')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per concurrency level')
+        parser.add_argument('--slow-clients', type=int, default=0)
+        parser.add_argument('--max-p95-ms', type=float, default=500, help='Latency budget that defines the concurrency ceiling')
+        parser.add_argument('--timeout', type=float, default=10)
+        parser.add_argument('--path', action='append', dest='paths', help='Endpoint to request, repeatable')
+        parser.add_argument('--json', dest='json_file', help='Also write the results to this file')
+
+    def handle(self, *args, **options):
+        modes = [mode.strip() for mode in options['modes'].split(',') if mode.strip()]
+        unknown = set(modes) - set(SERVER_MODES)
+        if unknown:
+            raise CommandError(f'Unknown mode(s): {", ".join(sorted(unknown))}')
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        paths = options['paths'] or DEFAULT_PATHS
+
+        results = {}
+        for mode in modes:
+            port = _free_port()
+            server, cold_start = self._start(mode, port, options['workers'], paths[0])
+            self.stdout.write(f'{mode:4}  first 200 after {cold_start}s')
+            try:
+                rows = []
+                for level in levels:
+                    row = asyncio.run(_load(port, paths, level, options['duration'], options['slow_clients'], options['timeout']))
+                    rows.append(row)
+                    self.stdout.write(
+                        f'{mode:4}  c={row["concurrency"]:<4} {row["rps"]:>8} req/s  '
+                        f'p50={row["p50_ms"]}ms p95={row["p95_ms"]}ms p99={row["p99_ms"]}ms errors={row["errors"]}'
+                    )
+                pss, rss = _worker_memory(server.pid)
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+            within_budget = [row['concurrency'] for row in rows if not row['errors'] and row['p95_ms'] is not None and row['p95_ms'] <= options['max_p95_ms']]
+            results[mode] = {
+                'cold_start_s': cold_start,
+                'worker_pss_mb': pss,
+                'worker_rss_mb': rss,
+                'levels': rows,
+                'ceiling': max(within_budget, default=0),
+            }
+
+        for mode, result in results.items():
+            self.stdout.write(
+                f'{mode}: concurrency ceiling {result["ceiling"]} (p95 <= {options["max_p95_ms"]}ms, no errors), '
+                f'cold start {result["cold_start_s"]}s, per worker PSS {result["worker_pss_mb"]}MB RSS {result["worker_rss_mb"]}MB'
+            )
+
+        if options['json_file']:
+            with open(options['json_file'], 'w') as f:
+                json.dump({'options': {key: options[key] for key in ('workers', 'duration', 'slow_clients', 'max_p95_ms')}, 'paths': paths, 'results': results}, f, indent=2)
+
+    def _start(self, mode, port, workers, path):
+        """Start gunicorn and return ``(process, seconds until the first 200 on path)``."""
+        env = dict(os.environ, SERVER_MODE=mode)
+        command = [
+            sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py',
+            '--bind', f'127.0.0.1:{port}', '--access-logfile', os.devnull, '--log-level', 'warning',
+        ]
+        if workers:
+            command += ['--workers', str(workers)]
+
+        started = time.perf_counter()
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env)
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'gunicorn exited while starting in {mode} mode')
+            try:
+                status_code, _ = asyncio.run(_request(port, path, 5))
+            except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                status_code = None
+            if status_code == 200:
+                return server, round(time.perf_counter() - started, 2)
+            time.sleep(0.05)
+        server.terminate()
+        raise CommandError(f'gunicorn did not start in {mode} mode')
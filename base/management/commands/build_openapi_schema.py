@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from base.schema import generate_schema, write_artifacts
+
+
+class Command(BaseCommand):
+    help = 'Generates the OpenAPI schema once and writes the YAML and JSON artifacts served at /api/schema/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', dest='directory', help='Defaults to settings.OPENAPI_SCHEMA_DIR')
+
+    def handle(self, *args, **options):
+        for path in write_artifacts(generate_schema(), options['directory']):
+            self.stdout.write(f'Wrote {path}')
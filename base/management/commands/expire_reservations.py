@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from base.moderation import expire_reservations
+
+
+class Command(BaseCommand):
+    help = 'Expires pending reservations that were never accepted before their start date; run it daily'
+
+    def handle(self, *args, **options):
+        expired = expire_reservations(timezone.localdate())
+        self.stdout.write(f'Expired {expired} reservations')
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from base.exports import export_stream, DISCOUNT_EXPORT_COLUMNS
+from base.models import Tub, Discount
+from base.promotions import generate_codes, validate_generation
+
+
+class Command(BaseCommand):
+    help = 'Generates unique single-use discount codes for one tub or for any tub and writes them as CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, required=True)
+        parser.add_argument('--value', type=int, required=True, help='Discount percentage')
+        parser.add_argument('--tub', type=int, help='Tub id, codes are valid for any tub when omitted')
+        parser.add_argument('--prefix', default='')
+        parser.add_argument('--output', help='CSV file to write, stdout when omitted')
+
+    def handle(self, *args, **options):
+        try:
+            count, value, prefix = validate_generation(options['count'], options['value'], options['prefix'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['tub'] is not None and not Tub.objects.filter(pk=options['tub']).exists():
+            raise CommandError(f'Tub {options["tub"]} does not exist')
+
+        batch = generate_codes(count, value, tub_id=options['tub'], prefix=prefix)
+        _, stream = export_stream(Discount.objects.filter(batch=batch).order_by('id'), DISCOUNT_EXPORT_COLUMNS, 'csv')
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as f:
+                f.writelines(stream)
+            self.stderr.write(f'Wrote {count} codes of batch {batch} to {options["output"]}')
+        else:
+            for chunk in stream:
+                self.stdout.write(chunk, ending='')
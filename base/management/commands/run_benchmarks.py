@@ -0,0 +1,278 @@
+import json
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from base.models import Tub, Reservation, Rating, Discount
+from custom_auth.models import CustomUser
+
+
+MIN_P95_REGRESSION_MS = 1.0
+
+BROWSE_QUERIES = [
+    {},
+    {'ordering': 'price'},
+    {'ordering': '-rating'},
+    {'min_price': 300, 'max_price': 600},
+    {'min_rating': 4, 'ordering': '-price'},
+]
+SEARCH_TERMS = ['balia', 'sauna cedrowa', 'hydromasaż', 'piec', 'jacuzzi led']
+
+# Writes last: accepting needs pending reservations, creating adds some.
+SCENARIOS = (
+    'browse_tubs', 'tub_detail', 'availability', 'free_tubs', 'search',
+    'create_reservation', 'pending_reservations', 'accept_reservation', 'rate_tub',
+)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def disposable_copy(suffix='bench'):
+    """
+    Point the default connection at a copy of its database, cloned the way
+    the parallel test runner clones one, and drop the copy on the way out.
+    Cache keys get a per-run prefix meanwhile: stamps advanced in the copy
+    must never name entries that readers of the real database look up.
+    """
+    creation = connection.creation
+    name = connection.settings_dict['NAME']
+    connection.close()
+    creation.clone_test_db(suffix, verbosity=0)
+    connection.settings_dict['NAME'] = creation.get_test_db_clone_settings(suffix)['NAME']
+    prefix = f'bench-{uuid4().hex[:8]}:'
+    caches = {alias: {**config, 'KEY_PREFIX': prefix + config.get('KEY_PREFIX', '')} for alias, config in settings.CACHES.items()}
+    try:
+        with override_settings(CACHES=caches):
+            yield
+    finally:
+        connection.settings_dict['NAME'] = name
+        creation.destroy_test_db(name, verbosity=0, suffix=suffix)
+
+
+def _summary(latencies, queries, errors, elapsed):
+    def percentile(p):
+        if len(latencies) < 2:
+            return round(latencies[0] * 1000, 1) if latencies else None
+        return round(statistics.quantiles(latencies, n=100, method='inclusive')[p - 1] * 1000, 1)
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+        'queries_mean': round(statistics.mean(queries), 2) if queries else None,
+        'queries_max': max(queries, default=None),
+    }
+
+
+class Benchmark:
+    """
+    The main API flows as scenarios: every ``scenario_<name>(i)`` returns
+    ``(method, path, data, user, expected status)`` for its i-th request.
+    """
+
+    def __init__(self, rng, sample_size):
+        self.rng = rng
+        self.today = timezone.localdate()
+        tub_ids = list(Tub.objects.order_by('id').values_list('id', flat=True))
+        users = list(CustomUser.objects.filter(is_manager=False, is_superuser=False).order_by('id')[:sample_size * 10])
+        if not tub_ids or not users:
+            raise CommandError('The database has no tubs or users, run manage.py seed_data first')
+        self.tub_ids = rng.sample(tub_ids, min(sample_size, len(tub_ids)))
+        self.users = rng.sample(users, min(sample_size, len(users)))
+        self.manager = CustomUser.objects.create(username=f'bench-{uuid4().hex[:8]}', is_manager=True)
+        # New bookings go after every seeded one, so they only fail if the view does.
+        last_end = Reservation.objects.aggregate(last=Max('end_date'))['last'] or self.today
+        self.booking_start = max(last_end, self.today) + timedelta(days=1)
+        self.pending_ids = []
+
+    def prepare(self, name, count):
+        if name == 'accept_reservation':
+            self.pending_ids = list(
+                Reservation.objects.filter(status=Reservation.Status.PENDING, start_date__gte=self.today)
+                .order_by('start_date', 'id').values_list('id', flat=True)[:count]
+            )
+            if len(self.pending_ids) < count:
+                raise CommandError(f'accept_reservation needs {count} pending reservations, found {len(self.pending_ids)}')
+
+    def window(self, days):
+        start = self.today + timedelta(days=self.rng.randrange(0, 90))
+        return start.isoformat(), (start + timedelta(days=days - 1)).isoformat()
+
+    def scenario_browse_tubs(self, i):
+        return 'get', '/api/tubs/', BROWSE_QUERIES[i % len(BROWSE_QUERIES)], None, 200
+
+    def scenario_tub_detail(self, i):
+        return 'get', f'/api/tubs/{self.rng.choice(self.tub_ids)}/', None, None, 200
+
+    def scenario_availability(self, i):
+        start, end = self.window(14)
+        tubs = ','.join(str(pk) for pk in self.rng.sample(self.tub_ids, min(5, len(self.tub_ids))))
+        return 'get', '/api/availability/', {'tubs': tubs, 'from': start, 'to': end}, None, 200
+
+    def scenario_free_tubs(self, i):
+        start, end = self.window(7)
+        return 'get', '/api/tubs/', {'from': start, 'to': end}, None, 200
+
+    def scenario_search(self, i):
+        return 'get', '/api/search/', {'q': SEARCH_TERMS[i % len(SEARCH_TERMS)]}, None, 200
+
+    def scenario_create_reservation(self, i):
+        # Round robin over the tubs, a week apart per round: never overlapping.
+        start = self.booking_start + timedelta(days=7 * (i // len(self.tub_ids)))
+        data = {
+            'start_date': start.isoformat(),
+            'end_date': (start + timedelta(days=self.rng.randrange(0, 6))).isoformat(),
+            'city': 'Kraków', 'street': 'Długa', 'home_number': str(i),
+        }
+        return 'post', f'/api/tubs/{self.tub_ids[i % len(self.tub_ids)]}/create_reservation/', data, self.rng.choice(self.users), 201
+
+    def scenario_pending_reservations(self, i):
+        return 'get', '/api/reservations/pending_reservations/', None, self.manager, 200
+
+    def scenario_accept_reservation(self, i):
+        return 'patch', f'/api/reservations/{self.pending_ids[i]}/accept_reservation/', None, self.manager, 200
+
+    def scenario_rate_tub(self, i):
+        data = {'stars': self.rng.randint(1, 5)}
+        return 'post', f'/api/tubs/{self.rng.choice(self.tub_ids)}/create_rating/', data, self.rng.choice(self.users), 200
+
+
+class Command(BaseCommand):
+    help = (
+        'Drives the main API flows in-process against the configured database (seed it with seed_data) '
+        'and reports throughput, p50/p95/p99 latency and queries per request for each scenario. '
+        'The scenarios run against a copy of the database that is dropped afterwards, so their writes '
+        'really commit, on_commit hooks included, and every run starts from the same data; on PostgreSQL '
+        'nothing else may be connected to the database while it is copied. Baselines saved with --save can be compared '
+        'against with --compare; regressions make the command fail'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario')
+        parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per scenario')
+        parser.add_argument('--sample', type=int, default=200, help='Tubs and users the requests are spread over')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--save', help='Write the results as a baseline to this file')
+        parser.add_argument('--compare', help='Baseline file to compare against')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative p95 latency regression')
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenario(s): {", ".join(sorted(unknown))}')
+        if options['requests'] < 1 or options['warmup'] < 0:
+            raise CommandError('Requests must be positive and warmup cannot be negative')
+        baseline = self._load(options['compare']) if options['compare'] else None
+
+        dataset = {
+            'tubs': Tub.objects.count(),
+            'reservations': Reservation.objects.count(),
+            'ratings': Rating.objects.count(),
+            'discounts': Discount.objects.count(),
+            'users': CustomUser.objects.count(),
+        }
+        self.stdout.write('dataset: ' + ', '.join(f'{count} {kind}' for kind, count in dataset.items()))
+
+        results = {}
+        with disposable_copy():
+            bench = Benchmark(random.Random(options['seed']), options['sample'])
+            for name in names:
+                results[name] = self._run(bench, name, options['requests'], options['warmup'])
+                row = results[name]
+                self.stdout.write(
+                    f'{name:22} {row["rps"]:>8} req/s  p50={row["p50_ms"]}ms p95={row["p95_ms"]}ms p99={row["p99_ms"]}ms '
+                    f'queries={row["queries_mean"]} (max {row["queries_max"]}) errors={row["errors"]}'
+                )
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump({'dataset': dataset, 'options': {key: options[key] for key in ('requests', 'warmup', 'sample', 'seed')}, 'results': results}, f, indent=2)
+            self.stderr.write(f'Saved baseline to {options["save"]}')
+
+        if baseline is not None:
+            self._compare(baseline, dataset, results, options['tolerance'])
+
+    def _run(self, bench, name, requests, warmup):
+        bench.prepare(name, warmup + requests)
+        scenario = getattr(bench, f'scenario_{name}')
+        client = APIClient(HTTP_HOST='localhost')
+        latencies, queries, errors = [], [], 0
+
+        started = time.perf_counter()
+        for i in range(warmup + requests):
+            if i == warmup:
+                started = time.perf_counter()
+            method, path, data, user, expected = scenario(i)
+            client.force_authenticate(user)
+            counter = QueryCounter()
+            request_started = time.perf_counter()
+            with connection.execute_wrapper(counter):
+                response = getattr(client, method)(path, data, format='json' if method != 'get' else None)
+            latency = time.perf_counter() - request_started
+            if i < warmup:
+                continue
+            if response.status_code == expected:
+                latencies.append(latency)
+                queries.append(counter.count)
+            else:
+                errors += 1
+        return _summary(latencies, queries, errors, time.perf_counter() - started)
+
+    def _load(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Cannot read baseline {path}: {e}')
+
+    def _compare(self, baseline, dataset, results, tolerance):
+        if baseline.get('dataset') != dataset:
+            self.stderr.write(f'Warning: the baseline was measured on a different dataset: {baseline.get("dataset")}')
+
+        regressions = []
+        for name, row in results.items():
+            before = baseline['results'].get(name)
+            if before is None:
+                continue
+            self.stdout.write(
+                f'{name:22} rps {before["rps"]} -> {row["rps"]}  p95 {before["p95_ms"]} -> {row["p95_ms"]}ms  '
+                f'queries {before["queries_mean"]} -> {row["queries_mean"]}'
+            )
+            if row['errors'] > before['errors']:
+                regressions.append(f'{name}: {row["errors"]} errors, baseline {before["errors"]}')
+            if None in (row['p95_ms'], before['p95_ms']):
+                continue
+            # Sub-millisecond jitter is not a regression, however large relative to a fast endpoint.
+            if row['p95_ms'] > before['p95_ms'] + max(before['p95_ms'] * tolerance, MIN_P95_REGRESSION_MS):
+                regressions.append(f'{name}: p95 {row["p95_ms"]}ms, baseline {before["p95_ms"]}ms')
+            # Query counts do not depend on the machine; half a query per request is noise from upserts and cache misses.
+            if row['queries_mean'] > before['queries_mean'] + 0.5:
+                regressions.append(f'{name}: {row["queries_mean"]} queries per request, baseline {before["queries_mean"]}')
+
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
+        self.stdout.write('No regressions against the baseline')
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from base.seeding import seed
+
+
+class Command(BaseCommand):
+    help = (
+        'Adds a synthetic catalogue and booking history to the configured database through bulk inserts: '
+        'users, tubs with images, reservations with addresses and day index rows, ratings and discount codes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tubs', type=int, default=2000)
+        parser.add_argument('--images-per-tub', type=int, default=3)
+        parser.add_argument('--users', type=int, default=5000)
+        parser.add_argument('--reservations', type=int, default=200000)
+        parser.add_argument('--ratings', type=int, default=50000)
+        parser.add_argument('--discounts', type=int, default=10000)
+        parser.add_argument('--seed', type=int, help='Random seed, for the same dataset on every run')
+
+    def handle(self, *args, **options):
+        if options['tubs'] < 1 or options['users'] < 1:
+            raise CommandError('At least one tub and one user are needed')
+        if min(options[key] for key in ('images_per_tub', 'reservations', 'ratings', 'discounts')) < 0:
+            raise CommandError('Counts cannot be negative')
+
+        started = time.perf_counter()
+        created = seed(
+            tubs=options['tubs'],
+            images_per_tub=options['images_per_tub'],
+            users=options['users'],
+            reservations=options['reservations'],
+            ratings=options['ratings'],
+            discounts=options['discounts'],
+            random_seed=options['seed'],
+            log=self.stderr.write,
+        )
+        summary = ', '.join(f'{count} {kind}' for kind, count in created.items())
+        self.stdout.write(f'Created {summary} in {time.perf_counter() - started:.1f}s')
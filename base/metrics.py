@@ -0,0 +1,271 @@
+"""
+Per-route request metrics: latency histogram, SQL query count and time and
+response size, exposed in the Prometheus text format.
+
+Every thread records into its own shard, a plain dict no other thread
+writes to, so requests never contend on a lock. Readers merge the shards.
+Under multi-process gunicorn a background thread in each worker writes a
+merged snapshot to ``METRICS_DIR`` every ``METRICS_FLUSH_INTERVAL`` seconds,
+off the request path; ``/metrics`` adds up the snapshots of all workers,
+including the ones gunicorn has already recycled (see ``retire_worker``),
+so counters never go backwards.
+"""
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.decorators import sync_and_async_middleware
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Layout of a series: count, latency sum, SQL queries, SQL seconds, response bytes, then one count per bucket.
+COUNT, LATENCY, QUERIES, SQL_SECONDS, RESPONSE_BYTES = range(5)
+SERIES_LENGTH = 5 + len(LATENCY_BUCKETS)
+
+RETIRED_SNAPSHOT = 'retired.json'
+
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()
+_flusher_pid = None
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('started', 'queries', 'sql_seconds')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+
+
+def _record_sql(execute, sql, params, many, context):
+    # The context variable follows the request into sync_to_async threads, the connection does not.
+    current = _current.get()
+    if current is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        current.queries += 1
+        current.sql_seconds += time.perf_counter() - started
+
+
+def _install_sql_wrapper(sender=None, connection=None, **kwargs):
+    if _record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_sql)
+
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = {}
+        # Once per thread; shards of finished threads stay so their counts are kept.
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+
+def record(route, method, status, seconds, metrics, size):
+    shard = _shard()
+    series = shard.get((route, method, status))
+    if series is None:
+        series = shard[(route, method, status)] = [0] * SERIES_LENGTH
+    series[COUNT] += 1
+    series[LATENCY] += seconds
+    series[QUERIES] += metrics.queries
+    series[SQL_SECONDS] += metrics.sql_seconds
+    series[RESPONSE_BYTES] += size
+    for index, bound in enumerate(LATENCY_BUCKETS):
+        if seconds <= bound:
+            series[5 + index] += 1
+            break
+
+
+def _merge(into, snapshot):
+    for key, values in snapshot.items():
+        series = into.setdefault(key, [0] * SERIES_LENGTH)
+        for index, value in enumerate(values):
+            series[index] += value
+    return into
+
+
+def process_snapshot():
+    """Merge this process' shards; dict.copy() and list() are atomic, writers are never stopped."""
+    with _shards_lock:
+        shards = list(_shards)
+    merged = {}
+    for shard in shards:
+        _merge(merged, {key: list(values) for key, values in shard.copy().items()})
+    return merged
+
+
+def _write(path, snapshot):
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump([[*key, values] for key, values in snapshot.items()], f)
+    os.replace(f'{path}.tmp', path)
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return {tuple(row[:3]): row[3] for row in json.load(f)}
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def flush():
+    """Write this worker's snapshot for the other workers' ``/metrics`` to read."""
+    if settings.METRICS_DIR:
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        _write(os.path.join(settings.METRICS_DIR, f'{os.getpid()}.json'), process_snapshot())
+
+
+def _flush_loop():
+    while True:
+        time.sleep(settings.METRICS_FLUSH_INTERVAL)
+        flush()
+
+
+def _ensure_flusher():
+    # Started lazily in each worker: a thread started in gunicorn's master would not survive the fork.
+    global _flusher_pid
+    if not settings.METRICS_DIR or _flusher_pid == os.getpid():
+        return
+    with _shards_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True).start()
+
+
+def retire_worker(pid, directory):
+    """
+    Fold the snapshot of an exited worker into the retired totals. Called
+    from gunicorn's master, which may not have loaded Django, hence the
+    explicit ``directory``.
+    """
+    path = os.path.join(directory, f'{pid}.json')
+    snapshot = _read(path)
+    if snapshot:
+        retired = os.path.join(directory, RETIRED_SNAPSHOT)
+        _write(retired, _merge(_read(retired), snapshot))
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def clear_snapshots(directory):
+    """Drop every snapshot, counters start again from zero (a new gunicorn master)."""
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.endswith(('.json', '.tmp')):
+                os.remove(os.path.join(directory, name))
+
+
+def collect():
+    """Totals over every worker: their last snapshots, the retired ones and this process live."""
+    merged = {}
+    own = f'{os.getpid()}.json'
+    if settings.METRICS_DIR and os.path.isdir(settings.METRICS_DIR):
+        for name in os.listdir(settings.METRICS_DIR):
+            if name.endswith('.json') and name != own:
+                _merge(merged, _read(os.path.join(settings.METRICS_DIR, name)))
+    return _merge(merged, process_snapshot())
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(snapshot):
+    samples = {
+        'http_requests_total': ('counter', 'Requests served.', []),
+        'http_request_duration_seconds': ('histogram', 'Time spent in the view and middleware, streaming excluded.', []),
+        'db_queries_total': ('counter', 'SQL statements executed while serving requests.', []),
+        'db_query_duration_seconds_total': ('counter', 'Time spent in SQL statements while serving requests.', []),
+        'http_response_size_bytes_total': ('counter', 'Response body bytes, streaming responses excluded.', []),
+    }
+    for (route, method, status), series in sorted(snapshot.items()):
+        labels = f'route="{_label(route)}",method="{_label(method)}",status="{_label(status)}"'
+        samples['http_requests_total'][2].append(f'http_requests_total{{{labels}}} {series[COUNT]}')
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, series[5:]):
+            cumulative += count
+            samples['http_request_duration_seconds'][2].append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        samples['http_request_duration_seconds'][2].extend([
+            f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {series[COUNT]}',
+            f'http_request_duration_seconds_sum{{{labels}}} {series[LATENCY]:.6f}',
+            f'http_request_duration_seconds_count{{{labels}}} {series[COUNT]}',
+        ])
+        samples['db_queries_total'][2].append(f'db_queries_total{{{labels}}} {series[QUERIES]}')
+        samples['db_query_duration_seconds_total'][2].append(f'db_query_duration_seconds_total{{{labels}}} {series[SQL_SECONDS]:.6f}')
+        samples['http_response_size_bytes_total'][2].append(f'http_response_size_bytes_total{{{labels}}} {series[RESPONSE_BYTES]}')
+
+    lines = []
+    for name, (kind, description, values) in samples.items():
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}', *values]
+    return '\n'.join(lines) + '\n'
+
+
+def _route(request):
+    # The URL pattern, not the path, keeps the label count bounded; router patterns are regexes.
+    match = getattr(request, 'resolver_match', None)
+    return match.route.replace('^', '').replace('$', '') if match is not None else 'unmatched'
+
+
+def _start():
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def _finish(request, response, metrics, token):
+    _current.reset(token)
+    finished = time.perf_counter()
+    seconds = finished - metrics.started
+    size = 0 if response.streaming else len(response.content)
+    record(_route(request), request.method, response.status_code, seconds, metrics, size)
+
+    if settings.METRICS_SERVER_TIMING:
+        response['Server-Timing'] = (
+            f'app;dur={seconds * 1000:.1f}, '
+            f'db;dur={metrics.sql_seconds * 1000:.1f};desc="{metrics.queries} queries"'
+        )
+    _ensure_flusher()
+    return response
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    connection_created.connect(_install_sql_wrapper)
+    for connection in connections.all(initialized_only=True):
+        _install_sql_wrapper(connection=connection)
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            metrics, token = _start()
+            try:
+                response = await get_response(request)
+            except BaseException:
+                _current.reset(token)
+                raise
+            return _finish(request, response, metrics, token)
+    else:
+        def middleware(request):
+            metrics, token = _start()
+            try:
+                response = get_response(request)
+            except BaseException:
+                _current.reset(token)
+                raise
+            return _finish(request, response, metrics, token)
+    return middleware
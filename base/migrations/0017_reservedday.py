@@ -0,0 +1,53 @@
+# Generated by Django 5.0.6 on 2026-10-18 08:35
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_reserved_days(apps, schema_editor):
+    Reservation = apps.get_model('base', 'Reservation')
+    ReservedDay = apps.get_model('base', 'ReservedDay')
+
+    batch = []
+    reservations = Reservation.objects.filter(tub__isnull=False, start_date__isnull=False, end_date__isnull=False)
+    for reservation in reservations.iterator(chunk_size=2000):
+        day = reservation.start_date
+        while day <= reservation.end_date:
+            batch.append(ReservedDay(
+                tub_id=reservation.tub_id,
+                reservation_id=reservation.pk,
+                day=day,
+                accepted=bool(reservation.accepted_status),
+            ))
+            day += timedelta(days=1)
+        if len(batch) >= 5000:
+            ReservedDay.objects.bulk_create(batch)
+            batch = []
+    ReservedDay.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0016_alter_tub_price_per_week'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservedDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('accepted', models.BooleanField(default=False)),
+                ('reservation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reserved_days', to='base.reservation')),
+                ('tub', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='reserved_days', to='base.tub')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['tub', 'day'], name='reservedday_tub_day_idx')],
+                'unique_together': {('reservation', 'day')},
+            },
+        ),
+        migrations.RunPython(backfill_reserved_days, migrations.RunPython.noop),
+    ]
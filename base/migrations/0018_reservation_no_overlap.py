@@ -0,0 +1,94 @@
+from datetime import timedelta
+
+from django.db import migrations
+from django.db.models import F
+
+
+# Overlapping pairs listed when the constraint cannot be added.
+MAX_REPORTED_OVERLAPS = 20
+
+
+def swap_inverted_dates(apps, schema_editor):
+    # daterange() rejects end < start; these are typos, the day index (0017) holds no days for them.
+    Reservation = apps.get_model('base', 'Reservation')
+    ReservedDay = apps.get_model('base', 'ReservedDay')
+
+    inverted = list(Reservation.objects.filter(end_date__lt=F('start_date')))
+    if not inverted:
+        return
+    print(f'\n  Swapped start and end date of reservations {", ".join(str(r.pk) for r in inverted)}', end='')
+
+    days = []
+    for reservation in inverted:
+        reservation.start_date, reservation.end_date = reservation.end_date, reservation.start_date
+        reservation.save(update_fields=['start_date', 'end_date'])
+        if reservation.tub_id is None:
+            continue
+        day = reservation.start_date
+        while day <= reservation.end_date:
+            days.append(ReservedDay(tub_id=reservation.tub_id, reservation_id=reservation.pk, day=day, accepted=bool(reservation.accepted_status)))
+            day += timedelta(days=1)
+    ReservedDay.objects.bulk_create(days)
+
+
+def overlapping_reservations(connection):
+    """Return ``[(id, other_id, tub_id)]`` of reservations sharing a day of the same tub, lower id first."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT a.id, b.id, a.tub_id FROM base_reservation a '
+            'JOIN base_reservation b ON b.tub_id = a.tub_id AND b.id > a.id '
+            'AND b.start_date <= a.end_date AND b.end_date >= a.start_date '
+            'ORDER BY a.id, b.id'
+        )
+        return cursor.fetchall()
+
+
+def check_no_overlaps(apps, schema_editor):
+    # Two bookings of one tub on one day cannot both be kept automatically: report them and stop.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    pairs = overlapping_reservations(schema_editor.connection)
+    if pairs:
+        listed = ', '.join(f'{pk} and {other} (tub {tub_id})' for pk, other, tub_id in pairs[:MAX_REPORTED_OVERLAPS])
+        more = f' and {len(pairs) - MAX_REPORTED_OVERLAPS} more' if len(pairs) > MAX_REPORTED_OVERLAPS else ''
+        raise RuntimeError(
+            f'{len(pairs)} pairs of reservations overlap and would violate reservation_no_overlap: {listed}{more}. '
+            'Move or delete one reservation of each pair, then migrate again.'
+        )
+
+
+def add_no_overlap_constraint(apps, schema_editor):
+    # Only PostgreSQL has range types and exclusion constraints; other backends
+    # fall back to locking in base.availability.book_tub().
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    schema_editor.execute(
+        "ALTER TABLE base_reservation ADD COLUMN period daterange "
+        "GENERATED ALWAYS AS (daterange(start_date, end_date, '[]')) STORED"
+    )
+    schema_editor.execute(
+        'ALTER TABLE base_reservation ADD CONSTRAINT reservation_no_overlap '
+        'EXCLUDE USING gist (tub_id WITH =, period WITH &&) '
+        'WHERE (tub_id IS NOT NULL AND start_date IS NOT NULL AND end_date IS NOT NULL)'
+    )
+
+
+def remove_no_overlap_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('ALTER TABLE base_reservation DROP CONSTRAINT IF EXISTS reservation_no_overlap')
+    schema_editor.execute('ALTER TABLE base_reservation DROP COLUMN IF EXISTS period')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0017_reservedday'),
+    ]
+
+    operations = [
+        migrations.RunPython(swap_inverted_dates, migrations.RunPython.noop),
+        migrations.RunPython(check_no_overlaps, migrations.RunPython.noop),
+        migrations.RunPython(add_no_overlap_constraint, remove_no_overlap_constraint),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.0.6 on 2026-10-18 08:37
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Tub = apps.get_model('base', 'Tub')
+    aggregates = {
+        'rating_count': Count('ratings'),
+        'rating_sum': Sum('ratings__stars', default=0),
+        **{f'stars_{n}': Count('ratings', filter=Q(ratings__stars=n)) for n in range(1, 6)},
+    }
+    for tub in Tub.objects.annotate(**{f'agg_{k}': v for k, v in aggregates.items()}):
+        Tub.objects.filter(pk=tub.pk).update(**{k: getattr(tub, f'agg_{k}') for k in aggregates})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0018_reservation_no_overlap'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tub',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tub',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tub',
+            name='stars_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tub',
+            name='stars_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tub',
+            name='stars_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tub',
+            name='stars_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tub',
+            name='stars_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
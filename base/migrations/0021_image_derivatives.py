@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-18 08:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0020_resourceversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='tub',
+            name='logo_derivatives',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.6 on 2026-10-18 08:56
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def rename_duplicate_codes(apps, schema_editor):
+    # The oldest discount keeps its code, later copies get a ~<id> suffix so the unique index can be built.
+    Discount = apps.get_model('base', 'Discount')
+    duplicated = Discount.objects.values('main').annotate(n=Count('id')).filter(n__gt=1).values_list('main', flat=True)
+    for main in list(duplicated):
+        for discount in Discount.objects.filter(main=main).order_by('id')[1:]:
+            suffix = f'~{discount.pk}'
+            Discount.objects.filter(pk=discount.pk).update(main=f'{main[:15 - len(suffix)]}{suffix}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0021_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_duplicate_codes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='discount',
+            name='main',
+            field=models.CharField(max_length=15, unique=True),
+        ),
+    ]
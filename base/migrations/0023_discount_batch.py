@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 08:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0022_discount_main_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='discount',
+            name='batch',
+            field=models.CharField(blank=True, db_index=True, max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0023_discount_batch'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tub',
+            name='rating_average',
+            field=models.GeneratedField(db_persist=True, expression=Coalesce(Cast('rating_sum', models.FloatField()) / NullIf('rating_count', 0), 0.0), output_field=models.FloatField()),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['tub', 'start_date', 'end_date'], name='reservation_tub_dates_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tub',
+            index=models.Index(fields=['price_per_day', 'id'], name='tub_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tub',
+            index=models.Index(fields=['rating_average', 'id'], name='tub_rating_idx'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+from django.db import migrations
+
+
+# Tables indexed for base.search, columns from the highest search weight down.
+# On SQLite a later migration that rebuilds one of these tables drops its
+# triggers with it; such a migration has to create them again (the base.E002
+# system check reports missing ones).
+SEARCH_TABLES = [
+    ('base_tub', ['name', 'description']),
+    ('base_faq', ['question', 'answer']),
+]
+WEIGHTS = 'ABCD'
+
+
+def add_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, columns in SEARCH_TABLES:
+        if vendor == 'postgresql':
+            # A generated column needs no trigger: PostgreSQL recomputes it on every write.
+            vector = ' || '.join(
+                f"setweight(to_tsvector('simple', coalesce({column}, '')), '{weight}')"
+                for column, weight in zip(columns, WEIGHTS)
+            )
+            schema_editor.execute(f'ALTER TABLE {table} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({vector}) STORED')
+            schema_editor.execute(f'CREATE INDEX {table}_search_idx ON {table} USING gin (search_vector)')
+        elif vendor == 'sqlite':
+            # External content FTS5 table: holds only the index, the text stays in the model table.
+            fts = f'{table}_fts'
+            names = ', '.join(columns)
+            new_values = ', '.join(f'new.{column}' for column in columns)
+            old_values = ', '.join(f'old.{column}' for column in columns)
+            schema_editor.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5({names}, content='{table}', content_rowid='id')")
+            schema_editor.execute(
+                f'CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN '
+                f'INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new_values}); END'
+            )
+            schema_editor.execute(
+                f'CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN '
+                f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old_values}); END"
+            )
+            schema_editor.execute(
+                f'CREATE TRIGGER {fts}_au AFTER UPDATE OF {names} ON {table} BEGIN '
+                f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old_values}); "
+                f'INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new_values}); END'
+            )
+            schema_editor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def remove_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, _ in SEARCH_TABLES:
+        if vendor == 'postgresql':
+            schema_editor.execute(f'DROP INDEX IF EXISTS {table}_search_idx')
+            schema_editor.execute(f'ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector')
+        elif vendor == 'sqlite':
+            for suffix in ('ai', 'ad', 'au'):
+                schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_fts_{suffix}')
+            schema_editor.execute(f'DROP TABLE IF EXISTS {table}_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0024_tub_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_index, remove_search_index),
+    ]
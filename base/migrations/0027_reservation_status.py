@@ -0,0 +1,79 @@
+from django.db import migrations, models
+
+
+def status_from_flags(apps, schema_editor):
+    Reservation = apps.get_model('base', 'Reservation')
+    # Everything not accepted was still waiting for the owner: the flags had no other outcome.
+    Reservation.objects.filter(accepted_status=True).update(status='accepted')
+
+
+def flags_from_status(apps, schema_editor):
+    Reservation = apps.get_model('base', 'Reservation')
+    Reservation.objects.filter(status='accepted').update(accepted_status=True, wait_status=False)
+    Reservation.objects.filter(status='pending').update(accepted_status=False, wait_status=True)
+    Reservation.objects.exclude(status__in=['pending', 'accepted']).update(accepted_status=False, wait_status=False)
+
+
+def only_active_overlaps(apps, schema_editor):
+    # Rejected, cancelled and expired reservations no longer block their dates.
+    _replace_no_overlap_constraint(schema_editor, "AND status IN ('pending', 'accepted')")
+
+
+def any_overlaps(apps, schema_editor):
+    _replace_no_overlap_constraint(schema_editor, '')
+
+
+def _replace_no_overlap_constraint(schema_editor, condition):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('ALTER TABLE base_reservation DROP CONSTRAINT IF EXISTS reservation_no_overlap')
+    schema_editor.execute(
+        'ALTER TABLE base_reservation ADD CONSTRAINT reservation_no_overlap '
+        'EXCLUDE USING gist (tub_id WITH =, period WITH &&) '
+        f'WHERE (tub_id IS NOT NULL AND start_date IS NOT NULL AND end_date IS NOT NULL {condition})'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0026_reservation_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('accepted', 'Accepted'), ('rejected', 'Rejected'), ('cancelled', 'Cancelled'), ('expired', 'Expired')], default='pending', max_length=9),
+        ),
+        migrations.RunPython(status_from_flags, flags_from_status),
+        migrations.RunPython(only_active_overlaps, any_overlaps),
+        migrations.RemoveIndex(
+            model_name='reservation',
+            name='reservation_accepted_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='reservation',
+            name='reservation_pending_idx',
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['status', 'start_date', 'id'], name='reservation_status_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['start_date', 'id'], name='reservation_pending_idx'),
+        ),
+        migrations.RemoveField(
+            model_name='reservation',
+            name='nobody_status',
+        ),
+        migrations.RemoveField(
+            model_name='reservation',
+            name='wait_status',
+        ),
+        migrations.RemoveField(
+            model_name='reservation',
+            name='accepted_status',
+        ),
+    ]
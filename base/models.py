@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Cast, Coalesce, NullIf
 from django.core.validators import MaxValueValidator, MinValueValidator
 from custom_auth.models import CustomUser
 
@@ -8,26 +9,85 @@ class Tub(models.Model):
     price_per_day = models.DecimalField(max_digits=10, decimal_places=2)
     price_per_week = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     logo_img = models.ImageField(upload_to='logo_tub/', null=True)
+    logo_derivatives = models.JSONField(default=dict, blank=True)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
+    # Kept by the database from the aggregates above so rating filters and sorts can use an index;
+    # unrated tubs count as 0 so the column is never NULL and sorts both ways on the same index.
+    rating_average = models.GeneratedField(
+        expression=Coalesce(Cast('rating_sum', models.FloatField()) / NullIf('rating_count', 0), 0.0),
+        output_field=models.FloatField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['price_per_day', 'id'], name='tub_price_idx'),
+            models.Index(fields=['rating_average', 'id'], name='tub_rating_idx'),
+        ]
     
     def __str__(self) -> str:
         return self.name
 
 
 class Reservation(models.Model):
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        ACCEPTED = 'accepted', 'Accepted'
+        REJECTED = 'rejected', 'Rejected'
+        CANCELLED = 'cancelled', 'Cancelled'
+        EXPIRED = 'expired', 'Expired'
+
+    # Statuses that hold the tub's days; the others free them again.
+    ACTIVE_STATUSES = (Status.PENDING, Status.ACCEPTED)
+
     tub = models.ForeignKey(Tub, on_delete=models.CASCADE, related_name='reservations', null=True, blank=True)
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='user_reservations', null=True, blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
     start_date = models.DateField(null=True, blank=True)
     end_date = models.DateField(null=True, blank=True)
     counted_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
-    nobody_status = models.BooleanField(default=True, null=True, blank=True)
-    wait_status = models.BooleanField(default=False, null=True, blank=True)
-    accepted_status = models.BooleanField(default=False, null=True, blank=True)
+    status = models.CharField(max_length=9, choices=Status.choices, default=Status.PENDING)
+
+    class Meta:
+        # Listings page on (start_date, id), see ReservationPagination.
+        indexes = [
+            models.Index(fields=['tub', 'start_date', 'end_date'], name='reservation_tub_dates_idx'),
+            models.Index(fields=['start_date', 'id'], name='reservation_start_idx'),
+            models.Index(fields=['user', 'start_date', 'id'], name='reservation_user_start_idx'),
+            models.Index(fields=['status', 'start_date', 'id'], name='reservation_status_start_idx'),
+            models.Index(fields=['start_date', 'id'], condition=models.Q(status='pending'), name='reservation_pending_idx'),
+        ]
+
+    # Read-only views of the booleans ``status`` replaced, kept for API clients.
+    @property
+    def wait_status(self):
+        return self.status == self.Status.PENDING
+
+    @property
+    def accepted_status(self):
+        return self.status == self.Status.ACCEPTED
     
     def __str__(self) -> str:
         return f'Reservation by {self.user} on {self.tub.name}'
 
 
+class ReservedDay(models.Model):
+    tub = models.ForeignKey(Tub, on_delete=models.CASCADE, related_name='reserved_days', db_index=False)
+    reservation = models.ForeignKey(Reservation, on_delete=models.CASCADE, related_name='reserved_days')
+    day = models.DateField()
+    accepted = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = (('reservation', 'day'))
+        indexes = [models.Index(fields=['tub', 'day'], name='reservedday_tub_day_idx')]
+
+
 class Address(models.Model):
     reservation = models.ForeignKey(Reservation, on_delete=models.CASCADE, related_name='address_to_reservation')
     city = models.CharField(max_length=100)
@@ -38,6 +98,7 @@ class Address(models.Model):
 class Image(models.Model):
     tub = models.ForeignKey(Tub, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='images/')
+    derivatives = models.JSONField(default=dict, blank=True)
 
 
 class Rating(models.Model):
@@ -53,11 +114,12 @@ class Rating(models.Model):
 
 class Discount(models.Model):
     tub = models.ForeignKey(Tub, on_delete=models.CASCADE, null=True, related_name = 'tube_discount')
-    main = models.CharField(max_length=15)
+    main = models.CharField(max_length=15, unique=True)
     active = models.BooleanField(default=False)
     used = models.BooleanField(default=False)
     is_multi_use = models.BooleanField(default=False)
     value = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(100)], null=True)
+    batch = models.CharField(max_length=32, null=True, blank=True, db_index=True)
     
     def __str__(self) -> str:
          return f'{self.main} for {self.tub.name if self.tub else "any tub"}'
@@ -71,4 +133,12 @@ class Faq(models.Model):
     is_published = models.BooleanField(default=False)
     
     def __str__(self):
-        return self.question if self.question else "FAQ without question"
\ No newline at end of file
+        return self.question if self.question else "FAQ without question"
+
+class ResourceVersion(models.Model):
+    key = models.CharField(max_length=64, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    def __str__(self) -> str:
+        return f'{self.key} v{self.version}'
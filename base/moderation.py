@@ -0,0 +1,146 @@
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from .models import Reservation, ReservedDay
+
+
+BULK_MAX_RESERVATIONS = 1000
+
+RESERVATION_STATUS_FILTERS = {
+    'all': {},
+    **{value: {'status': value} for value in Reservation.Status.values},
+}
+
+# target status -> statuses it may be reached from.
+RESERVATION_TRANSITIONS = {
+    Reservation.Status.ACCEPTED: (Reservation.Status.PENDING,),
+    Reservation.Status.REJECTED: (Reservation.Status.PENDING,),
+    Reservation.Status.CANCELLED: (Reservation.Status.PENDING,),
+    Reservation.Status.EXPIRED: (Reservation.Status.PENDING,),
+}
+
+
+class InvalidTransition(Exception):
+    def __init__(self, current):
+        super().__init__(current)
+        self.current = current
+
+
+def filter_reservations(queryset, params):
+    """
+    Narrow ``queryset`` by ``status`` (all or one of Reservation.Status), ``tub`` and a
+    ``from``/``to`` window that keeps reservations overlapping it. Raises
+    ValueError with a client message on bad input.
+    """
+    try:
+        start_date = parse_date(str(params.get('from') or ''))
+        end_date = parse_date(str(params.get('to') or ''))
+    except ValueError:
+        raise ValueError('Dates must be YYYY-MM-DD')
+    if start_date:
+        queryset = queryset.filter(end_date__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(start_date__lte=end_date)
+
+    if params.get('tub') not in (None, ''):
+        try:
+            queryset = queryset.filter(tub_id=int(params['tub']))
+        except (TypeError, ValueError):
+            raise ValueError('Tub must be an id')
+
+    reservation_status = params.get('status', 'all')
+    if reservation_status not in RESERVATION_STATUS_FILTERS:
+        raise ValueError(f'Status must be one of: {", ".join(RESERVATION_STATUS_FILTERS)}')
+    return queryset.filter(**RESERVATION_STATUS_FILTERS[reservation_status])
+
+
+def _outcomes(requested_ids, found, done, done_outcome, skipped_outcome):
+    ids = requested_ids if requested_ids is not None else sorted(found)
+    return [
+        {'id': pk, 'outcome': done_outcome if pk in done else skipped_outcome if pk in found else 'not_found'}
+        for pk in ids
+    ]
+
+
+def _sync_days(ids, status):
+    # update() sends no post_save, so the day index follows the new status here.
+    if status in Reservation.ACTIVE_STATUSES:
+        ReservedDay.objects.filter(reservation_id__in=ids).update(accepted=status == Reservation.Status.ACCEPTED)
+    else:
+        ReservedDay.objects.filter(reservation_id__in=ids).delete()
+
+
+def transition_reservation(pk, status):
+    """
+    Move one reservation to ``status`` with a single conditional
+    ``UPDATE ... WHERE status IN (allowed sources)``, so of two concurrent
+    moderators only the first wins. Returns False if there is no such
+    reservation, raises InvalidTransition if it is no longer in a source status.
+    """
+    with transaction.atomic():
+        moved = Reservation.objects.filter(pk=pk, status__in=RESERVATION_TRANSITIONS[status]).update(status=status)
+        if moved:
+            _sync_days([pk], status)
+            return True
+
+    current = Reservation.objects.filter(pk=pk).values_list('status', flat=True).first()
+    if current is None:
+        return False
+    raise InvalidTransition(current)
+
+
+def transition_reservations(status, ids=None, queryset=None):
+    """
+    Move the reservations with the given ids, or the first
+    ``BULK_MAX_RESERVATIONS`` rows of ``queryset`` by id, to ``status`` with
+    one locking SELECT and one conditional UPDATE.
+    Returns ``[{'id': ..., 'outcome': status | 'already_<status>' | 'not_found'}]``;
+    rows already past pending report the status they are in.
+    """
+    sources = RESERVATION_TRANSITIONS[status]
+    with transaction.atomic():
+        rows = queryset if ids is None else Reservation.objects.filter(pk__in=ids)
+        found = dict(rows.select_for_update().order_by('pk').values_list('pk', 'status')[:BULK_MAX_RESERVATIONS])
+        movable = [pk for pk, current in found.items() if current in sources]
+        if movable:
+            Reservation.objects.filter(pk__in=movable, status__in=sources).update(status=status)
+            _sync_days(movable, status)
+
+    ids = ids if ids is not None else sorted(found)
+    moved = set(movable)
+    return [
+        {'id': pk, 'outcome': status if pk in moved else f'already_{found[pk]}' if pk in found else 'not_found'}
+        for pk in ids
+    ]
+
+
+def accept_reservations(ids=None, queryset=None):
+    return transition_reservations(Reservation.Status.ACCEPTED, ids, queryset)
+
+
+def expire_reservations(today):
+    """Expire pending reservations that start before ``today``, in bulk batches; returns how many."""
+    expired = 0
+    while True:
+        results = transition_reservations(
+            Reservation.Status.EXPIRED,
+            queryset=Reservation.objects.filter(status=Reservation.Status.PENDING, start_date__lt=today),
+        )
+        expired += sum(result['outcome'] == Reservation.Status.EXPIRED for result in results)
+        if len(results) < BULK_MAX_RESERVATIONS:
+            return expired
+
+
+def delete_reservations(ids=None, queryset=None):
+    """
+    Delete the reservations with the given ids, or the first
+    ``BULK_MAX_RESERVATIONS`` rows of ``queryset`` by id; addresses and day
+    index rows go with them in bulk.
+    Returns ``[{'id': ..., 'outcome': 'deleted' | 'not_found'}]``.
+    """
+    with transaction.atomic():
+        rows = queryset if ids is None else Reservation.objects.filter(pk__in=ids)
+        found = set(rows.select_for_update().order_by('pk').values_list('pk', flat=True)[:BULK_MAX_RESERVATIONS])
+        if found:
+            Reservation.objects.filter(pk__in=found).only('pk').delete()
+    return _outcomes(ids, found, found, 'deleted', 'deleted')
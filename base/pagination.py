@@ -0,0 +1,166 @@
+import json
+from base64 import b64decode, b64encode
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+from .filters import tub_ordering
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over a composite ordering such as ``('start_date', 'id')``.
+
+    DRF's CursorPagination positions on the first ordering field only and
+    skips ties with an OFFSET. Here the cursor carries a value for every
+    ordering field, so each page is a ``WHERE (a, b) > (x, y) ... LIMIT n``
+    range scan on a matching index and no ``COUNT(*)`` is ever issued.
+    The last ordering field must be unique; nullable fields sort last.
+    """
+    ordering = ('id',)
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page(list(queryset))
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """
+        Return the unevaluated queryset for the requested page, or None when
+        pagination is disabled. Pair with ``set_page()`` once it is fetched.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.fields = [
+            (name.lstrip('-'), name.startswith('-'), queryset.model._meta.get_field(name.lstrip('-')).null)
+            for name in self.ordering
+        ]
+        self.cursor = self.decode_cursor(request)
+
+        reverse = self.cursor is not None and self.cursor.reverse
+        queryset = queryset.order_by(*self._order_by(reverse))
+        if self.cursor is not None:
+            try:
+                queryset = queryset.filter(self._after(self.cursor.position, reverse))
+            except (DjangoValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        has_more = len(rows) > self.page_size
+        self.page = list(rows[:self.page_size])
+        if self.cursor is not None and self.cursor.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+        return self.page
+
+    def _order_by(self, reverse):
+        order_by = []
+        for name, descending, nullable in self.fields:
+            descending = descending != reverse
+            if not nullable:
+                order_by.append(f'-{name}' if descending else name)
+            elif reverse:
+                order_by.append(F(name).desc(nulls_first=True) if descending else F(name).asc(nulls_first=True))
+            else:
+                order_by.append(F(name).desc(nulls_last=True) if descending else F(name).asc(nulls_last=True))
+        return order_by
+
+    def _after(self, position, reverse):
+        """
+        Build the lexicographic "comes after ``position``" condition,
+        ``a > x OR (a = x AND (b > y OR ...))``, in traversal order.
+        """
+        condition = None
+        for (name, descending, nullable), value in reversed(list(zip(self.fields, position))):
+            descending = descending != reverse
+            nulls_last = not reverse
+            if value is None:
+                after = Q(pk__in=[]) if nulls_last else Q(**{f'{name}__isnull': False})
+                equal = Q(**{f'{name}__isnull': True})
+            else:
+                after = Q(**{f'{name}__{"lt" if descending else "gt"}': value})
+                if nullable and nulls_last:
+                    after |= Q(**{f'{name}__isnull': True})
+                equal = Q(**{name: value})
+            condition = after if condition is None else after | (equal & condition)
+
+        name, descending, nullable = self.fields[0]
+        value = position[0]
+        if value is not None and not nullable:
+            # Redundant bound that lets the planner turn the OR into an index range scan.
+            descending = descending != reverse
+            condition = Q(**{f'{name}__{"lte" if descending else "gte"}': value}) & condition
+        return condition
+
+    def _position(self, instance):
+        position = []
+        for name, _, _ in self.fields:
+            value = getattr(instance, name)
+            position.append(value if value is None or isinstance(value, int) else str(value))
+        return position
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.page:
+            position = self._position(self.page[-1])
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.page:
+            position = self._position(self.page[0])
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            data = json.loads(b64decode(encoded.encode('ascii')).decode('ascii'))
+            position = data['p']
+            reverse = bool(data.get('r', False))
+        except (TypeError, ValueError, KeyError, AttributeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or len(position) != len(self.fields) \
+                or not all(value is None or isinstance(value, (str, int)) for value in position):
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(offset=0, reverse=reverse, position=position)
+
+    def encode_cursor(self, cursor):
+        data = {'p': cursor.position}
+        if cursor.reverse:
+            data['r'] = 1
+        encoded = b64encode(json.dumps(data, separators=(',', ':')).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+
+class ReservationPagination(KeysetPagination):
+    ordering = ('start_date', 'id')
+
+
+class TubPagination(KeysetPagination):
+    def get_ordering(self, request, queryset, view):
+        return tub_ordering(request.query_params)
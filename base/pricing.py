@@ -0,0 +1,164 @@
+import time
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.cache import cache
+
+from .models import Tub, Discount
+from .stamps import read_stamps
+
+
+WEEK = 7
+CENT = Decimal('0.01')
+RATES_TIMEOUT = 24 * 60 * 60
+# Cached rates are served without a query for this long, then checked against the tub's stamp.
+RATES_REVALIDATE = 30
+MAX_QUOTES = 500
+# Distinct discount codes per batch; a checkout tries one or two.
+MAX_QUOTE_CODES = 5
+
+Rates = namedtuple('Rates', ['per_day', 'per_week'])
+
+
+class DiscountUnavailable(Exception):
+    pass
+
+
+def _rates_key(tub_id):
+    return f'pricing:rates:{tub_id}'
+
+
+def rates_for(tub):
+    return Rates(tub.price_per_day, tub.price_per_week)
+
+
+def rate_tables(tub_ids):
+    """
+    Return ``{tub_id: Rates}`` for the given tubs. Cached rates carry the
+    tub's version stamp and are served as they are for ``RATES_REVALIDATE``
+    seconds; older ones cost one stamp query and are reloaded only if the
+    stamp moved. Tub writes also drop the entry once they commit, so a
+    quote racing a price change is wrong for at most that long. Misses are
+    loaded with one query. Unknown tubs are left out.
+    """
+    now = time.time()
+    cached = cache.get_many([_rates_key(tub_id) for tub_id in tub_ids])
+    tables = {}
+    stale = {}
+    for tub_id in tub_ids:
+        entry = cached.get(_rates_key(tub_id))
+        if entry is None:
+            stale[tub_id] = None
+        elif now - entry[3] < RATES_REVALIDATE:
+            tables[tub_id] = Rates(*entry[:2])
+        else:
+            stale[tub_id] = entry
+    if not stale:
+        return tables
+
+    # The stamp first: rates loaded after it are at least as new as the version stored with them.
+    versions, _ = read_stamps([f'tub:{tub_id}' for tub_id in stale])
+    entries = {}
+    missing = []
+    for tub_id, entry in stale.items():
+        version = versions[f'tub:{tub_id}']
+        if entry is not None and entry[2] == version:
+            tables[tub_id] = Rates(*entry[:2])
+            entries[_rates_key(tub_id)] = (*entry[:3], now)
+        else:
+            missing.append(tub_id)
+    if missing:
+        for pk, per_day, per_week in Tub.objects.filter(pk__in=missing).values_list('pk', 'price_per_day', 'price_per_week'):
+            tables[pk] = Rates(per_day, per_week)
+            entries[_rates_key(pk)] = (per_day, per_week, versions[f'tub:{pk}'], now)
+    cache.set_many(entries, RATES_TIMEOUT)
+    return tables
+
+
+def invalidate_rates(tub_id):
+    cache.delete(_rates_key(tub_id))
+
+
+def discount_error(discount, tub_id):
+    """Client message if ``discount`` cannot be applied to the tub, else None."""
+    if discount.tub_id is not None and discount.tub_id != tub_id:
+        return 'This is not the right code for this tub'
+    # Redeeming also deactivates a code, so check used first for the accurate message.
+    if not discount.is_multi_use and discount.used:
+        return 'This code has already been used'
+    if not discount.active:
+        return 'This code is not available'
+    return None
+
+
+def redeem_discount(discount):
+    """
+    Consume a single-use code with one conditional
+    ``UPDATE ... WHERE active AND NOT used``; raises DiscountUnavailable if a
+    concurrent checkout got there first. Run it inside the reservation's
+    transaction so a failed booking gives the code back. Only the discount's
+    own row is locked, redemptions of other codes never wait on it.
+    """
+    if discount.is_multi_use:
+        return
+    redeemed = Discount.objects.filter(pk=discount.pk, active=True, used=False).update(used=True, active=False)
+    if not redeemed:
+        raise DiscountUnavailable()
+    discount.used, discount.active = True, False
+
+
+def quote_price(rates, start_date, end_date, discount_value=None):
+    """
+    Price the inclusive range ``[start_date, end_date]``: whole weeks at the
+    weekly rate when the tub has one, the remaining days at the daily rate,
+    then ``discount_value`` percent off the subtotal.
+    """
+    days = (end_date - start_date).days + 1
+    weeks, extra_days = divmod(days, WEEK) if rates.per_week is not None else (0, days)
+    subtotal = (rates.per_week or 0) * weeks + rates.per_day * extra_days
+    discount_amount = (subtotal * Decimal(discount_value or 0) / 100).quantize(CENT, rounding=ROUND_HALF_UP)
+    return {
+        'days': days,
+        'weeks': weeks,
+        'extra_days': extra_days,
+        'price_per_day': rates.per_day,
+        'price_per_week': rates.per_week,
+        'subtotal': Decimal(subtotal).quantize(CENT),
+        'discount_value': discount_value,
+        'discount_amount': discount_amount,
+        'total': (subtotal - discount_amount).quantize(CENT),
+    }
+
+
+def batch_quote(items):
+    """
+    Price many ``{'tub': id, 'start_date': date, 'end_date': date, 'code': str|None}``
+    items with one rate lookup and one discount query for the whole batch.
+    Returns one result per item, in order; unpriceable items carry ``error``.
+    """
+    tables = rate_tables({item['tub'] for item in items})
+    codes = {item['code'] for item in items if item.get('code')}
+    discounts = {discount.main: discount for discount in Discount.objects.filter(main__in=codes)} if codes else {}
+
+    results = []
+    for item in items:
+        result = {'tub': item['tub'], 'start_date': item['start_date'], 'end_date': item['end_date']}
+        rates = tables.get(item['tub'])
+        if rates is None:
+            result['error'] = 'Tub not found'
+            results.append(result)
+            continue
+
+        discount_value = None
+        code = item.get('code')
+        if code:
+            result['code'] = code
+            discount = discounts.get(code)
+            error = 'This code does not exist' if discount is None else discount_error(discount, item['tub'])
+            if error:
+                result['discount_error'] = error
+            else:
+                discount_value = discount.value
+        result.update(quote_price(rates, item['start_date'], item['end_date'], discount_value))
+        results.append(result)
+    return results
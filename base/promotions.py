@@ -0,0 +1,71 @@
+import secrets
+from uuid import uuid4
+
+from django.db import transaction
+
+from .models import Discount
+
+
+# No 0/O, 1/I/L: codes get read out and typed by hand.
+CODE_ALPHABET = 'ABCDEFGHJKMNPQRSTUVWXYZ23456789'
+CODE_LENGTH = Discount._meta.get_field('main').max_length
+MIN_RANDOM_LENGTH = 6
+MAX_GENERATED_CODES = 100000
+INSERT_BATCH_SIZE = 5000
+
+
+def random_code(prefix, length):
+    # One randbelow() per code, written out in base len(CODE_ALPHABET).
+    number = secrets.randbelow(len(CODE_ALPHABET) ** length)
+    chars = []
+    for _ in range(length):
+        number, index = divmod(number, len(CODE_ALPHABET))
+        chars.append(CODE_ALPHABET[index])
+    return prefix + ''.join(chars)
+
+
+def generate_codes(count, value, tub_id=None, prefix=''):
+    """
+    Create ``count`` unique single-use codes worth ``value`` percent, for one
+    tub or, with ``tub_id=None``, for any tub. Returns the batch id shared by
+    the new rows.
+
+    Nothing is checked up front: every round bulk-inserts fresh candidates
+    with ON CONFLICT DO NOTHING on the unique ``main`` and counts the batch
+    once to find how many collided, then generates only that shortfall.
+    """
+    random_length = min(10, CODE_LENGTH - len(prefix))
+    batch = uuid4().hex
+    with transaction.atomic():
+        created = 0
+        while created < count:
+            candidates = set()
+            while len(candidates) < count - created:
+                candidates.add(random_code(prefix, random_length))
+            Discount.objects.bulk_create(
+                [
+                    Discount(tub_id=tub_id, main=code, value=value, active=True, used=False, is_multi_use=False, batch=batch)
+                    for code in candidates
+                ],
+                batch_size=INSERT_BATCH_SIZE,
+                ignore_conflicts=True,
+            )
+            created = Discount.objects.filter(batch=batch).count()
+    return batch
+
+
+def validate_generation(count, value, prefix):
+    """Return ``(count, value, prefix)`` cleaned, or raise ValueError with a client message."""
+    try:
+        count, value = int(count), int(value)
+    except (TypeError, ValueError):
+        raise ValueError('Count and value must be numbers')
+    if not 1 <= count <= MAX_GENERATED_CODES:
+        raise ValueError(f'Count must be between 1 and {MAX_GENERATED_CODES}')
+    if not 1 <= value <= 100:
+        raise ValueError('Value must be a percentage from 1 to 100')
+
+    prefix = (prefix or '').strip().upper()
+    if not prefix.isascii() or not all(char.isalnum() for char in prefix) or len(prefix) > CODE_LENGTH - MIN_RANDOM_LENGTH:
+        raise ValueError(f'Prefix must be at most {CODE_LENGTH - MIN_RANDOM_LENGTH} letters or digits')
+    return count, value, prefix
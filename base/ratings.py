@@ -0,0 +1,74 @@
+from functools import partial
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Tub, Rating
+from .stamps import bump
+
+
+STARS = range(1, 6)
+
+
+def apply_rating_change(tub_id, old_stars=None, new_stars=None):
+    """
+    Adjust the denormalized rating aggregates of a tub for one rating that
+    was created (``old_stars`` is None), changed, or removed (``new_stars``
+    is None). Runs as a single UPDATE with F() expressions.
+    """
+    if tub_id is None or old_stars == new_stars:
+        return
+
+    changes = {'rating_sum': F('rating_sum') + ((new_stars or 0) - (old_stars or 0))}
+    if old_stars is None:
+        changes['rating_count'] = F('rating_count') + 1
+    elif new_stars is None:
+        changes['rating_count'] = F('rating_count') - 1
+    if old_stars in STARS:
+        changes[f'stars_{old_stars}'] = F(f'stars_{old_stars}') - 1
+    if new_stars in STARS:
+        changes[f'stars_{new_stars}'] = F(f'stars_{new_stars}') + 1
+
+    Tub.objects.filter(pk=tub_id).update(**changes)
+
+
+def _update_rating(tub, user_id, stars):
+    # Locks only this user's rating row; returns None if there is none yet.
+    previous = Rating.objects.select_for_update().filter(user_id=user_id, tub=tub).values('pk', 'stars', 'desciption').first()
+    if previous is not None:
+        Rating.objects.filter(pk=previous['pk']).update(stars=stars)
+    return previous
+
+
+def upsert_rating(tub, user_id, stars):
+    """
+    Create or update the user's rating of ``tub`` and keep the tub
+    aggregates in step with one F() update from the previous stars.
+    Returns ``(rating, created)``.
+
+    Only the rating row is locked. A first rating is inserted in a
+    savepoint; if a concurrent first rating of the same user wins the unique
+    index, this one becomes an update of it, so neither counts twice. The
+    aggregate update and the tub's stamp come last, holding their row locks
+    for as short as possible, and the list stamp, one row shared by every
+    tub, is bumped after commit outside the transaction. Anonymous ratings
+    are always new.
+    """
+    with transaction.atomic():
+        previous = _update_rating(tub, user_id, stars) if user_id is not None else None
+        if previous is None:
+            rating = Rating(user_id=user_id, tub=tub, stars=stars)
+            try:
+                with transaction.atomic():
+                    Rating.objects.bulk_create([rating])
+            except IntegrityError:
+                previous = _update_rating(tub, user_id, stars)
+                if previous is None:
+                    raise
+        if previous is not None:
+            rating = Rating(pk=previous['pk'], user_id=user_id, tub=tub, stars=stars, desciption=previous['desciption'])
+        # bulk_create() and update() send no signals.
+        bump(f'tub:{tub.pk}')
+        apply_rating_change(tub.pk, previous['stars'] if previous else None, stars)
+        transaction.on_commit(partial(bump, 'tubs'))
+    return rating, previous is None
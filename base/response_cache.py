@@ -0,0 +1,149 @@
+import asyncio
+import hashlib
+import time
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from .stamps import read_stamps, aread_stamps
+
+
+LOCK_TIMEOUT = 10
+WAIT_INTERVAL = 0.05
+
+_MISS = object()
+
+
+def get_or_compute(key, compute, timeout=None):
+    """
+    Return ``cache[key]``, computing and storing it on a miss.
+
+    Only the request that wins ``cache.add()`` on the lock key recomputes a
+    cold entry; concurrent misses poll the cache for its result instead of
+    all hitting the database. If the lock holder dies they fall back to
+    computing the value themselves once the lock expires.
+    """
+    timeout = settings.API_CACHE_TIMEOUT if timeout is None else timeout
+    value = cache.get(key, _MISS)
+    if value is not _MISS:
+        return value
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            value = compute()
+            cache.set(key, value, timeout)
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        value = cache.get(key, _MISS)
+        if value is not _MISS:
+            return value
+        if cache.get(lock_key) is None:
+            break
+    return compute()
+
+
+async def aget_or_compute(key, compute, timeout=None):
+    """``get_or_compute()`` for async callers; ``compute`` is a coroutine function."""
+    timeout = settings.API_CACHE_TIMEOUT if timeout is None else timeout
+    value = await cache.aget(key, _MISS)
+    if value is not _MISS:
+        return value
+
+    lock_key = f'{key}:lock'
+    if await cache.aadd(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            value = await compute()
+            await cache.aset(key, value, timeout)
+            return value
+        finally:
+            await cache.adelete(lock_key)
+
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(WAIT_INTERVAL)
+        value = await cache.aget(key, _MISS)
+        if value is not _MISS:
+            return value
+        if await cache.aget(lock_key) is None:
+            break
+    return await compute()
+
+
+def _response_key(request, stamps):
+    versions, last_modified = stamps
+    # The timestamp guards against reusing keys if version counters ever restart (DB restore).
+    # Bodies hold absolute URLs (next/previous links, srcsets), hence the scheme and host.
+    source = '|'.join([
+        ','.join(f'{key}={versions[key]}' for key in sorted(versions)),
+        last_modified.isoformat() if last_modified else '',
+        request.build_absolute_uri(),
+    ])
+    return f'api:{hashlib.md5(source.encode(), usedforsecurity=False).hexdigest()}'
+
+
+def _cacheable_data(response):
+    if response.status_code != 200 or not isinstance(response, Response):
+        raise _Uncacheable(response)
+    return response.data
+
+
+class _Uncacheable(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+def cached(*key_templates):
+    """
+    Cache the serialized ``response.data`` of a DRF view method under a key
+    namespaced by the current version stamps of ``key_templates``, so any
+    bump of those stamps makes old entries unreachable. Stamps already read
+    by an outer ``conditional()`` are reused. Only 200 responses are cached.
+    Works on sync and async view methods.
+    """
+    def decorator(method):
+        if iscoroutinefunction(method):
+            @wraps(method)
+            async def async_wrapper(self, request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return await method(self, request, *args, **kwargs)
+
+                stamps = getattr(request, 'resource_stamps', None)
+                if stamps is None:
+                    stamps = await aread_stamps([template.format(**kwargs) for template in key_templates])
+
+                async def compute():
+                    return _cacheable_data(await method(self, request, *args, **kwargs))
+
+                try:
+                    return Response(await aget_or_compute(_response_key(request, stamps), compute))
+                except _Uncacheable as e:
+                    return e.response
+            return async_wrapper
+
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return method(self, request, *args, **kwargs)
+
+            stamps = getattr(request, 'resource_stamps', None)
+            if stamps is None:
+                stamps = read_stamps([template.format(**kwargs) for template in key_templates])
+
+            def compute():
+                return _cacheable_data(method(self, request, *args, **kwargs))
+
+            try:
+                return Response(get_or_compute(_response_key(request, stamps), compute))
+            except _Uncacheable as e:
+                return e.response
+        return wrapper
+    return decorator
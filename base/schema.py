@@ -0,0 +1,96 @@
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views import View
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+
+
+# format -> (artifact file name, renderer); yaml first, it is what SpectacularAPIView served by default.
+SCHEMA_FORMATS = {
+    'yaml': ('schema.yaml', OpenApiYamlRenderer),
+    'json': ('schema.json', OpenApiJsonRenderer),
+}
+
+_documents = {}
+_lock = threading.Lock()
+
+
+def generate_schema():
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    return generator.get_schema(request=None, public=True)
+
+
+def render_schema(schema, schema_format):
+    renderer = SCHEMA_FORMATS[schema_format][1]()
+    return renderer.render(schema, renderer_context={})
+
+
+def write_artifacts(schema, directory=None):
+    """Render ``schema`` in every format into the artifact directory and return the written paths."""
+    directory = directory or settings.OPENAPI_SCHEMA_DIR
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for schema_format, (file_name, _) in SCHEMA_FORMATS.items():
+        path = os.path.join(directory, file_name)
+        # Write then rename so a running worker never reads a half written file.
+        with open(f'{path}.tmp', 'wb') as f:
+            f.write(render_schema(schema, schema_format))
+        os.replace(f'{path}.tmp', path)
+        paths.append(path)
+    return paths
+
+
+def _load(schema_format):
+    path = os.path.join(settings.OPENAPI_SCHEMA_DIR, SCHEMA_FORMATS[schema_format][0])
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+        last_modified = int(os.path.getmtime(path))
+    except FileNotFoundError:
+        # No release artifact (local development): generate once and keep it for the process lifetime.
+        content = render_schema(generate_schema(), schema_format)
+        last_modified = None
+    etag = f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+    return content, etag, last_modified
+
+
+def get_document(schema_format):
+    """Return ``(content, etag, last_modified)`` of the schema, loaded once per process."""
+    document = _documents.get(schema_format)
+    if document is None:
+        with _lock:
+            document = _documents.get(schema_format)
+            if document is None:
+                document = _documents[schema_format] = _load(schema_format)
+    return document
+
+
+class PrebuiltSchemaView(View):
+    """
+    Serves the OpenAPI schema written at release time by
+    ``manage.py build_openapi_schema`` instead of introspecting every view on
+    each request. YAML by default like SpectacularAPIView, JSON for
+    ``?format=json`` or a JSON Accept header.
+    """
+
+    def get(self, request, *args, **kwargs):
+        schema_format = request.GET.get('format')
+        if schema_format not in SCHEMA_FORMATS:
+            schema_format = 'json' if 'json' in request.headers.get('Accept', '') else 'yaml'
+
+        content, etag, last_modified = get_document(schema_format)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = HttpResponse(content, content_type=SCHEMA_FORMATS[schema_format][1].media_type)
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        response['Vary'] = 'Accept'
+        patch_cache_control(response, public=True, max_age=settings.OPENAPI_SCHEMA_MAX_AGE)
+        return response
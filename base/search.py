@@ -0,0 +1,107 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.utils.html import escape
+from rest_framework.settings import api_settings
+
+
+# scope -> (result type, table, title column, body column, extra condition); indexes from migration 0025.
+SEARCH_SCOPES = {
+    'tubs': ('tub', 'base_tub', 'name', 'description', ''),
+    'faq': ('faq', 'base_faq', 'question', 'answer', 'AND base_faq.is_published'),
+}
+MAX_SEARCH_TERMS = 10
+SNIPPET_WORDS = 24
+
+# Matches come back wrapped in these and are turned into <mark> only after
+# the text is escaped, FAQ questions are written by anonymous users.
+MARK_START, MARK_END = '\x02', '\x03'
+
+
+def parse_search(params):
+    """
+    Read ``?q=&scope=all|tubs|faq&page=&page_size=`` into
+    ``(terms, scopes, page, page_size)``; raises ValueError with a client message.
+    """
+    terms = [term.lower() for term in re.findall(r'\w+', params.get('q') or '')][:MAX_SEARCH_TERMS]
+    if not terms:
+        raise ValueError('Search query is required')
+
+    scope = params.get('scope') or 'all'
+    if scope != 'all' and scope not in SEARCH_SCOPES:
+        raise ValueError(f'Scope must be one of: all, {", ".join(SEARCH_SCOPES)}')
+    scopes = list(SEARCH_SCOPES) if scope == 'all' else [scope]
+
+    try:
+        page = int(params.get('page') or 1)
+        page_size = min(int(params.get('page_size') or api_settings.PAGE_SIZE), settings.API_MAX_PAGE_SIZE)
+    except ValueError:
+        raise ValueError('Page and page size must be numbers')
+    if page < 1 or page_size < 1:
+        raise ValueError('Page and page size must be positive')
+    return terms, scopes, page, page_size
+
+
+def _postgresql_query(terms, scopes, limit, offset):
+    # Rank every match but run ts_headline, the expensive part, on the page rows only.
+    tsquery = ' & '.join(f'{term}:*' for term in terms)
+    title_options = f'StartSel="{MARK_START}", StopSel="{MARK_END}", HighlightAll=true'
+    body_options = f'StartSel="{MARK_START}", StopSel="{MARK_END}", MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 2}'
+    selects = [
+        f"SELECT '{kind}' AS kind, {table}.id, {title} AS title, {body} AS body, ts_rank_cd({table}.search_vector, query) AS rank "
+        f"FROM {table}, to_tsquery('simple', %s) query WHERE {table}.search_vector @@ query {condition}"
+        for kind, table, title, body, condition in (SEARCH_SCOPES[scope] for scope in scopes)
+    ]
+    sql = (
+        "SELECT kind, id, ts_headline('simple', coalesce(title, ''), query, %s), ts_headline('simple', coalesce(body, ''), query, %s) "
+        f"FROM ({' UNION ALL '.join(selects)} ORDER BY rank DESC, kind, id LIMIT %s OFFSET %s) hits, to_tsquery('simple', %s) query "
+        'ORDER BY rank DESC, kind, id'
+    )
+    return sql, [title_options, body_options, *[tsquery] * len(selects), limit, offset, tsquery]
+
+
+def _sqlite_query(terms, scopes, limit, offset):
+    # bm25() is lower for better matches; titles weigh ten times the body.
+    match = ' '.join(f'"{term}"*' for term in terms)
+    selects = []
+    params = []
+    for scope in scopes:
+        kind, table, _, _, condition = SEARCH_SCOPES[scope]
+        fts = f'{table}_fts'
+        selects.append(
+            f"SELECT '{kind}' AS kind, {fts}.rowid AS id, highlight({fts}, 0, %s, %s) AS title, "
+            f"snippet({fts}, 1, %s, %s, '…', {SNIPPET_WORDS}) AS body, bm25({fts}, 10.0, 1.0) AS rank "
+            f'FROM {fts} JOIN {table} ON {table}.id = {fts}.rowid WHERE {fts} MATCH %s {condition}'
+        )
+        params += [MARK_START, MARK_END, MARK_START, MARK_END, match]
+    sql = f"SELECT kind, id, title, body FROM ({' UNION ALL '.join(selects)}) ORDER BY rank, kind, id LIMIT %s OFFSET %s"
+    return sql, params + [limit, offset]
+
+
+SEARCH_QUERIES = {
+    'postgresql': _postgresql_query,
+    'sqlite': _sqlite_query,
+}
+
+
+def _marked(text):
+    return escape(text or '').replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+def search(terms, scopes, limit, offset=0):
+    """
+    Ranked full-text matches of all ``terms`` (as prefixes) across ``scopes``,
+    best first, as ``[{'type', 'id', 'title', 'snippet'}]`` with the matched
+    words in ``<mark>``. One query against the tsvector GIN indexes on
+    PostgreSQL or the FTS5 tables on SQLite; other databases are refused at
+    startup by base.checks.
+    """
+    sql, params = SEARCH_QUERIES[connection.vendor](terms, scopes, limit, offset)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return [
+        {'type': kind, 'id': pk, 'title': _marked(title), 'snippet': _marked(body)}
+        for kind, pk, title, body in rows
+    ]
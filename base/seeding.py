@@ -0,0 +1,204 @@
+import random
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from uuid import uuid4
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from custom_auth.models import CustomUser
+from .availability import date_range
+from .models import Tub, Image, Reservation, ReservedDay, Address, Rating
+from .promotions import generate_codes
+from .stamps import bump
+
+
+BATCH_SIZE = 5000
+SEED_PASSWORD = 'seed-password'
+
+TUB_KINDS = ['Balia', 'Sauna', 'Jacuzzi', 'Beczka', 'Bania']
+TUB_WOODS = ['cedrowa', 'świerkowa', 'modrzewiowa', 'sosnowa', 'termodrewno', 'dębowa']
+TUB_FEATURES = [
+    'piec opalany drewnem', 'hydromasaż', 'oświetlenie LED', 'pokrywa termiczna', 'schodki',
+    'filtr piaskowy', 'dysze powietrzne', 'ławki dla ośmiu osób', 'wkład z polipropylenu', 'przyczepa do transportu',
+]
+CITIES = ['Kraków', 'Warszawa', 'Gdańsk', 'Wrocław', 'Poznań', 'Zakopane', 'Łódź', 'Lublin']
+STREETS = ['Długa', 'Krótka', 'Leśna', 'Polna', 'Ogrodowa', 'Słoneczna', 'Lipowa', 'Szkolna']
+
+# Rough star distribution of real reviews: mostly good, a tail of bad ones.
+STAR_WEIGHTS = {1: 4, 2: 5, 3: 11, 4: 30, 5: 50}
+
+
+def _log(log, message):
+    if log:
+        log(message)
+
+
+def seed_users(rng, run, count):
+    # One hash for everybody, hashing per user would take minutes.
+    password = make_password(SEED_PASSWORD)
+    users = [
+        CustomUser(username=f'seed-{run}-{i}', email=f'seed-{run}-{i}@example.com', password=password,
+                   first_name=f'Guest{i}', last_name=rng.choice(STREETS), phone_number=f'+48{rng.randrange(10 ** 8, 10 ** 9)}')
+        for i in range(count)
+    ]
+    return [user.pk for user in CustomUser.objects.bulk_create(users, batch_size=BATCH_SIZE)]
+
+
+def seed_tubs(rng, count, images_per_tub):
+    tubs = []
+    for i in range(count):
+        features = ', '.join(rng.sample(TUB_FEATURES, 4))
+        price_per_day = Decimal(rng.randrange(150, 900, 10))
+        tubs.append(Tub(
+            name=f'{rng.choice(TUB_KINDS)} {rng.choice(TUB_WOODS)} {i + 1}',
+            description=f'{features[0].upper()}{features[1:]}.',
+            price_per_day=price_per_day,
+            price_per_week=price_per_day * 6 if rng.random() < 0.7 else None,
+            logo_img='logo_tub/seed.png',
+        ))
+    tub_ids = [tub.pk for tub in Tub.objects.bulk_create(tubs, batch_size=BATCH_SIZE)]
+    Image.objects.bulk_create(
+        [Image(tub_id=tub_id, image=f'images/seed-{n}.jpg') for tub_id in tub_ids for n in range(images_per_tub)],
+        batch_size=BATCH_SIZE,
+    )
+    return tub_ids
+
+
+def _bookings(rng, tub_ids, prices, count, today):
+    """
+    Yield ``(tub_id, start, end, status, price)`` for ``count`` reservations
+    spread over the tubs, back to back with gaps so no two overlap.
+    """
+    per_tub, extra = divmod(count, len(tub_ids))
+    for index, tub_id in enumerate(tub_ids):
+        day = today - timedelta(days=rng.randrange(300, 700))
+        for _ in range(per_tub + (index < extra)):
+            day += timedelta(days=rng.randrange(0, 4))
+            end = day + timedelta(days=rng.randrange(0, 7))
+            if end < today:
+                status = rng.choices(
+                    [Reservation.Status.ACCEPTED, Reservation.Status.CANCELLED, Reservation.Status.REJECTED, Reservation.Status.EXPIRED],
+                    [80, 8, 6, 6],
+                )[0]
+            else:
+                status = rng.choices([Reservation.Status.PENDING, Reservation.Status.ACCEPTED, Reservation.Status.CANCELLED], [45, 50, 5])[0]
+            yield tub_id, day, end, status, prices[tub_id]
+            day = end + timedelta(days=1)
+
+
+def seed_reservations(rng, tub_ids, user_ids, count, log=None):
+    """
+    Insert reservations with their address and, for pending and accepted
+    ones, their day index rows, a batch at a time. bulk_create() sends no
+    signals, so the day rows are written here like sync_reserved_days() would.
+    """
+    prices = dict(Tub.objects.filter(pk__in=tub_ids).values_list('pk', 'price_per_day'))
+    bookings = _bookings(rng, tub_ids, prices, count, timezone.localdate())
+    created = 0
+    while created < count:
+        batch = []
+        for tub_id, start, end, status, price in bookings:
+            batch.append(Reservation(
+                tub_id=tub_id,
+                user_id=rng.choice(user_ids),
+                price=price,
+                counted_price=price * ((end - start).days + 1),
+                start_date=start,
+                end_date=end,
+                status=status,
+            ))
+            if len(batch) == BATCH_SIZE:
+                break
+        if not batch:
+            break
+
+        with transaction.atomic():
+            Reservation.objects.bulk_create(batch)
+            Address.objects.bulk_create([
+                Address(reservation_id=reservation.pk, city=rng.choice(CITIES), street=rng.choice(STREETS), home_number=str(rng.randrange(1, 200)))
+                for reservation in batch
+            ])
+            ReservedDay.objects.bulk_create([
+                ReservedDay(tub_id=reservation.tub_id, reservation_id=reservation.pk, day=day, accepted=reservation.status == Reservation.Status.ACCEPTED)
+                for reservation in batch if reservation.status in Reservation.ACTIVE_STATUSES
+                for day in date_range(reservation.start_date, reservation.end_date)
+            ], batch_size=BATCH_SIZE)
+        created += len(batch)
+        _log(log, f'  {created} reservations')
+    return created
+
+
+def seed_ratings(rng, tub_ids, user_ids, count):
+    """
+    Insert ``count`` ratings of distinct (user, tub) pairs and write the
+    aggregates of the tubs, which bulk_create() does not keep up to date.
+    """
+    count = min(count, len(tub_ids) * len(user_ids))
+    pairs = set()
+    while len(pairs) < count:
+        pairs.add((rng.choice(user_ids), rng.choice(tub_ids)))
+
+    stars = list(STAR_WEIGHTS)
+    ratings = [Rating(user_id=user_id, tub_id=tub_id, stars=rng.choices(stars, STAR_WEIGHTS.values())[0]) for user_id, tub_id in pairs]
+    Rating.objects.bulk_create(ratings, batch_size=BATCH_SIZE)
+
+    histograms = defaultdict(lambda: dict.fromkeys(stars, 0))
+    for rating in ratings:
+        histograms[rating.tub_id][rating.stars] += 1
+    tubs = Tub.objects.filter(pk__in=list(histograms)).only('pk')
+    for tub in tubs:
+        histogram = histograms[tub.pk]
+        tub.rating_count = sum(histogram.values())
+        tub.rating_sum = sum(star * n for star, n in histogram.items())
+        for star, n in histogram.items():
+            setattr(tub, f'stars_{star}', n)
+    Tub.objects.bulk_update(tubs, ['rating_count', 'rating_sum', *(f'stars_{star}' for star in stars)], batch_size=BATCH_SIZE)
+    return len(ratings)
+
+
+def seed_discounts(rng, tub_ids, count):
+    values = [5, 10, 15, 20]
+    per_value, extra = divmod(count, len(values))
+    for index, value in enumerate(values):
+        if per_value + (index < extra):
+            tub_id = rng.choice(tub_ids) if index % 2 else None
+            generate_codes(per_value + (index < extra), value, tub_id=tub_id, prefix='SEED')
+    return count
+
+
+def seed(tubs=2000, images_per_tub=3, users=5000, reservations=200000, ratings=50000, discounts=10000, random_seed=None, log=None):
+    """
+    Fill the database with a synthetic but realistic catalogue and booking
+    history through bulk_create(), adding to whatever is already there.
+    Returns the number of rows created per kind.
+    """
+    rng = random.Random(random_seed)
+    run = uuid4().hex[:8]
+
+    with transaction.atomic():
+        user_ids = seed_users(rng, run, users)
+        _log(log, f'{len(user_ids)} users')
+        tub_ids = seed_tubs(rng, tubs, images_per_tub)
+        _log(log, f'{len(tub_ids)} tubs, {len(tub_ids) * images_per_tub} images')
+
+    created = seed_reservations(rng, tub_ids, user_ids, reservations, log)
+
+    with transaction.atomic():
+        rated = seed_ratings(rng, tub_ids, user_ids, ratings)
+        _log(log, f'{rated} ratings')
+        seed_discounts(rng, tub_ids, discounts)
+        _log(log, f'{discounts} discount codes')
+        # Cached tub lists and their ETags predate the new rows.
+        bump('tubs')
+
+    return {
+        'users': len(user_ids),
+        'tubs': len(tub_ids),
+        'images': len(tub_ids) * images_per_tub,
+        'reservations': created,
+        'ratings': rated,
+        'discounts': discounts,
+    }
@@ -1,18 +1,40 @@
 from rest_framework import serializers
 from .models import Tub, Image, Reservation, Rating, Discount, Faq, Address
+from .images import srcset
 
 
 class ImageSerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = Image
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'srcset']
+
+    def get_srcset(self, obj):
+        return srcset(obj, 'image', 'derivatives', 'image', self.context.get('request'))
 
 
 class TubSerializer(serializers.ModelSerializer):
     images = ImageSerializer(many=True, read_only=True)
+    logo_srcset = serializers.SerializerMethodField()
+    rating_average = serializers.SerializerMethodField()
+    rating_histogram = serializers.SerializerMethodField()
+
     class Meta:
         model = Tub
-        fields = ['id', 'name', 'description', 'price_per_day', 'price_per_week', 'images', 'logo_img']
+        fields = ['id', 'name', 'description', 'price_per_day', 'price_per_week', 'images', 'logo_img', 'logo_srcset', 'rating_count', 'rating_average', 'rating_histogram']
+        read_only_fields = ['rating_count']
+
+    def get_logo_srcset(self, obj):
+        return srcset(obj, 'logo_img', 'logo_derivatives', 'logo', self.context.get('request'))
+
+    def get_rating_average(self, obj):
+        if not obj.rating_count:
+            return None
+        return round(obj.rating_sum / obj.rating_count, 2)
+
+    def get_rating_histogram(self, obj):
+        return {str(n): getattr(obj, f'stars_{n}') for n in range(1, 6)}
 
 
 class AddTubSerializer(serializers.ModelSerializer):
@@ -56,15 +78,20 @@ class AddressSerializer(serializers.ModelSerializer):
 
 class ReservationSerializer(serializers.ModelSerializer):
     address = serializers.SerializerMethodField()
+    wait_status = serializers.BooleanField(read_only=True)
+    accepted_status = serializers.BooleanField(read_only=True)
 
     class Meta:
         model = Reservation
-        fields = ['id', 'tub', 'user', 'price', 'counted_price', 'start_date', 'end_date', 'nobody_status', 'wait_status', 'accepted_status', 'address']
+        fields = ['id', 'tub', 'user', 'price', 'counted_price', 'start_date', 'end_date', 'status', 'wait_status', 'accepted_status', 'address']
+        # Status only changes through the transition actions.
+        read_only_fields = ['status']
 
     def get_address(self, obj):
-        address = Address.objects.filter(reservation=obj).first()
-        if address:
-            return AddressSerializer(address).data
+        # Reads the prefetch cache when the queryset used prefetch_related('address_to_reservation').
+        addresses = obj.address_to_reservation.all()
+        if addresses:
+            return AddressSerializer(addresses[0]).data
         return None
 
     def create(self, validated_data):
@@ -0,0 +1,63 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .availability import sync_reserved_days
+from .images import is_current, schedule_derivatives
+from .models import Tub, Image, Reservation, Rating, Faq
+from .pricing import invalidate_rates
+from .ratings import apply_rating_change
+from .stamps import bump, tub_keys
+
+
+@receiver(post_save, sender=Reservation)
+def reservation_saved(sender, instance, raw=False, **kwargs):
+    # Deleting a reservation cascades to its day rows, so only saves need handling here.
+    if raw:
+        return
+    sync_reserved_days(instance)
+
+
+@receiver(post_delete, sender=Rating)
+def rating_deleted(sender, instance, **kwargs):
+    apply_rating_change(instance.tub_id, old_stars=instance.stars)
+
+
+@receiver([post_save, post_delete], sender=Tub)
+def tub_changed(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    bump(*tub_keys(instance.pk))
+    transaction.on_commit(partial(invalidate_rates, instance.pk))
+
+
+@receiver([post_save, post_delete], sender=Image)
+@receiver([post_save, post_delete], sender=Rating)
+def tub_content_changed(sender, instance, **kwargs):
+    if kwargs.get('raw') or instance.tub_id is None:
+        return
+    bump(*tub_keys(instance.tub_id))
+
+
+@receiver([post_save, post_delete], sender=Faq)
+def faq_changed(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    bump('faq')
+
+
+@receiver(post_save, sender=Image)
+def image_saved(sender, instance, raw=False, **kwargs):
+    if raw or is_current(instance, 'image', 'derivatives') or not instance.image:
+        return
+    # After commit, so the background build reads the new file name.
+    transaction.on_commit(partial(schedule_derivatives, 'image', instance.pk))
+
+
+@receiver(post_save, sender=Tub)
+def tub_saved(sender, instance, raw=False, **kwargs):
+    if raw or is_current(instance, 'logo_img', 'logo_derivatives') or not instance.logo_img:
+        return
+    transaction.on_commit(partial(schedule_derivatives, 'logo', instance.pk))
@@ -1,3 +1,1343 @@
-from django.test import TestCase
+import csv
+import json
+import re
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, resolve
+from django.utils import timezone
+from drf_spectacular.drainage import GENERATOR_STATS
+from PIL import Image as PILImage
+from rest_framework.test import APIClient
+from rest_framework.throttling import ScopedRateThrottle
+
+from custom_auth.models import CustomUser
+from . import ratings, schema, urls
+from .availability import book_tub, parse_window, TubUnavailable, MAX_WINDOW_DAYS
+from .checks import check_search_backend, check_search_triggers
+from .exports import DISCOUNT_EXPORT_COLUMNS, RESERVATION_EXPORT_COLUMNS
+from .metrics import COUNT, QUERIES, SERIES_LENGTH, process_snapshot
+from .models import Tub, Reservation, ReservedDay, Address, Discount, Rating, Image, ResourceVersion, Faq
+from .moderation import expire_reservations, transition_reservation
+from .pagination import KeysetPagination
+from .pricing import redeem_discount, rate_tables, DiscountUnavailable, MAX_QUOTE_CODES, RATES_REVALIDATE
+from .promotions import generate_codes, MAX_GENERATED_CODES
+from .response_cache import get_or_compute
+from .search import search
+from .stamps import bump, read_stamps, tub_keys
+from .urls import async_urlpatterns
+
+
+class ReservationQueryCountTests(TestCase):
+    """
+    Listing reservations must cost a constant number of queries: one for the
+    reservations and one for the prefetched addresses.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('manager', 'manager@example.com', 'password', is_manager=True)
+        cls.tub = Tub.objects.create(name='Tub', description='Hot tub', price_per_day=100)
+        start = date(2030, 1, 1)
+        for i in range(10):
+            reservation = Reservation.objects.create(
+                tub=cls.tub,
+                user=cls.user,
+                price=100,
+                counted_price=100,
+                start_date=start + timedelta(days=i * 3),
+                end_date=start + timedelta(days=i * 3 + 1),
+                status=Reservation.Status.ACCEPTED if i % 2 == 0 else Reservation.Status.PENDING,
+            )
+            Address.objects.create(reservation=reservation, city='Krakow', street='Dluga', home_number=str(i))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertListQueries(self, url, num, expected_rows):
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), expected_rows)
+        self.assertTrue(all(row['address'] for row in response.data['results']))
+
+    def test_all_reservations(self):
+        self.assertListQueries('/api/reservations/all_reservations/', 2, 10)
+
+    def test_accepted_reservations(self):
+        self.assertListQueries('/api/reservations/accepted_reservations/', 2, 5)
+
+    def test_pending_reservations(self):
+        self.assertListQueries('/api/reservations/pending_reservations/', 2, 5)
+
+    def test_check_reservations(self):
+        # One extra query to look up the tub.
+        self.assertListQueries(f'/api/tubs/{self.tub.pk}/check_reservations/', 3, 10)
+
+    def test_user_reservation_history(self):
+        self.assertListQueries('/api/profile/reservations/', 2, 10)
+
+
+class ReservationQueryPlanTests(TestCase):
+    """
+    Every reservation query an endpoint sends must be answered from an index.
+    The SQL each request issues is captured and run through EXPLAIN against a
+    seeded, analyzed table; a sequential scan of base_reservation fails.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = CustomUser.objects.create_user('manager', 'manager@example.com', 'password', is_manager=True)
+        users = [cls.manager] + [
+            CustomUser.objects.create_user(f'user{i}', f'user{i}@example.com', 'password') for i in range(20)
+        ]
+        tubs = [Tub.objects.create(name=f'Tub {i}', description='Hot tub', price_per_day=100) for i in range(20)]
+        start = date(2030, 1, 1)
+        # Reservation.objects.bulk_create() skips the signals; the day index is not needed here.
+        Reservation.objects.bulk_create([
+            Reservation(
+                tub=tubs[i % len(tubs)],
+                user=users[i % len(users)],
+                price=100,
+                counted_price=200,
+                start_date=start + timedelta(days=i // len(tubs) * 3),
+                end_date=start + timedelta(days=i // len(tubs) * 3 + 1),
+                status=Reservation.Status.ACCEPTED if i % 4 == 0 else Reservation.Status.PENDING,
+            )
+            for i in range(4000)
+        ])
+        cls.tub = tubs[0]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def sequential_scans(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Tiny test tables would make a seq scan the cheapest plan anyway; only flag it
+                # when there is no index the planner could have used instead.
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN {sql}')
+                return [line for line, in cursor.fetchall() if re.search(r'Seq Scan on base_reservation\b', line)]
+
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            names = {'base_reservation', *re.findall(r'"base_reservation" (?:AS )?"?(\w+)"?', sql)}
+            return [
+                detail for *_, detail in cursor.fetchall()
+                if re.fullmatch(r'SCAN (\w+)', detail) and detail.split()[1] in names
+            ]
+
+    def assertIndexedReservationQueries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+
+        reservation_queries = [query['sql'] for query in queries if 'base_reservation' in query['sql']]
+        self.assertTrue(reservation_queries, url)
+        for sql in reservation_queries:
+            with transaction.atomic():
+                self.assertEqual(self.sequential_scans(sql), [], f'{url}\n{sql}')
+        return response
+
+    def test_all_reservations(self):
+        response = self.assertIndexedReservationQueries('/api/reservations/all_reservations/')
+        self.assertIndexedReservationQueries(response.data['next'])
+
+    def test_accepted_reservations(self):
+        response = self.assertIndexedReservationQueries('/api/reservations/accepted_reservations/')
+        self.assertIndexedReservationQueries(response.data['next'])
+
+    def test_pending_reservations(self):
+        response = self.assertIndexedReservationQueries('/api/reservations/pending_reservations/')
+        self.assertIndexedReservationQueries(response.data['next'])
+
+    def test_check_reservations(self):
+        response = self.assertIndexedReservationQueries(f'/api/tubs/{self.tub.pk}/check_reservations/')
+        self.assertIndexedReservationQueries(response.data['next'])
+
+    def test_user_reservation_history(self):
+        response = self.assertIndexedReservationQueries('/api/profile/reservations/')
+        self.assertIndexedReservationQueries(response.data['next'])
+
+    def test_free_tub_search(self):
+        self.assertIndexedReservationQueries('/api/tubs/?from=2030-01-10&to=2030-01-12')
+
+
+class KeysetPaginationTests(TestCase):
+    """Reservation pages are walked by (start_date, id) cursors in both directions, without counting."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.guest = CustomUser.objects.create_user('guest', 'guest@example.com', 'password')
+        tub = Tub.objects.create(name='Tub', description='Hot tub', price_per_day=100)
+        # Three reservations share each start date, so most page boundaries fall inside a tie.
+        for day in [3, 1, 2, 1, 3, 2, 1]:
+            Reservation.objects.create(tub=tub, user=cls.guest, price=100, counted_price=100, start_date=date(2030, 1, day), end_date=date(2030, 1, day))
+        cls.expected = list(Reservation.objects.order_by('start_date', 'id').values_list('id', flat=True))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.guest)
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([reservation['id'] for reservation in response.data['results']])
+            url = response.data[link]
+        return pages
+
+    def test_cursors_round_trip(self):
+        forward = self.walk('/api/profile/reservations/?page_size=2', 'next')
+        self.assertEqual(forward, [self.expected[i:i + 2] for i in range(0, 7, 2)])
+
+        last = self.client.get('/api/profile/reservations/?page_size=2').data
+        while last['next']:
+            last = self.client.get(last['next']).data
+        backward = self.walk(last['previous'], 'previous')
+        self.assertEqual(backward, forward[-2::-1])
+
+    def test_start_date_ties_resolved_by_id(self):
+        tied = list(Reservation.objects.filter(start_date=date(2030, 1, 1)).order_by('id').values_list('id', flat=True))
+        first = self.client.get('/api/profile/reservations/?page_size=1').data
+        second = self.client.get(first['next']).data
+        third = self.client.get(second['next']).data
+        self.assertEqual([page['results'][0]['id'] for page in (first, second, third)], tied)
+
+    def test_page_size_capped(self):
+        self.assertEqual(KeysetPagination.max_page_size, settings.API_MAX_PAGE_SIZE)
+        with patch.object(KeysetPagination, 'max_page_size', 3), CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/profile/reservations/?page_size=100')
+        self.assertEqual([reservation['id'] for reservation in response.data['results']], self.expected[:3])
+        self.assertIsNotNone(response.data['next'])
+        self.assertNotIn('count', response.data)
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql'].upper()])
+
+    def test_tampered_cursor_rejected(self):
+        for cursor in ['not-base64!', 'eyJwIjpbMV19', 'eyJwIjpbIngiLDFdfQ==']:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get('/api/profile/reservations/', {'cursor': cursor}).status_code, 404)
+
+
+class DiscountPermissionTests(TestCase):
+    """Discount rows hold the codes themselves, only managers may read or change them."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = CustomUser.objects.create_user('manager', 'manager@example.com', 'password', is_manager=True)
+        cls.guest = CustomUser.objects.create_user('guest', 'guest@example.com', 'password')
+        Discount.objects.create(main='SECRET10', value=10, active=True)
+
+    def test_anonymous_cannot_list_codes(self):
+        response = APIClient().get('/api/discounts/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_guest_cannot_list_or_create_codes(self):
+        client = APIClient()
+        client.force_authenticate(self.guest)
+        self.assertEqual(client.get('/api/discounts/').status_code, 403)
+        self.assertEqual(client.post('/api/discounts/', {'main': 'MINE100', 'value': 100, 'active': True}).status_code, 403)
+        self.assertFalse(Discount.objects.filter(main='MINE100').exists())
+
+    def test_manager_lists_codes(self):
+        client = APIClient()
+        client.force_authenticate(self.manager)
+        response = client.get('/api/discounts/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['main'] for row in response.data['results']], ['SECRET10'])
+
+
+class DiscountGenerationTests(TestCase):
+    """generate_discount_codes and the generate action insert exactly the requested batch."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = CustomUser.objects.create_user('manager', 'manager@example.com', 'password', is_manager=True)
+        cls.tub = Tub.objects.create(name='Tub', description='Hot tub', price_per_day=100)
+        Discount.objects.create(main='TAKEN1', value=10, active=True)
+
+    def rows(self, text):
+        return list(csv.DictReader(text.splitlines()))
+
+    def test_command_writes_the_batch_as_csv(self):
+        out = StringIO()
+        call_command('generate_discount_codes', count=50, value=15, tub=self.tub.pk, prefix='spa', stdout=out)
+        rows = self.rows(out.getvalue())
+        self.assertEqual(len(rows), 50)
+        self.assertEqual(list(rows[0]), [name for name, _ in DISCOUNT_EXPORT_COLUMNS])
+        self.assertEqual(len({row['code'] for row in rows}), 50)
+        self.assertEqual({row['batch'] for row in rows}, {rows[0]['batch']})
+        self.assertTrue(all(row['code'].startswith('SPA') and row['tub'] == str(self.tub.pk) and row['value'] == '15' for row in rows))
+        self.assertEqual(Discount.objects.filter(batch=rows[0]['batch'], used=False, is_multi_use=False).count(), 50)
+
+    def test_command_writes_an_output_file(self):
+        with tempfile.NamedTemporaryFile('r', suffix='.csv') as f:
+            call_command('generate_discount_codes', count=3, value=20, output=f.name, stderr=StringIO())
+            rows = self.rows(f.read())
+        self.assertEqual(len(rows), 3)
+        self.assertEqual({row['tub'] for row in rows}, {''})
+
+    def test_command_rejects_bad_input(self):
+        for options in [{'count': 0, 'value': 10}, {'count': 1, 'value': 101}, {'count': 1, 'value': 10, 'prefix': 'NO-DASH'}, {'count': 1, 'value': 10, 'tub': 0}]:
+            with self.subTest(options=options), self.assertRaises(CommandError):
+                call_command('generate_discount_codes', stdout=StringIO(), **options)
+        self.assertEqual(Discount.objects.count(), 1)
+
+    def test_collisions_are_regenerated(self):
+        # Round one draws an existing code and a repeat, round two collides with round one,
+        # round three makes up the shortfall.
+        drawn = iter(['TAKEN1', 'NEW1', 'NEW1', 'NEW2', 'NEW2', 'NEW3'])
+        with patch('base.promotions.random_code', lambda prefix, length: next(drawn)):
+            batch = generate_codes(3, 10)
+        self.assertEqual(sorted(Discount.objects.filter(batch=batch).values_list('main', flat=True)), ['NEW1', 'NEW2', 'NEW3'])
+        self.assertEqual(Discount.objects.get(main='TAKEN1').batch, None)
+
+    def test_manager_generates_over_the_api(self):
+        client = APIClient()
+        client.force_authenticate(self.manager)
+        response = client.post('/api/discounts/generate/', {'count': 5, 'value': 25, 'tub': self.tub.pk})
+        self.assertEqual(response.status_code, 201)
+        rows = self.rows(b''.join(response.streaming_content).decode())
+        self.assertEqual(len(rows), 5)
+        self.assertEqual({row['batch'] for row in rows}, {response['X-Discount-Batch']})
+
+        response = client.post('/api/discounts/generate/', {'count': MAX_GENERATED_CODES + 1, 'value': 25})
+        self.assertEqual(response.status_code, 400)
+
+
+class RatingAggregateTests(TestCase):
+    """The denormalized count, sum and histogram on Tub follow every rating write."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('guest', 'guest@example.com', 'password')
+        cls.other = CustomUser.objects.create_user('other', 'other@example.com', 'password')
+        cls.tub = Tub.objects.create(name='Tub', description='Hot tub', price_per_day=100)
+
+    def rate(self, user, stars):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post(f'/api/tubs/{self.tub.pk}/create_rating/', {'stars': stars})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assertAggregates(self, count, total, histogram):
+        tub = Tub.objects.get(pk=self.tub.pk)
+        self.assertEqual((tub.rating_count, tub.rating_sum), (count, total))
+        self.assertEqual([getattr(tub, f'stars_{n}') for n in range(1, 6)], histogram)
+
+    def test_first_rating(self):
+        self.assertEqual(self.rate(self.user, 4).data['message'], 'Rating Created')
+        self.assertAggregates(1, 4, [0, 0, 0, 1, 0])
+
+    def test_rating_twice_counts_once(self):
+        self.rate(self.user, 4)
+        self.assertEqual(self.rate(self.user, 4).data['message'], 'Rating updated')
+        self.assertAggregates(1, 4, [0, 0, 0, 1, 0])
+        self.assertEqual(Rating.objects.filter(user=self.user, tub=self.tub).count(), 1)
+
+    def test_concurrent_first_ratings_count_once(self):
+        self.rate(self.user, 2)
+        # As if the other first rating committed after this one looked: the insert hits the unique index.
+        real = ratings._update_rating
+        with patch('base.ratings._update_rating') as update:
+            update.side_effect = lambda *args: None if update.call_count == 1 else real(*args)
+            self.assertEqual(self.rate(self.user, 5).data['message'], 'Rating updated')
+        self.assertAggregates(1, 5, [0, 0, 0, 0, 1])
+
+    def test_list_stamp_moves_after_commit(self):
+        def versions():
+            return read_stamps(['tubs', f'tub:{self.tub.pk}'])[0]
+
+        before = versions()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.rate(self.user, 3)
+        during = versions()
+        self.assertEqual(during['tubs'], before['tubs'])
+        self.assertEqual(during[f'tub:{self.tub.pk}'], before[f'tub:{self.tub.pk}'] + 1)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(versions()['tubs'], before['tubs'] + 1)
+
+    def test_changed_rating(self):
+        self.rate(self.user, 2)
+        self.rate(self.other, 5)
+        self.rate(self.user, 3)
+        self.assertAggregates(2, 8, [0, 0, 1, 0, 1])
+
+    def test_deleted_rating(self):
+        self.rate(self.user, 2)
+        self.rate(self.other, 5)
+        Rating.objects.get(user=self.user).delete()
+        self.assertAggregates(1, 5, [0, 0, 0, 0, 1])
+
+
+class QuoteTests(TestCase):
+    """Quotes price whole weeks at the weekly rate, the rest per day, then take the discount off."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tub = Tub.objects.create(name='Tub', description='Hot tub', price_per_day=100, price_per_week=600)
+        cls.daily_tub = Tub.objects.create(name='Daily tub', description='Hot tub', price_per_day=80)
+        Discount.objects.create(main='TEN', value=10, active=True)
+        Discount.objects.create(main='OTHERTUB', value=50, active=True, tub=cls.daily_tub)
+
+    def setUp(self):
+        # The throttle history lives in the cache.
+        cache.clear()
+
+    def quote(self, *items):
+        response = APIClient().post('/api/quotes/', {'quotes': list(items)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data['quotes']
+
+    def test_weeks_and_days(self):
+        quote, = self.quote({'tub': self.tub.pk, 'start_date': '2030-01-01', 'end_date': '2030-01-10'})
+        self.assertEqual((quote['days'], quote['weeks'], quote['extra_days']), (10, 1, 3))
+        self.assertEqual(quote['total'], Decimal('900.00'))
+
+    def test_daily_rate_only(self):
+        quote, = self.quote({'tub': self.daily_tub.pk, 'start_date': '2030-01-01', 'end_date': '2030-01-10'})
+        self.assertEqual((quote['weeks'], quote['extra_days'], quote['total']), (0, 10, Decimal('800.00')))
+
+    def test_discount(self):
+        quote, = self.quote({'tub': self.tub.pk, 'start_date': '2030-01-01', 'end_date': '2030-01-02', 'code': 'TEN'})
+        self.assertEqual((quote['subtotal'], quote['discount_amount'], quote['total']), (Decimal('200.00'), Decimal('20.00'), Decimal('180.00')))
+
+    def test_discount_errors(self):
+        wrong_tub, unknown = self.quote(
+            {'tub': self.tub.pk, 'start_date': '2030-01-01', 'end_date': '2030-01-01', 'code': 'OTHERTUB'},
+            {'tub': self.tub.pk, 'start_date': '2030-01-01', 'end_date': '2030-01-01', 'code': 'NOPE'},
+        )
+        self.assertEqual(wrong_tub['discount_error'], 'This is not the right code for this tub')
+        self.assertEqual(unknown['discount_error'], 'This code does not exist')
+        self.assertEqual(wrong_tub['total'], Decimal('100.00'))
+
+    def test_distinct_codes_are_capped(self):
+        items = [{'tub': self.tub.pk, 'start_date': '2030-01-01', 'end_date': '2030-01-01', 'code': f'GUESS{i}'} for i in range(MAX_QUOTE_CODES + 1)]
+        response = APIClient().post('/api/quotes/', {'quotes': items}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_throttled(self):
+        item = {'tub': self.tub.pk, 'start_date': '2030-01-01', 'end_date': '2030-01-01'}
+        with patch.object(ScopedRateThrottle, 'THROTTLE_RATES', {'quotes': '2/min'}):
+            statuses = [APIClient().post('/api/quotes/', {'quotes': [item]}, format='json').status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+
+    def test_price_change_reaches_quotes(self):
+        item = {'tub': self.tub.pk, 'start_date': '2030-01-01', 'end_date': '2030-01-01'}
+        self.assertEqual(self.quote(item)[0]['total'], Decimal('100.00'))
+        tub = Tub.objects.get(pk=self.tub.pk)
+        tub.price_per_day = 150
+        with self.captureOnCommitCallbacks(execute=True):
+            tub.save()
+        self.assertEqual(self.quote(item)[0]['total'], Decimal('150.00'))
+
+    def test_cached_rates_skip_the_database(self):
+        tub_ids = [self.tub.pk, self.daily_tub.pk]
+        with self.assertNumQueries(2):
+            rate_tables(tub_ids)
+        with self.assertNumQueries(0):
+            self.assertEqual(rate_tables(tub_ids)[self.tub.pk], (Decimal('100.00'), Decimal('600.00')))
+
+    def test_stale_rates_revalidated_against_the_stamp(self):
+        rate_tables([self.tub.pk])
+        later = time.time() + RATES_REVALIDATE
+        with patch('base.pricing.time.time', return_value=later), self.assertNumQueries(1):
+            rate_tables([self.tub.pk])
+        # A write whose invalidation was missed: the stamp still gives it away.
+        Tub.objects.filter(pk=self.tub.pk).update(price_per_day=120)
+        bump(*tub_keys(self.tub.pk))
+        with patch('base.pricing.time.time', return_value=later):
+            self.assertEqual(rate_tables([self.tub.pk])[self.tub.pk].per_day, Decimal('100.00'))
+        with patch('base.pricing.time.time', return_value=later + RATES_REVALIDATE), self.assertNumQueries(2):
+            self.assertEqual(rate_tables([self.tub.pk])[self.tub.pk].per_day, Decimal('120.00'))
+
+
+def metrics_route(path):
+    # The label the middleware records: the URL pattern, router regex anchors stripped.
+    return resolve(path).route.replace('^', '').replace('$', '')
+
+
+def png_bytes(size=(40, 30)):
+    buffer = BytesIO()
+    PILImage.new('RGB', size, (200, 80, 40)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def use_temporary_media(test):
+    # The configured storage is Cloudinary, even in development. Django 5.0 drops the
+    # OPTIONS of an overridden default storage, so the location comes from MEDIA_ROOT.
+    media = tempfile.TemporaryDirectory()
+    test.addCleanup(media.cleanup)
+    test.enterContext(override_settings(MEDIA_ROOT=media.name, STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    }))
+    test.assertEqual(default_storage.location, media.name)
+
+
+@override_settings(DERIVATIVE_WORKERS=0)
+class ImageDerivativeTests(TestCase):
+    """Derivatives are built once, after commit or on first hit, never on the save itself."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tub = Tub.objects.create(name='Tub', description='Hot tub', price_per_day=100)
+
+    def setUp(self):
+        use_temporary_media(self)
+        cache.clear()
+
+    def add_image(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            image = Image.objects.create(tub=self.tub, image=SimpleUploadedFile('tub.png', png_bytes()))
+        self.assertEqual(Image.objects.get(pk=image.pk).derivatives, {})
+        return image, callbacks
+
+    def test_built_after_commit(self):
+        image, callbacks = self.add_image()
+        for callback in callbacks:
+            callback()
+        derivatives = Image.objects.get(pk=image.pk).derivatives
+        self.assertEqual(derivatives['source'], image.image.name)
+        self.assertEqual(derivatives['thumbnail']['width'], 40)
+
+    def test_lazy_endpoint(self):
+        image, _ = self.add_image()
+        url = f'/api/images/image/{image.pk}/medium.webp'
+        first = APIClient().get(url, HTTP_HOST='localhost')
+        self.assertEqual((first.status_code, first['Location']), (302, image.image.url))
+        second = APIClient().get(url, HTTP_HOST='localhost')
+        self.assertEqual(second['Location'], default_storage.url(Image.objects.get(pk=image.pk).derivatives['medium']['webp']))
+
+    def test_one_build_at_a_time(self):
+        image, _ = self.add_image()
+        cache.add(f'derivatives:build:image:{image.pk}', 1)
+        response = APIClient().get(f'/api/images/image/{image.pk}/medium.webp', HTTP_HOST='localhost')
+        self.assertEqual(response['Location'], image.image.url)
+        self.assertEqual(Image.objects.get(pk=image.pk).derivatives, {})
+
+    def test_build_leaves_catalogue_stamp(self):
+        image, callbacks = self.add_image()
+        before = dict(ResourceVersion.objects.values_list('key', 'version'))
+        for callback in callbacks:
+            callback()
+        after = dict(ResourceVersion.objects.values_list('key', 'version'))
+        self.assertEqual(after['tubs'], before['tubs'])
+        self.assertEqual(after[f'tub:{self.tub.pk}'], before[f'tub:{self.tub.pk}'] + 1)
+
+
+@override_settings(UPLOAD_BACKEND='local', DERIVATIVE_WORKERS=0)
+class LocalUploadTests(TestCase):
+    """Ticket, PUT, confirm: only images are stored and confirming never reads the file."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = CustomUser.objects.create_user('manager', 'manager@example.com', 'password', is_manager=True)
+        cls.tub = Tub.objects.create(name='Tub', description='Hot tub', price_per_day=100)
+
+    def setUp(self):
+        use_temporary_media(self)
+        cache.clear()
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.client.force_authenticate(self.manager)
+
+    def upload(self, content):
+        ticket = self.client.post('/api/uploads/', {'kind': 'logo', 'filename': 'logo.png', 'tub': self.tub.pk}).data
+        response = APIClient(HTTP_HOST='localhost').put(ticket['upload']['url'], content, content_type='image/png')
+        return ticket, response
+
+    def test_rejects_non_images(self):
+        ticket, response = self.upload(b'<?php echo 1; ?>')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(default_storage.exists(ticket['key']))
+
+    def test_confirm_defers_derivatives(self):
+        ticket, response = self.upload(png_bytes())
+        self.assertEqual(response.status_code, 204)
+
+        stamps = dict(ResourceVersion.objects.values_list('key', 'version'))
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/uploads/confirm/', {'ticket': ticket['ticket']})
+        self.assertEqual(response.status_code, 200)
+        tub = Tub.objects.get(pk=self.tub.pk)
+        self.assertEqual((tub.logo_img.name, tub.logo_derivatives), (ticket['key'], {}))
+        self.assertEqual(ResourceVersion.objects.get(key='tubs').version, stamps['tubs'] + 1)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(Tub.objects.get(pk=self.tub.pk).logo_derivatives['source'], ticket['key'])
+
+
+class ReservationTransitionTests(TestCase):
+    """Only pending reservations move, and only active ones hold days in the index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = CustomUser.objects.create_user('manager', 'manager@example.com', 'password', is_manager=True)
+        cls.guest = CustomUser.objects.create_user('guest', 'guest@example.com', 'password')
+        cls.tub = Tub.objects.create(name='Tub', description='Hot tub', price_per_day=100)
+
+    def setUp(self):
+        self.reservation = Reservation.objects.create(
+            tub=self.tub, user=self.guest, price=100, counted_price=300,
+            start_date=date(2030, 1, 1), end_date=date(2030, 1, 3),
+        )
+
+    def patch(self, user, action):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.patch(f'/api/reservations/{self.reservation.pk}/{action}/')
+
+    def assertStatus(self, expected, days):
+        self.assertEqual(Reservation.objects.get(pk=self.reservation.pk).status, expected)
+        self.assertEqual(ReservedDay.objects.filter(reservation=self.reservation).count(), days)
+
+    def test_guest_cannot_accept(self):
+        self.assertEqual(self.patch(self.guest, 'accept_reservation').status_code, 403)
+        self.assertStatus(Reservation.Status.PENDING, 3)
+
+    def test_accept(self):
+        self.assertEqual(self.patch(self.manager, 'accept_reservation').status_code, 200)
+        self.assertStatus(Reservation.Status.ACCEPTED, 3)
+        self.assertTrue(all(ReservedDay.objects.filter(reservation=self.reservation).values_list('accepted', flat=True)))
+
+    def test_reject_drops_days(self):
+        self.assertEqual(self.patch(self.manager, 'reject_reservation').status_code, 200)
+        self.assertStatus(Reservation.Status.REJECTED, 0)
+
+    def test_guest_cancels_own(self):
+        self.assertEqual(self.patch(self.guest, 'cancel_reservation').status_code, 200)
+        self.assertStatus(Reservation.Status.CANCELLED, 0)
+
+    def test_other_guest_cannot_cancel(self):
+        other = CustomUser.objects.create_user('other', 'other@example.com', 'password')
+        self.assertEqual(self.patch(other, 'cancel_reservation').status_code, 403)
+        self.assertStatus(Reservation.Status.PENDING, 3)
+
+    def test_conflict_when_not_pending(self):
+        self.patch(self.manager, 'reject_reservation')
+        response = self.patch(self.manager, 'accept_reservation')
+        self.assertEqual((response.status_code, response.data['message']), (409, 'Reservation is already rejected'))
+        self.assertStatus(Reservation.Status.REJECTED, 0)
+
+    def test_expire(self):
+        later = Reservation.objects.create(tub=self.tub, user=self.guest, price=100, counted_price=100, start_date=date(2030, 2, 1), end_date=date(2030, 2, 1))
+        self.assertEqual(expire_reservations(date(2030, 1, 15)), 1)
+        self.assertStatus(Reservation.Status.EXPIRED, 0)
+        self.assertEqual(Reservation.objects.get(pk=later.pk).status, Reservation.Status.PENDING)
+
+
+class OverlapTests(TestCase):
+    """
+    A tub cannot be booked twice for the same day: the exclusion constraint on
+    PostgreSQL, the locked day index check on other databases.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.guest = CustomUser.objects.create_user('guest', 'guest@example.com', 'password')
+        cls.tub = Tub.objects.create(name='Tub', description='Hot tub', price_per_day=100)
+        cls.other_tub = Tub.objects.create(name='Other tub', description='Hot tub', price_per_day=100)
+
+    def book(self, tub, start, end):
+        with transaction.atomic():
+            return book_tub(tub, date.fromisoformat(start), date.fromisoformat(end), user=self.guest, price=100, counted_price=100)
+
+    def test_overlap_rejected(self):
+        self.book(self.tub, '2030-01-05', '2030-01-10')
+        for start, end in [('2030-01-01', '2030-01-05'), ('2030-01-10', '2030-01-12'), ('2030-01-06', '2030-01-07'), ('2030-01-01', '2030-01-20')]:
+            with self.subTest(start=start, end=end), self.assertRaises(TubUnavailable):
+                self.book(self.tub, start, end)
+        self.assertEqual(Reservation.objects.filter(tub=self.tub).count(), 1)
+
+    def test_adjacent_and_other_tub_allowed(self):
+        self.book(self.tub, '2030-01-05', '2030-01-10')
+        self.book(self.tub, '2030-01-11', '2030-01-12')
+        self.book(self.tub, '2030-01-01', '2030-01-04')
+        self.book(self.other_tub, '2030-01-05', '2030-01-10')
+        self.assertEqual(Reservation.objects.count(), 4)
+
+    def test_released_dates_can_be_booked(self):
+        reservation = self.book(self.tub, '2030-01-05', '2030-01-10')
+        transition_reservation(reservation.pk, Reservation.Status.CANCELLED)
+        self.book(self.tub, '2030-01-06', '2030-01-07')
+
+    def test_endpoint_reports_overlap(self):
+        self.book(self.tub, '2030-01-05', '2030-01-10')
+        client = APIClient()
+        client.force_authenticate(self.guest)
+        response = client.post(f'/api/tubs/{self.tub.pk}/create_reservation/', {
+            'start_date': '2030-01-09', 'end_date': '2030-01-11', 'city': 'Krakow', 'street': 'Dluga', 'home_number': '1',
+        })
+        self.assertEqual((response.status_code, response.data['message']), (400, 'This tub is already reserved for the selected dates'))
+        self.assertFalse(Address.objects.exists())
+
+
+class AvailabilityTests(TestCase):
+    """The availability endpoint reads the day index for a bounded window of some tubs."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.guest = CustomUser.objects.create_user('guest', 'guest@example.com', 'password')
+        cls.tub = Tub.objects.create(name='Tub', description='Hot tub', price_per_day=100)
+        cls.other_tub = Tub.objects.create(name='Other tub', description='Hot tub', price_per_day=100)
+        for start, end, status in [
+            (date(2030, 1, 2), date(2030, 1, 3), Reservation.Status.ACCEPTED),
+            (date(2030, 1, 3), date(2030, 1, 3), Reservation.Status.PENDING),
+            (date(2030, 1, 5), date(2030, 1, 5), Reservation.Status.REJECTED),
+        ]:
+            Reservation.objects.create(tub=cls.tub, user=cls.guest, price=100, counted_price=100, start_date=start, end_date=end, status=status)
+
+    def get(self, **params):
+        return APIClient().get('/api/availability/', params)
+
+    def test_booked_and_free_days(self):
+        response = self.get(tubs=f'{self.tub.pk},{self.other_tub.pk}', **{'from': '2030-01-01', 'to': '2030-01-05'})
+        self.assertEqual(response.status_code, 200)
+        booked, free = response.data['tubs']
+        self.assertEqual((booked['tub'], free['tub']), (self.tub.pk, self.other_tub.pk))
+        self.assertEqual(booked['free_days'], [date(2030, 1, 1), date(2030, 1, 4), date(2030, 1, 5)])
+        self.assertEqual(booked['booked_days'], [{'day': date(2030, 1, 2), 'accepted': True}, {'day': date(2030, 1, 3), 'accepted': True}])
+        self.assertEqual(len(free['free_days']), 5)
+        self.assertEqual(free['booked_days'], [])
+
+    def test_window_defaults_to_the_next_30_days(self):
+        tub_ids, start, end = parse_window({'tubs': f' {self.tub.pk} ,'})
+        self.assertEqual((tub_ids, start, end), ([self.tub.pk], timezone.localdate(), timezone.localdate() + timedelta(days=30)))
+        self.assertEqual(parse_window({'tubs': '1', 'from': '2030-01-01'})[1:], (date(2030, 1, 1), date(2030, 1, 31)))
+
+    def test_longest_window(self):
+        self.assertEqual(parse_window({'tubs': '1', 'from': '2030-01-01', 'to': '2030-01-01'})[1:], (date(2030, 1, 1), date(2030, 1, 1)))
+        end = date(2030, 1, 1) + timedelta(days=MAX_WINDOW_DAYS - 1)
+        self.assertEqual(parse_window({'tubs': '1', 'from': '2030-01-01', 'to': end.isoformat()})[2], end)
+        response = self.get(tubs=f'{self.tub.pk}', **{'from': '2030-01-01', 'to': end.isoformat()})
+        self.assertEqual(len(response.data['tubs'][0]['free_days']), MAX_WINDOW_DAYS - 2)
+
+    def test_invalid_windows(self):
+        too_long = (date(2030, 1, 1) + timedelta(days=MAX_WINDOW_DAYS)).isoformat()
+        for params in [
+            {}, {'tubs': ','}, {'tubs': '1,x'},
+            {'tubs': '1', 'from': '2030-01-10', 'to': '2030-01-09'},
+            {'tubs': '1', 'from': '2030-01-01', 'to': too_long},
+            {'tubs': '1', 'from': '2030-02-30'}, {'tubs': '1', 'from': '01.01.2030'}, {'tubs': '1', 'to': 'soon'},
+        ]:
+            with self.subTest(params=params):
+                with self.assertRaises(ValueError):
+                    parse_window(params)
+                response = self.get(**params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('message', response.data)
+
+
+class BulkModerationTests(TestCase):
+    """Bulk actions report one outcome per requested id, in request order."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = CustomUser.objects.create_user('manager', 'manager@example.com', 'password', is_manager=True)
+        cls.tub = Tub.objects.create(name='Tub', description='Hot tub', price_per_day=100)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+        self.pending, self.accepted, self.rejected = [
+            Reservation.objects.create(
+                tub=self.tub, user=self.manager, price=100, counted_price=100,
+                start_date=date(2030, 1, 1 + i * 2), end_date=date(2030, 1, 1 + i * 2), status=status,
+            )
+            for i, status in enumerate([Reservation.Status.PENDING, Reservation.Status.ACCEPTED, Reservation.Status.REJECTED])
+        ]
+
+    def test_bulk_accept_outcomes(self):
+        ids = [self.rejected.pk, self.pending.pk, 999999, self.accepted.pk]
+        response = self.client.post('/api/reservations/bulk_accept/', {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [
+            {'id': self.rejected.pk, 'outcome': 'already_rejected'},
+            {'id': self.pending.pk, 'outcome': 'accepted'},
+            {'id': 999999, 'outcome': 'not_found'},
+            {'id': self.accepted.pk, 'outcome': 'already_accepted'},
+        ])
+        self.assertTrue(all(ReservedDay.objects.filter(reservation=self.pending).values_list('accepted', flat=True)))
+
+    def test_bulk_accept_by_filter(self):
+        response = self.client.post('/api/reservations/bulk_accept/', {'filter': {'status': 'pending'}}, format='json')
+        self.assertEqual(response.data['results'], [{'id': self.pending.pk, 'outcome': 'accepted'}])
+
+    def test_bulk_delete_outcomes(self):
+        response = self.client.post('/api/reservations/bulk_delete/', {'ids': [self.pending.pk, 999999]}, format='json')
+        self.assertEqual(response.data['results'], [{'id': self.pending.pk, 'outcome': 'deleted'}, {'id': 999999, 'outcome': 'not_found'}])
+        self.assertFalse(Reservation.objects.filter(pk=self.pending.pk).exists())
+        self.assertFalse(ReservedDay.objects.filter(reservation_id=self.pending.pk).exists())
+
+    def test_filter_worked_through_in_batches(self):
+        with patch('base.views.BULK_MAX_RESERVATIONS', 2), patch('base.moderation.BULK_MAX_RESERVATIONS', 2):
+            response = self.client.post('/api/reservations/bulk_accept/', {'filter': {'status': 'all'}}, format='json')
+            self.assertEqual((response.data['count'], response.data['next_after']), (1, self.accepted.pk))
+            self.assertEqual([result['id'] for result in response.data['results']], [self.pending.pk, self.accepted.pk])
+            self.assertIn('"after"', response.data['message'])
+
+            body = {'filter': {'status': 'all'}, 'after': response.data['next_after']}
+            response = self.client.post('/api/reservations/bulk_accept/', body, format='json')
+            self.assertEqual(response.data['results'], [{'id': self.rejected.pk, 'outcome': 'already_rejected'}])
+            self.assertEqual((response.data['count'], response.data['next_after']), (0, None))
+
+    def test_filter_matching_exactly_the_cap_is_not_cut_short(self):
+        with patch('base.views.BULK_MAX_RESERVATIONS', 3), patch('base.moderation.BULK_MAX_RESERVATIONS', 3):
+            response = self.client.post('/api/reservations/bulk_delete/', {'filter': {}}, format='json')
+        self.assertEqual((response.data['count'], response.data['next_after']), (3, None))
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_ids_are_never_cut_short(self):
+        with patch('base.views.BULK_MAX_RESERVATIONS', 2), patch('base.moderation.BULK_MAX_RESERVATIONS', 2):
+            response = self.client.post('/api/reservations/bulk_delete/', {'ids': [self.pending.pk, self.rejected.pk]}, format='json')
+        self.assertEqual((response.data['count'], response.data['next_after']), (2, None))
+
+    def test_bad_targets(self):
+        for body in [
+            {}, {'ids': [], 'filter': {}}, {'ids': []}, {'ids': ['x']}, {'filter': {'status': 'lost'}},
+            {'filter': {}, 'after': 'x'}, {'filter': {}, 'after': True}, {'ids': [1], 'after': 1},
+        ]:
+            with self.subTest(body=body):
+                self.assertEqual(self.client.post('/api/reservations/bulk_delete/', body, format='json').status_code, 400)
+        self.assertEqual(Reservation.objects.count(), 3)
+
+
+class DiscountRedemptionTests(TestCase):
+    """A single-use code books one reservation; multi-use codes keep working."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.guest = CustomUser.objects.create_user('guest', 'guest@example.com', 'password')
+        cls.tub = Tub.objects.create(name='Tub', description='Hot tub', price_per_day=100)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.guest)
+
+    def book(self, code, day):
+        return self.client.post(f'/api/tubs/{self.tub.pk}/create_reservation/', {
+            'start_date': f'2030-01-{day:02}', 'end_date': f'2030-01-{day:02}', 'discount_code': code,
+            'city': 'Krakow', 'street': 'Dluga', 'home_number': '1',
+        }, format='json')
+
+    def test_single_use(self):
+        discount = Discount.objects.create(main='ONCE', value=20, active=True)
+        first = self.book('ONCE', 1)
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(first.data['result']['counted_price'], '80.00')
+        second = self.book('ONCE', 3)
+        self.assertEqual((second.status_code, second.data['message']), (400, 'This code has already been used'))
+        discount.refresh_from_db()
+        self.assertEqual((discount.used, discount.active), (True, False))
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def test_redeem_twice(self):
+        discount = Discount.objects.create(main='ONCE', value=20, active=True)
+        stale = Discount.objects.get(pk=discount.pk)
+        redeem_discount(discount)
+        with self.assertRaises(DiscountUnavailable):
+            redeem_discount(stale)
+
+    def test_failed_booking_keeps_code(self):
+        Discount.objects.create(main='ONCE', value=20, active=True)
+        self.book(None, 1)
+        self.assertEqual(self.book('ONCE', 1).status_code, 400)
+        self.assertEqual(self.book('ONCE', 5).status_code, 201)
+
+    def test_multi_use(self):
+        Discount.objects.create(main='ALWAYS', value=10, active=True, is_multi_use=True)
+        self.assertEqual(self.book('ALWAYS', 1).status_code, 201)
+        self.assertEqual(self.book('ALWAYS', 3).status_code, 201)
+
+
+class MetricsTests(TestCase):
+    """Every request is timed and its queries counted; /metrics serves the totals to managers."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = CustomUser.objects.create_user('manager', 'manager@example.com', 'password', is_manager=True)
+        cls.guest = CustomUser.objects.create_user('guest', 'guest@example.com', 'password')
+        cls.tub = Tub.objects.create(name='Tub', description='Hot tub', price_per_day=100)
+
+    def series(self, path, status=200):
+        return process_snapshot().get((metrics_route(path), 'GET', status), [0] * SERIES_LENGTH)
+
+    def test_server_timing_header(self):
+        response = APIClient().get(f'/api/tubs/{self.tub.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries"$')
+
+    @override_settings(METRICS_SERVER_TIMING=False)
+    def test_server_timing_disabled(self):
+        self.assertNotIn('Server-Timing', APIClient().get(f'/api/tubs/{self.tub.pk}/'))
+
+    def test_queries_counted_per_route(self):
+        path = f'/api/tubs/{self.tub.pk}/'
+        before = self.series(path)
+        response = APIClient().get(path)
+        queries = int(re.search(r'"(\d+) queries"', response['Server-Timing']).group(1))
+        self.assertGreater(queries, 0)
+        after = self.series(path)
+        self.assertEqual(after[COUNT] - before[COUNT], 1)
+        self.assertEqual(after[QUERIES] - before[QUERIES], queries)
+
+    def test_metrics_for_managers_only(self):
+        self.assertEqual(APIClient().get('/metrics').status_code, 401)
+        client = APIClient()
+        client.force_authenticate(self.guest)
+        self.assertEqual(client.get('/metrics').status_code, 403)
+
+        APIClient().get(f'/api/tubs/{self.tub.pk}/')
+        client.force_authenticate(self.manager)
+        response = client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('# TYPE http_requests_total counter', body)
+        route = metrics_route(f'/api/tubs/{self.tub.pk}/').replace('\\', '\\\\')
+        self.assertIn(f'http_requests_total{{route="{route}",method="GET",status="200"}}', body)
+        self.assertIn('db_queries_total{', body)
+
+
+class SearchTests(TestCase):
+    """Matches are ranked title first, and the index follows every insert, update and delete."""
+
+    def titles(self, query, scopes=('tubs', 'faq')):
+        return [hit['title'] for hit in search(query.split(), list(scopes), 20)]
+
+    def test_title_match_ranks_first(self):
+        Tub.objects.create(name='Balia świerkowa', description='Z piecem, wkład cedrowa żywica', price_per_day=100)
+        Tub.objects.create(name='Sauna cedrowa', description='Piec opalany drewnem', price_per_day=100)
+        self.assertEqual(self.titles('cedrowa'), ['Sauna <mark>cedrowa</mark>', 'Balia świerkowa'])
+
+    def test_prefix_and_all_terms(self):
+        Tub.objects.create(name='Sauna cedrowa', description='Piec opalany drewnem', price_per_day=100)
+        Tub.objects.create(name='Sauna sosnowa', description='Piec elektryczny', price_per_day=100)
+        self.assertEqual(self.titles('sau cedr'), ['<mark>Sauna</mark> <mark>cedrowa</mark>'])
+
+    def test_snippet_is_escaped(self):
+        Faq.objects.create(question='<b>Jak</b> rozpalić piec?', answer='Drewnem.', is_published=True)
+        self.assertEqual(self.titles('piec', ['faq']), ['&lt;b&gt;Jak&lt;/b&gt; rozpalić <mark>piec</mark>?'])
+
+    def test_tub_index_follows_writes(self):
+        tub = Tub.objects.create(name='Balia cedrowa', description='Hot tub', price_per_day=100)
+        self.assertEqual(len(self.titles('cedrowa')), 1)
+        tub.name = 'Balia sosnowa'
+        tub.save()
+        self.assertEqual(self.titles('cedrowa'), [])
+        self.assertEqual(len(self.titles('sosnowa')), 1)
+        Tub.objects.filter(pk=tub.pk).update(description='Z jacuzzi')
+        self.assertEqual(len(self.titles('jacuzzi')), 1)
+        tub.delete()
+        self.assertEqual(self.titles('sosnowa'), [])
+        self.assertEqual(self.titles('jacuzzi'), [])
+
+    def test_faq_index_follows_writes(self):
+        faq = Faq.objects.create(question='Czy dowozicie balie?', answer='Tak, w całej Polsce.', is_published=True)
+        self.assertEqual(len(self.titles('dowozicie', ['faq'])), 1)
+        faq.answer = 'Tylko w Małopolsce.'
+        faq.save()
+        self.assertEqual(self.titles('polsce', ['faq']), [])
+        self.assertEqual(len(self.titles('małopolsce', ['faq'])), 1)
+        faq.delete()
+        self.assertEqual(self.titles('dowozicie', ['faq']), [])
+
+    def test_unpublished_faq_hidden(self):
+        Faq.objects.create(question='Czy dowozicie balie?', answer='Tak.')
+        self.assertEqual(self.titles('dowozicie', ['faq']), [])
+
+    def test_endpoint(self):
+        Tub.objects.create(name='Sauna cedrowa', description='Piec opalany drewnem', price_per_day=100)
+        response = APIClient().get('/api/search/', {'q': 'cedrowa', 'scope': 'tubs'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([hit['type'] for hit in response.data['results']], ['tub'])
+        self.assertEqual(APIClient().get('/api/search/').status_code, 400)
+
+
+class SearchCheckTests(TestCase):
+    def test_unsupported_vendor(self):
+        with patch.object(connection, 'vendor', 'oracle'):
+            errors = check_search_backend(None)
+        self.assertEqual([error.id for error in errors], ['base.E001'])
+        self.assertEqual(check_search_backend(None), [])
+
+    def test_dropped_trigger(self):
+        self.assertEqual(check_search_triggers(None, databases=['default']), [])
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER base_tub_fts_au')
+        errors = check_search_triggers(None, databases=['default'])
+        self.assertEqual([error.id for error in errors], ['base.E002'])
+        self.assertIn('base_tub_fts_au', errors[0].msg)
+
+
+class AsyncUrls:
+    # The URLconf of SERVER_MODE=asgi; settings are read once, so the tests mount it themselves.
+    urlpatterns = [path('api/', include(async_urlpatterns() + urls.urlpatterns))]
+
+
+@override_settings(ROOT_URLCONF=AsyncUrls)
+class AsyncViewTests(TestCase):
+    """The async read endpoints answer like the sync views they stand in for."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.guest = CustomUser.objects.create_user('guest', 'guest@example.com', 'password')
+        cls.tub = Tub.objects.create(name='Sauna cedrowa', description='Hot tub', price_per_day=100)
+        cls.other = Tub.objects.create(name='Balia', description='Hot tub', price_per_day=300)
+        Rating.objects.create(tub=cls.tub, user=cls.guest, stars=4)
+        Faq.objects.create(question='Published?', answer='Yes', is_published=True)
+        Faq.objects.create(question='Hidden?', answer='No')
+        Reservation.objects.create(
+            tub=cls.tub, user=cls.guest, price=100, counted_price=200,
+            start_date=date(2030, 1, 2), end_date=date(2030, 1, 3),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_tub_list(self):
+        response = await self.async_client.get('/api/tubs/', {'ordering': 'price'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([tub['name'] for tub in response.json()['results']], ['Sauna cedrowa', 'Balia'])
+        cached = await self.async_client.get('/api/tubs/', {'ordering': 'price'})
+        self.assertEqual(cached.json(), response.json())
+        self.assertEqual((await self.async_client.get('/api/tubs/', {'ordering': 'price'}, headers={'If-None-Match': response['ETag']})).status_code, 304)
+
+    async def test_tub_list_filters(self):
+        response = await self.async_client.get('/api/tubs/', {'from': '2030-01-03', 'to': '2030-01-05'})
+        self.assertEqual([tub['name'] for tub in response.json()['results']], ['Balia'])
+        response = await self.async_client.get('/api/tubs/', {'min_price': 'cheap'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('message', response.json())
+
+    async def test_tub_detail(self):
+        response = await self.async_client.get(f'/api/tubs/{self.tub.pk}/')
+        self.assertEqual((response.status_code, response.json()['name']), (200, 'Sauna cedrowa'))
+        self.assertEqual((await self.async_client.get('/api/tubs/0/')).status_code, 404)
+
+    async def test_writes_fall_back_to_sync_view(self):
+        response = await self.async_client.patch(f'/api/tubs/{self.tub.pk}/', {'price_per_day': 'free'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('price_per_day', response.json())
+
+    async def test_rating_list(self):
+        response = await self.async_client.get(f'/api/tubs/{self.tub.pk}/rating_list/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(rating['tub_name'], rating['stars']) for rating in response.json()['results']], [('Sauna cedrowa', 4)])
+        self.assertEqual((await self.async_client.get('/api/tubs/0/rating_list/')).status_code, 404)
+
+    async def test_published_faq(self):
+        response = await self.async_client.get('/api/faq/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([faq['question'] for faq in response.json()['results']], ['Published?'])
+
+    async def test_availability(self):
+        response = await self.async_client.get('/api/availability/', {'tubs': f'{self.tub.pk}', 'from': '2030-01-01', 'to': '2030-01-04'})
+        self.assertEqual(response.status_code, 200)
+        [tub] = response.json()['tubs']
+        self.assertEqual(tub['free_days'], ['2030-01-01', '2030-01-04'])
+        self.assertEqual(tub['booked_days'], [{'day': '2030-01-02', 'accepted': False}, {'day': '2030-01-03', 'accepted': False}])
+        response = await self.async_client.get('/api/availability/', {'tubs': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ResponseCacheTests(TestCase):
+    """Cached bodies are reused until a stamp moves, per host, and only one request fills a cold entry."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tub = Tub.objects.create(name='Sauna', description='Hot tub', price_per_day=100)
+        Tub.objects.create(name='Balia', description='Hot tub', price_per_day=200)
+
+    def setUp(self):
+        cache.clear()
+
+    def names(self, **extra):
+        return [tub['name'] for tub in APIClient().get('/api/tubs/', {'ordering': 'price'}, **extra).data['results']]
+
+    def test_served_until_bump(self):
+        self.assertEqual(self.names(), ['Sauna', 'Balia'])
+        # update() sends no signal: the cached page is still served.
+        Tub.objects.filter(pk=self.tub.pk).update(name='Sauna cedrowa')
+        self.assertEqual(self.names(), ['Sauna', 'Balia'])
+        bump('tubs')
+        self.assertEqual(self.names(), ['Sauna cedrowa', 'Balia'])
+
+    @override_settings(ALLOWED_HOSTS=['one.example', 'two.example'])
+    def test_links_follow_the_host(self):
+        query = {'ordering': 'price', 'page_size': 1}
+        first = APIClient().get('/api/tubs/', query, HTTP_HOST='one.example')
+        second = APIClient().get('/api/tubs/', query, HTTP_HOST='two.example')
+        self.assertTrue(first.data['next'].startswith('http://one.example/api/tubs/'))
+        self.assertTrue(second.data['next'].startswith('http://two.example/api/tubs/'))
+
+    def test_one_computation_per_cold_key(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'page'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(get_or_compute('test:stampede', compute))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((len(calls), results), (1, ['page'] * 5))
+
+    def test_waiters_compute_once_the_lock_is_gone(self):
+        cache.add('test:orphan:lock', 1)
+        # The holder dies without storing a value.
+        with patch('base.response_cache.time.sleep', side_effect=lambda seconds: cache.delete('test:orphan:lock')):
+            self.assertEqual(get_or_compute('test:orphan', lambda: 'page'), 'page')
+
+
+class ConditionalRequestTests(TestCase):
+    """ETag and Last-Modified come from the version stamps; a matching request gets a bodiless 304."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tub = Tub.objects.create(name='Sauna', description='Hot tub', price_per_day=100)
+
+    def setUp(self):
+        cache.clear()
+        self.url = f'/api/tubs/{self.tub.pk}/'
+
+    def test_if_none_match(self):
+        response = APIClient().get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            not_modified = APIClient().get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((not_modified.status_code, not_modified.content), (304, b''))
+        self.assertEqual(APIClient().get(self.url, HTTP_IF_NONE_MATCH='W/"other"').status_code, 200)
+
+    def test_if_modified_since(self):
+        last_modified = APIClient().get(self.url)['Last-Modified']
+        self.assertEqual(APIClient().get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.assertEqual(APIClient().get(self.url, HTTP_IF_MODIFIED_SINCE='Mon, 01 Jan 2001 00:00:00 GMT').status_code, 200)
+
+    def test_write_moves_the_etag(self):
+        etag = APIClient().get(self.url)['ETag']
+        tub = Tub.objects.get(pk=self.tub.pk)
+        tub.name = 'Sauna cedrowa'
+        tub.save()
+        response = APIClient().get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.data['name']), (200, 'Sauna cedrowa'))
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_varies_with_the_query(self):
+        self.assertNotEqual(APIClient().get('/api/tubs/')['ETag'], APIClient().get('/api/tubs/', {'ordering': 'price'})['ETag'])
+
+
+class ReservationExportTests(TestCase):
+    """Exports stream every matching reservation, one row each, in CSV or NDJSON."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = CustomUser.objects.create_user('manager', 'manager@example.com', 'password', is_manager=True)
+        cls.guest = CustomUser.objects.create_user('guest', 'guest@example.com', 'password')
+        cls.tub = Tub.objects.create(name='Sauna', description='Hot tub', price_per_day=100)
+        other = Tub.objects.create(name='Balia', description='Hot tub', price_per_day=200)
+        for tub, start, status in [
+            (cls.tub, date(2030, 1, 1), Reservation.Status.PENDING),
+            (cls.tub, date(2030, 2, 1), Reservation.Status.ACCEPTED),
+            (other, date(2030, 1, 1), Reservation.Status.PENDING),
+        ]:
+            reservation = Reservation.objects.create(
+                tub=tub, user=cls.guest, price=100, counted_price=300, start_date=start, end_date=start + timedelta(days=2), status=status,
+            )
+            Address.objects.create(reservation=reservation, city='Kraków', street='Długa', home_number='1')
+
+    def export(self, **params):
+        client = APIClient()
+        client.force_authenticate(self.manager)
+        return client.get('/api/reservations/export/', params)
+
+    def test_csv(self):
+        response = self.export(tub=self.tub.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="reservations.csv"')
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], [header for header, _ in RESERVATION_EXPORT_COLUMNS])
+        self.assertEqual([(row[2], row[5], row[9], row[10]) for row in rows[1:]], [
+            ('Sauna', '2030-01-01', 'pending', 'Kraków'),
+            ('Sauna', '2030-02-01', 'accepted', 'Kraków'),
+        ])
+
+    def test_ndjson(self):
+        response = self.export(output='ndjson', status='pending', **{'from': '2030-01-02', 'to': '2030-01-31'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(set(rows[0]), {header for header, _ in RESERVATION_EXPORT_COLUMNS})
+        self.assertEqual({row['tub_name'] for row in rows}, {'Sauna', 'Balia'})
+        self.assertEqual({(row['status'], row['price']) for row in rows}, {('pending', '100.00')})
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.export(output='xml').status_code, 400)
+        self.assertEqual(self.export(status='lost').status_code, 400)
+        self.assertEqual(self.export(tub='sauna').status_code, 400)
+
+    def test_managers_only(self):
+        client = APIClient()
+        client.force_authenticate(self.guest)
+        self.assertEqual(client.get('/api/reservations/export/').status_code, 403)
+
+
+class TubFilterTests(TestCase):
+    """Price, rating and free-window filters, and the ordering whitelist of the tub list."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.guest = CustomUser.objects.create_user('guest', 'guest@example.com', 'password')
+        cls.cheap = Tub.objects.create(name='Cheap', description='Hot tub', price_per_day=100, rating_count=2, rating_sum=6)
+        cls.middle = Tub.objects.create(name='Middle', description='Hot tub', price_per_day=300, rating_count=1, rating_sum=5)
+        cls.dear = Tub.objects.create(name='Dear', description='Hot tub', price_per_day=500)
+        # Cheap is booked 10-12 January, Middle had 10-12 January but it was rejected.
+        for tub, status in [(cls.cheap, Reservation.Status.ACCEPTED), (cls.middle, Reservation.Status.REJECTED)]:
+            Reservation.objects.create(
+                tub=tub, user=cls.guest, price=100, counted_price=300,
+                start_date=date(2030, 1, 10), end_date=date(2030, 1, 12), status=status,
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def names(self, **params):
+        response = APIClient().get('/api/tubs/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [tub['name'] for tub in response.data['results']]
+
+    def test_price(self):
+        self.assertEqual(self.names(min_price=300), ['Middle', 'Dear'])
+        self.assertEqual(self.names(max_price='300.00'), ['Cheap', 'Middle'])
+        self.assertEqual(self.names(min_price=200, max_price=400), ['Middle'])
+
+    def test_min_rating(self):
+        self.assertEqual(self.names(min_rating=3), ['Cheap', 'Middle'])
+        self.assertEqual(self.names(min_rating='4.5'), ['Middle'])
+
+    def test_overlapping_window_excludes(self):
+        self.assertEqual(self.names(**{'from': '2030-01-12', 'to': '2030-01-14'}), ['Middle', 'Dear'])
+        self.assertEqual(self.names(**{'from': '2030-01-05', 'to': '2030-01-20'}), ['Middle', 'Dear'])
+        self.assertEqual(self.names(**{'from': '2030-01-11', 'to': '2030-01-11'}), ['Middle', 'Dear'])
+
+    def test_adjacent_window_is_free(self):
+        self.assertEqual(self.names(**{'from': '2030-01-13', 'to': '2030-01-15'}), ['Cheap', 'Middle', 'Dear'])
+        self.assertEqual(self.names(**{'from': '2030-01-07', 'to': '2030-01-09'}), ['Cheap', 'Middle', 'Dear'])
+
+    def test_pending_reservation_holds_the_window(self):
+        Reservation.objects.create(
+            tub=self.dear, user=self.guest, price=500, counted_price=500,
+            start_date=date(2030, 1, 13), end_date=date(2030, 1, 13),
+        )
+        self.assertEqual(self.names(**{'from': '2030-01-13', 'to': '2030-01-15'}), ['Cheap', 'Middle'])
+
+    def test_filters_combine(self):
+        self.assertEqual(self.names(max_price=400, min_rating=4, **{'from': '2030-01-10', 'to': '2030-01-10'}), ['Middle'])
+
+    def test_orderings(self):
+        self.assertEqual(self.names(ordering='-price'), ['Dear', 'Middle', 'Cheap'])
+        self.assertEqual(self.names(ordering='-rating'), ['Middle', 'Cheap', 'Dear'])
+        self.assertEqual(self.names(ordering='rating'), ['Dear', 'Cheap', 'Middle'])
+
+    def test_invalid_parameters(self):
+        for params in [
+            {'ordering': 'name'}, {'ordering': 'price_per_day; DROP TABLE base_tub'},
+            {'min_price': 'cheap'}, {'min_rating': 'NaN'},
+            {'from': '2030-01-10'}, {'from': '2030-01-10', 'to': '2030-01-09'},
+            {'from': '2030-01-01', 'to': '2031-12-31'}, {'from': '10.01.2030', 'to': '2030-01-12'},
+        ]:
+            with self.subTest(params=params):
+                response = APIClient().get('/api/tubs/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('message', response.data)
+
+
+class SchemaViewTests(TestCase):
+    """/api/schema/ serves the release artifacts as they are, and generates the schema once without them."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(OPENAPI_SCHEMA_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        documents = patch.dict(schema._documents, clear=True)
+        documents.start()
+        self.addCleanup(documents.stop)
+        # Generating the schema from the views prints a warning per undocumented field.
+        self.enterContext(GENERATOR_STATS.silence())
+
+    def write(self, file_name, content):
+        with open(f'{self.directory}/{file_name}', 'wb') as f:
+            f.write(content)
+
+    def test_serves_the_prebuilt_file(self):
+        self.write('schema.yaml', b'openapi: 3.0.3\ninfo:\n  title: prebuilt\n')
+        self.write('schema.json', b'{"openapi": "3.0.3", "info": {"title": "prebuilt"}}')
+        with patch('base.schema.generate_schema') as generate:
+            response = self.client.get('/api/schema/')
+            self.assertEqual((response.status_code, response.content), (200, b'openapi: 3.0.3\ninfo:\n  title: prebuilt\n'))
+            self.assertTrue(response['Content-Type'].startswith('application/vnd.oai.openapi'))
+            self.assertIn('Last-Modified', response)
+            self.assertIn('max-age=', response['Cache-Control'])
+
+            for response in [self.client.get('/api/schema/', {'format': 'json'}), self.client.get('/api/schema/', headers={'Accept': 'application/json'})]:
+                self.assertEqual(response.json()['info']['title'], 'prebuilt')
+        generate.assert_not_called()
+
+    def test_not_modified(self):
+        self.write('schema.yaml', b'openapi: 3.0.3\n')
+        response = self.client.get('/api/schema/')
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        response = self.client.get('/api/schema/', headers={'If-None-Match': etag})
+        self.assertEqual((response.status_code, response.content, response['ETag']), (304, b'', etag))
+        response = self.client.get('/api/schema/', headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/api/schema/', headers={'If-None-Match': '"stale"'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_generated_once_without_the_file(self):
+        with patch('base.schema.generate_schema', wraps=schema.generate_schema) as generate:
+            first = self.client.get('/api/schema/', {'format': 'json'})
+            second = self.client.get('/api/schema/', {'format': 'json'})
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(first.content, second.content)
+        self.assertIn('/api/tubs/', first.json()['paths'])
+        self.assertNotIn('Last-Modified', first)
+        self.assertEqual(self.client.get('/api/schema/', {'format': 'json'}, headers={'If-None-Match': first['ETag']}).status_code, 304)
+
+    def test_command_writes_what_the_view_serves(self):
+        call_command('build_openapi_schema', directory=self.directory, stdout=StringIO())
+        with open(f'{self.directory}/schema.json', 'rb') as f:
+            self.assertEqual(self.client.get('/api/schema/', {'format': 'json'}).content, f.read())
@@ -0,0 +1,140 @@
+import os
+import time
+from io import BytesIO
+from uuid import uuid4
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from PIL import Image as PILImage
+
+
+TICKET_SALT = 'base.uploads.ticket'
+
+ALLOWED_EXTENSIONS = ('jpg', 'jpeg', 'png', 'webp', 'gif')
+# What Pillow calls the same formats.
+ALLOWED_FORMATS = ('JPEG', 'PNG', 'WEBP', 'GIF')
+
+# Storage folder per upload kind, the same as the models' upload_to.
+UPLOAD_FOLDERS = {
+    'logo': 'logo_tub/',
+    'image': 'images/',
+}
+
+
+class InvalidTicket(Exception):
+    pass
+
+
+class LocalUploadBackend:
+    """
+    Offline stand-in for a storage provider's upload API. The client PUTs
+    the raw bytes to our own ``upload-local`` endpoint, which writes them to
+    ``default_storage`` under the ticket's key. The only backend that
+    receives bytes, hence the only one with ``store()``.
+    """
+
+    def key_for(self, kind, extension):
+        return f'{UPLOAD_FOLDERS[kind]}{uuid4().hex}.{extension}'
+
+    def instructions(self, ticket, key, request=None):
+        url = reverse('upload-local', kwargs={'ticket': ticket})
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        return {'method': 'PUT', 'url': url, 'fields': {}}
+
+    def store(self, key, content):
+        return default_storage.save(key, ContentFile(content)) == key
+
+    def exists(self, key):
+        return default_storage.exists(key)
+
+
+class CloudinaryUploadBackend:
+    """
+    Signed direct upload to Cloudinary. The client POSTs a multipart form with
+    ``file`` plus the returned fields to the Cloudinary upload API; the
+    public_id is fixed by the signature, so it is also the name
+    ``MediaCloudinaryStorage`` would have stored.
+    """
+
+    def key_for(self, kind, extension):
+        from cloudinary_storage import app_settings
+
+        prefix = app_settings.PREFIX.lstrip('/')
+        if prefix and not prefix.endswith('/'):
+            prefix += '/'
+        return f'{prefix}{UPLOAD_FOLDERS[kind]}{uuid4().hex}'
+
+    def instructions(self, ticket, key, request=None):
+        import cloudinary.utils
+        from cloudinary_storage import app_settings
+
+        credentials = settings.CLOUDINARY_STORAGE
+        fields = {
+            'public_id': key,
+            'timestamp': int(time.time()),
+            'tags': app_settings.MEDIA_TAG,
+            'allowed_formats': ','.join(ALLOWED_EXTENSIONS),
+        }
+        fields['signature'] = cloudinary.utils.api_sign_request(fields, credentials['API_SECRET'])
+        fields['api_key'] = credentials['API_KEY']
+        url = cloudinary.utils.cloudinary_api_url('upload', resource_type='image', cloud_name=credentials['CLOUD_NAME'])
+        return {'method': 'POST', 'url': url, 'fields': fields}
+
+    def exists(self, key):
+        from cloudinary_storage.storage import MediaCloudinaryStorage
+
+        return MediaCloudinaryStorage().exists(key)
+
+
+UPLOAD_BACKENDS = {
+    'local': LocalUploadBackend,
+    'cloudinary': CloudinaryUploadBackend,
+}
+
+
+def get_backend():
+    return UPLOAD_BACKENDS[settings.UPLOAD_BACKEND]()
+
+
+def upload_extension(filename):
+    """Lower-case extension of ``filename`` if it is an allowed image type, else None."""
+    extension = os.path.splitext(filename or '')[1].lstrip('.').lower()
+    return extension if extension in ALLOWED_EXTENSIONS else None
+
+
+def is_image(content):
+    """True if Pillow reads ``content`` as an undamaged image of an allowed format."""
+    try:
+        with PILImage.open(BytesIO(content)) as image:
+            image.verify()
+            return image.format in ALLOWED_FORMATS
+    except (OSError, SyntaxError, ValueError, PILImage.DecompressionBombError):
+        return False
+
+
+def issue_ticket(kind, tub_id, user_id, extension, request=None):
+    """
+    Reserve a storage key for one upload and return
+    ``{'ticket': ..., 'key': ..., 'expires_in': seconds, 'upload': {...}}``.
+    The ticket is signed, so confirming it needs no server-side state.
+    """
+    backend = get_backend()
+    key = backend.key_for(kind, extension)
+    ticket = signing.dumps({'kind': kind, 'tub': tub_id, 'user': user_id, 'key': key}, salt=TICKET_SALT, compress=True)
+    return {
+        'ticket': ticket,
+        'key': key,
+        'expires_in': settings.UPLOAD_TICKET_MAX_AGE,
+        'upload': backend.instructions(ticket, key, request),
+    }
+
+
+def read_ticket(ticket):
+    try:
+        return signing.loads(ticket, salt=TICKET_SALT, max_age=settings.UPLOAD_TICKET_MAX_AGE)
+    except signing.BadSignature:
+        raise InvalidTicket('This upload ticket is invalid or has expired')
@@ -1,6 +1,7 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework import routers
-from .views import TubViewListSet, ReservationViewSet, RatingViewSet, DiscountViewSet, AddTubView, UserProfileView, UserReservationHistoryView, UserFaqQuestionView, UpdateFaqStatusView, ManagerFaqListView, PublishedFaqListView, FaqUpdateView, SpecificUserProfileView
+from .views import TubViewListSet, ReservationViewSet, RatingViewSet, DiscountViewSet, AddTubView, UserProfileView, UserReservationHistoryView, UserFaqQuestionView, UpdateFaqStatusView, ManagerFaqListView, PublishedFaqListView, FaqUpdateView, SpecificUserProfileView, AvailabilityView, ImageDerivativeView, QuoteView, SearchView, UploadTicketView, LocalUploadView, UploadConfirmView
 
 router = routers.DefaultRouter()
 router.register('tubs', TubViewListSet)
@@ -14,11 +15,23 @@ urlpatterns = [
     path('tubs/<int:pk>/check_reservations/', ReservationViewSet.as_view({'get': 'check_reservations'}), name='check_reservations'),
     path('reservations/', ReservationViewSet.as_view({'get': 'all_reservations'}), name='all_reservations'),
     path('reservations/<int:pk>/accept_reservation/', ReservationViewSet.as_view({'patch': 'accept_reservation'}), name='accept-reservation'),
+    path('reservations/<int:pk>/reject_reservation/', ReservationViewSet.as_view({'patch': 'reject_reservation'}), name='reject-reservation'),
+    path('reservations/<int:pk>/cancel_reservation/', ReservationViewSet.as_view({'patch': 'cancel_reservation'}), name='cancel-reservation'),
     path('reservations/<int:pk>/delete_reservation/', ReservationViewSet.as_view({'patch': 'delete_reservation'}), name='delete_reservation'),
     
     path('tubs/<int:pk>/create_rating/', RatingViewSet.as_view({'post':'create_rating'}), name='create_rating'),
     path('tubs/<int:pk>/rating_list/', RatingViewSet.as_view({'get':'rating_list'}), name='rating_list'),
     
+    path('availability/', AvailabilityView.as_view(), name='availability'),
+    path('quotes/', QuoteView.as_view(), name='quotes'),
+    path('search/', SearchView.as_view(), name='search'),
+
+    path('images/<slug:kind>/<int:pk>/<slug:size>.<slug:fmt>', ImageDerivativeView.as_view(), name='image-derivative'),
+
+    path('uploads/', UploadTicketView.as_view(), name='upload-ticket'),
+    path('uploads/confirm/', UploadConfirmView.as_view(), name='upload-confirm'),
+    path('uploads/local/<str:ticket>/', LocalUploadView.as_view(), name='upload-local'),
+
     path('add-tub/', AddTubView.as_view(), name='add-tub'),
     
     path('profile/', UserProfileView.as_view(), name='user-profile'),
@@ -31,3 +44,20 @@ urlpatterns = [
     path('faq/manage/<int:pk>/status/', UpdateFaqStatusView.as_view(), name='update-faq-status'),
     path('faq/manage/<int:pk>/', FaqUpdateView.as_view(), name='update-faq'),
 ]
+
+
+def async_urlpatterns():
+    """Async read endpoints that take over these URLs in ASGI mode; writes still reach the sync views through ``fallback``."""
+    from .async_views import AsyncTubListView, AsyncTubDetailView, AsyncRatingListView, AsyncPublishedFaqListView, AsyncAvailabilityView
+
+    return [
+        path('tubs/', AsyncTubListView.as_view(fallback=TubViewListSet.as_view({'get': 'list', 'post': 'create'})), name='tub-list-async'),
+        path('tubs/<int:pk>/', AsyncTubDetailView.as_view(fallback=TubViewListSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'})), name='tub-detail-async'),
+        path('tubs/<int:pk>/rating_list/', AsyncRatingListView.as_view(), name='rating_list-async'),
+        path('availability/', AsyncAvailabilityView.as_view(), name='availability-async'),
+        path('faq/', AsyncPublishedFaqListView.as_view(), name='published-faq-list-async'),
+    ]
+
+
+if settings.SERVER_MODE == 'asgi':
+    urlpatterns = async_urlpatterns() + urlpatterns
@@ -1,16 +1,37 @@
 from rest_framework import viewsets, status, generics, permissions
-from .models import Tub, Reservation, Rating, Discount, Faq
-from .serializers import TubSerializer, ReservationSerializer, RatingSerializer, DiscountSerializer, FaqSerializer, AddTubSerializer, Address, FaqQuestionSerializer
+from .models import Tub, Reservation, Rating, Discount, Faq, Image
+from .serializers import TubSerializer, ReservationSerializer, RatingSerializer, DiscountSerializer, FaqSerializer, AddTubSerializer, Address, FaqQuestionSerializer, ImageSerializer
 from django.shortcuts import get_object_or_404
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from decimal import Decimal
+from functools import partial
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.exceptions import PermissionDenied
+from rest_framework.throttling import ScopedRateThrottle
 from rest_framework.views import APIView
 from custom_auth.serializers import UserSerializer
 from custom_auth.models import CustomUser
 from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.utils.dateparse import parse_date
+from django.db import transaction
+from django.http import StreamingHttpResponse, HttpResponseRedirect, HttpResponse
+from .ratings import upsert_rating, apply_rating_change, STARS
+from .pagination import ReservationPagination, TubPagination
+from .filters import filter_tubs, AVAILABILITY_PARAMS
+from .search import search, parse_search
+from .metrics import collect, render_prometheus
+from rest_framework.utils.urls import replace_query_param
+from .stamps import conditional, bump, tub_keys
+from .images import is_current, schedule_derivatives, DERIVATIVE_TARGETS, DERIVATIVE_SIZES, DERIVATIVE_FORMATS
+from .response_cache import cached
+from .exports import export_stream, EXPORT_FORMATS, RESERVATION_EXPORT_COLUMNS, DISCOUNT_EXPORT_COLUMNS
+from .availability import tub_availability, book_tub, parse_window, TubUnavailable, MAX_WINDOW_DAYS
+from .pricing import quote_price, batch_quote, rates_for, discount_error, redeem_discount, DiscountUnavailable, CENT, MAX_QUOTES, MAX_QUOTE_CODES
+from .moderation import filter_reservations, accept_reservations, delete_reservations, transition_reservation, InvalidTransition, BULK_MAX_RESERVATIONS
+from .promotions import generate_codes, validate_generation
+from .uploads import get_backend, issue_ticket, is_image, LocalUploadBackend, read_ticket, upload_extension, InvalidTicket, UPLOAD_FOLDERS
 
 
 class IsManager(permissions.BasePermission):
@@ -35,10 +56,11 @@ class UserReservationHistoryView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        user = request.user
-        reservations = user.user_reservations.all()
-        serializer = ReservationSerializer(reservations, many=True)
-        return Response(serializer.data)
+        reservations = Reservation.objects.filter(user_id=request.user.id).prefetch_related('address_to_reservation')
+        paginator = ReservationPagination()
+        page = paginator.paginate_queryset(reservations, request, view=self)
+        serializer = ReservationSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 
 class SpecificUserProfileView(APIView):
@@ -51,9 +73,37 @@ class SpecificUserProfileView(APIView):
 
 
 class TubViewListSet(viewsets.ModelViewSet):
-    queryset = Tub.objects.all()
+    queryset = Tub.objects.prefetch_related('images')
     serializer_class = TubSerializer
     permission_classes = [AllowAny]
+    pagination_class = TubPagination
+
+    def list(self, request, *args, **kwargs):
+        try:
+            queryset = filter_tubs(self.get_queryset(), request.query_params)
+        except ValueError as e:
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if any(request.query_params.get(name) for name in AVAILABILITY_PARAMS):
+            # The 'tubs' stamp does not move on bookings, a cached page could offer a tub booked since.
+            return self._list(request, queryset)
+        return self._cached_list(request, queryset)
+
+    @conditional('tubs')
+    @cached('tubs')
+    def _cached_list(self, request, queryset):
+        return self._list(request, queryset)
+
+    def _list(self, request, queryset):
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(queryset, many=True).data)
+
+    @conditional('tub:{pk}')
+    @cached('tub:{pk}')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
 
 class AddTubView(generics.CreateAPIView):
@@ -62,14 +112,109 @@ class AddTubView(generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
 
 
+class UploadTicketView(APIView):
+    permission_classes = [IsManager]
+
+    def post(self, request, *args, **kwargs):
+        kind = request.data.get('kind')
+        if kind not in UPLOAD_FOLDERS:
+            return Response({'message': f'Kind must be one of: {", ".join(UPLOAD_FOLDERS)}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        extension = upload_extension(request.data.get('filename'))
+        if extension is None:
+            return Response({'message': 'Filename must be a jpg, jpeg, png, webp or gif image'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            tub_id = int(request.data.get('tub'))
+        except (TypeError, ValueError):
+            return Response({'message': 'Tub id is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        tub = get_object_or_404(Tub, pk=tub_id)
+        ticket = issue_ticket(kind, tub.pk, request.user.id, extension, request)
+        return Response(ticket, status=status.HTTP_201_CREATED)
+
+
+class LocalUploadView(APIView):
+    """Receives the file bytes for the local upload backend; the ticket is the credential."""
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def put(self, request, ticket):
+        if settings.UPLOAD_BACKEND != 'local':
+            return Response({'message': 'Uploads go directly to the storage provider'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            key = read_ticket(ticket)['key']
+        except InvalidTicket as e:
+            return Response({'message': str(e)}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if not length:
+            return Response({'message': 'The request body must contain the file'}, status=status.HTTP_400_BAD_REQUEST)
+        if length > settings.UPLOAD_MAX_BYTES:
+            return Response({'message': f'Files cannot be larger than {settings.UPLOAD_MAX_BYTES} bytes'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        if not is_image(request.body):
+            return Response({'message': 'The file must be a jpg, png, webp or gif image'}, status=status.HTTP_400_BAD_REQUEST)
+
+        backend = LocalUploadBackend()
+        if backend.exists(key) or not backend.store(key, request.body):
+            return Response({'message': 'This ticket has already been used'}, status=status.HTTP_409_CONFLICT)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadConfirmView(APIView):
+    permission_classes = [IsManager]
+
+    def post(self, request, *args, **kwargs):
+        try:
+            ticket = read_ticket(request.data.get('ticket', ''))
+        except InvalidTicket as e:
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if ticket['user'] != request.user.id:
+            return Response({'message': 'This upload ticket belongs to another user'}, status=status.HTTP_403_FORBIDDEN)
+
+        if not get_backend().exists(ticket['key']):
+            return Response({'message': 'The file has not been uploaded yet'}, status=status.HTTP_400_BAD_REQUEST)
+
+        tub = get_object_or_404(Tub, pk=ticket['tub'])
+        # Derivatives are built in the background after commit, this worker never touches the bytes.
+        if ticket['kind'] == 'logo':
+            if tub.logo_img.name != ticket['key']:
+                tub.logo_img.name = ticket['key']
+                # update() skips the tub's post_save, stamps and derivatives are handled here.
+                with transaction.atomic():
+                    Tub.objects.filter(pk=tub.pk).update(logo_img=ticket['key'])
+                    bump(*tub_keys(tub.pk))
+                    transaction.on_commit(partial(schedule_derivatives, 'logo', tub.pk))
+            result = TubSerializer(tub, context={'request': request}).data
+        else:
+            image, _ = Image.objects.get_or_create(tub=tub, image=ticket['key'])
+            result = ImageSerializer(image, context={'request': request}).data
+        return Response({'message': 'Upload attached', 'result': result}, status=status.HTTP_200_OK)
+
+
 class ReservationViewSet(viewsets.ModelViewSet):
-    queryset = Reservation.objects.all()
+    queryset = Reservation.objects.prefetch_related('address_to_reservation')
     serializer_class = ReservationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = ReservationPagination
+
+    def paginated_response(self, queryset):
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['POST'])
     def create_reservation(self, request, pk=None):
-        user = request.user if request.user.is_authenticated else None
+        user_id = request.user.id if request.user.is_authenticated else None
         start_date = request.data.get('start_date')
         end_date = request.data.get('end_date')
         address_data = {
@@ -77,63 +222,77 @@ class ReservationViewSet(viewsets.ModelViewSet):
             'street': request.data.get('street'),
             'home_number': request.data.get('home_number')
         }
+        discount_code = request.data.get('discount_code')
         discount_id = request.data.get('discount_id')
 
         tub = get_object_or_404(Tub, pk=pk)
 
         if not start_date or not end_date:
             return Response({'message': 'Start Date and End Date are required'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        if Reservation.objects.filter(tub=tub, start_date__lte=end_date, end_date__gte=start_date).exists():
-            return Response({'message': 'This tub is already reserved for the selected dates'}, status=status.HTTP_400_BAD_REQUEST)
 
-        price = tub.price_per_day
-        counted_price = Decimal(request.data.get('counted_price', price))  # Pobranie counted_price z requesta
+        try:
+            start_date = parse_date(start_date)
+            end_date = parse_date(end_date)
+        except ValueError:
+            start_date = end_date = None
+        if not start_date or not end_date or end_date < start_date:
+            return Response({'message': 'Dates must be YYYY-MM-DD and End Date cannot be before Start Date'}, status=status.HTTP_400_BAD_REQUEST)
 
-        if discount_id:
+        price = tub.price_per_day
+        discount = None
+        discount_value = None
+
+        if discount_code:
+            # main is unique, so this is an index lookup.
+            discount = Discount.objects.filter(main=str(discount_code).strip()).first()
+            if discount is None:
+                return Response({'message': 'This code does not exist'}, status=status.HTTP_400_BAD_REQUEST)
+        elif discount_id:
             discount = get_object_or_404(Discount, pk=discount_id)
-            
-            if discount.tub != tub:
-                return Response({'message': 'This is not the right code for this tub'}, status=status.HTTP_400_BAD_REQUEST)
-        
-            if not discount.active:
-                return Response({'message': 'This code is not available'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            if not discount.is_multi_use and discount.used:
-                return Response({'message': 'This code has already been used'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            discount_value = Decimal(discount.value) / Decimal(100)
-            counted_price = price * (Decimal(1) - discount_value)
-            
-            if not discount.is_multi_use:
-                discount.used = True
-                discount.active = False
-            
-            discount.save()
-
-        reservation = Reservation.objects.create(
-            user=user,
-            tub=tub,
-            price=price,
-            counted_price=counted_price,
-            start_date=start_date,
-            end_date=end_date,
-            wait_status=True
-        )
-
-        Address.objects.create(
-            reservation=reservation,
-            **address_data
-        )
+
+        if discount is not None:
+            error = discount_error(discount, tub.pk)
+            if error:
+                return Response({'message': error}, status=status.HTTP_400_BAD_REQUEST)
+            discount_value = discount.value
+
+        # The total is always computed here; a client supplied counted_price is ignored.
+        quote = quote_price(rates_for(tub), start_date, end_date, discount_value)
+        counted_price = quote['total']
+
+        try:
+            with transaction.atomic():
+                reservation = book_tub(
+                    tub,
+                    start_date,
+                    end_date,
+                    user_id=user_id,
+                    price=price,
+                    counted_price=counted_price,
+                )
+
+                Address.objects.create(
+                    reservation=reservation,
+                    **address_data
+                )
+
+                # Last, so the code's row lock is held only until the commit right after.
+                if discount is not None:
+                    redeem_discount(discount)
+        except TubUnavailable:
+            return Response({'message': 'This tub is already reserved for the selected dates'}, status=status.HTTP_400_BAD_REQUEST)
+        except DiscountUnavailable:
+            return Response({'message': 'This code has already been used'}, status=status.HTTP_400_BAD_REQUEST)
 
         response_data = {
             'message': 'Reservation created. Wait for acceptance by owner',
-            'result': ReservationSerializer(reservation).data
+            'result': ReservationSerializer(reservation).data,
+            'quote': quote,
         }
 
-        if discount_id:
+        if discount is not None:
             response_data['message'] = 'Reservation created, discount applied successfully. Wait for acceptance by owner'
-            response_data['discounted_price_per_day'] = counted_price
+            response_data['discounted_price_per_day'] = (price * (100 - Decimal(discount_value or 0)) / 100).quantize(CENT)
             response_data['original_price_per_day'] = price
             response_data['discount_value'] = f'{discount.value}%'
 
@@ -142,30 +301,127 @@ class ReservationViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['GET'])
     def check_reservations(self, request, pk=None):
         tub = get_object_or_404(Tub, pk=pk)
-        reservations = Reservation.objects.filter(tub=tub)
-        serializer = ReservationSerializer(reservations, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        reservations = self.get_queryset().filter(tub=tub)
+        return self.paginated_response(reservations)
 
     @action(detail=False, methods=['GET'])
     def all_reservations(self, request):
-        reservations = Reservation.objects.all()
-        serializer = ReservationSerializer(reservations, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        reservations = self.get_queryset()
+        return self.paginated_response(reservations)
 
-    @action(detail=True, methods=['PATCH'])
+    @action(detail=False, methods=['GET'], permission_classes=[IsManager])
+    def export(self, request):
+        # ?format= is taken by DRF's content negotiation, hence ?output=.
+        export_format = request.query_params.get('output', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response({'message': f'Output must be one of: {", ".join(EXPORT_FORMATS)}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            reservations = filter_reservations(Reservation.objects.order_by('id'), request.query_params)
+        except ValueError as e:
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        content_type, stream = export_stream(reservations, RESERVATION_EXPORT_COLUMNS, export_format)
+        response = StreamingHttpResponse(stream, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="reservations.{export_format}"'
+        return response
+
+    def bulk_target(self, request):
+        """
+        Read ``{"ids": [...]}`` or ``{"filter": {...}, "after": id}`` into
+        ``(ids, queryset)``; raises ValueError. A filter is worked through
+        ``BULK_MAX_RESERVATIONS`` rows at a time in id order, ``after`` being
+        the ``next_after`` of the previous response.
+        """
+        ids, filters, after = request.data.get('ids'), request.data.get('filter'), request.data.get('after')
+        if (ids is None) == (filters is None):
+            raise ValueError('Provide either a list of ids or a filter')
+        if ids is not None and after is not None:
+            raise ValueError('After only applies to a filter')
+
+        if ids is not None:
+            if not isinstance(ids, list) or not ids:
+                raise ValueError('Ids must be a non-empty list')
+            if len(ids) > BULK_MAX_RESERVATIONS:
+                raise ValueError(f'At most {BULK_MAX_RESERVATIONS} reservations can be changed at once')
+            try:
+                return list(dict.fromkeys(int(pk) for pk in ids)), None
+            except (TypeError, ValueError):
+                raise ValueError('Ids must be integers')
+
+        if not isinstance(filters, dict):
+            raise ValueError('Filter must be an object')
+        queryset = filter_reservations(Reservation.objects.all(), filters)
+        if after is not None:
+            if isinstance(after, bool) or not isinstance(after, int):
+                raise ValueError('After must be an id')
+            queryset = queryset.filter(pk__gt=after)
+        return None, queryset
+
+    def bulk_response(self, results, queryset, outcome):
+        """
+        Report the outcomes with ``count`` of rows that reached ``outcome``.
+        A filter matching more than ``BULK_MAX_RESERVATIONS`` rows was cut
+        short: ``next_after`` is then the id to send as ``after`` to go on.
+        """
+        done = sum(result['outcome'] == outcome for result in results)
+        next_after = None
+        if queryset is not None and len(results) == BULK_MAX_RESERVATIONS and queryset.filter(pk__gt=results[-1]['id']).exists():
+            next_after = results[-1]['id']
+
+        message = f'{done} reservations {outcome}'
+        if next_after is not None:
+            message += f', more match the filter: repeat with "after": {next_after}'
+        return Response({'message': message, 'count': done, 'next_after': next_after, 'results': results}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['POST'], permission_classes=[IsManager])
+    def bulk_accept(self, request):
+        try:
+            ids, queryset = self.bulk_target(request)
+        except ValueError as e:
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return self.bulk_response(accept_reservations(ids, queryset), queryset, 'accepted')
+
+    @action(detail=False, methods=['POST'], permission_classes=[IsManager])
+    def bulk_delete(self, request):
+        try:
+            ids, queryset = self.bulk_target(request)
+        except ValueError as e:
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return self.bulk_response(delete_reservations(ids, queryset), queryset, 'deleted')
+
+    def transition_response(self, pk, target, message):
+        try:
+            found = transition_reservation(int(pk), target)
+        except InvalidTransition as e:
+            return Response({'message': f'Reservation is already {e.current}'}, status=status.HTTP_409_CONFLICT)
+        if not found:
+            return Response({'message': 'Reservation not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = ReservationSerializer(self.get_queryset().get(pk=pk))
+        return Response({'message': message, 'result': serializer.data}, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['PATCH'], permission_classes=[IsManager])
     def accept_reservation(self, request, pk=None):
-        reservation = get_object_or_404(Reservation, pk=pk)
-        reservation.wait_status = False
-        reservation.accepted_status = True
-        reservation.save()
-        serializer = ReservationSerializer(reservation)
-        return Response({'message': 'Reservation accepted', 'result': serializer.data}, status=status.HTTP_200_OK)
+        return self.transition_response(pk, Reservation.Status.ACCEPTED, 'Reservation accepted')
+
+    @action(detail=True, methods=['PATCH'], permission_classes=[IsManager])
+    def reject_reservation(self, request, pk=None):
+        return self.transition_response(pk, Reservation.Status.REJECTED, 'Reservation rejected')
+
+    @action(detail=True, methods=['PATCH'])
+    def cancel_reservation(self, request, pk=None):
+        reservation = get_object_or_404(Reservation.objects.only('user_id'), pk=pk)
+        if reservation.user_id != request.user.id and not request.user.is_manager:
+            raise PermissionDenied('Only the guest or a manager can cancel this reservation')
+        return self.transition_response(pk, Reservation.Status.CANCELLED, 'Reservation cancelled')
 
     @action(detail=False, methods=['GET'])
     def accepted_reservations(self, request):
-        reservations = Reservation.objects.filter(accepted_status=True)
-        serializer = ReservationSerializer(reservations, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        reservations = self.get_queryset().filter(status=Reservation.Status.ACCEPTED)
+        return self.paginated_response(reservations)
     
     @action(detail=True, methods=['DELETE'])
     def delete_reservation(self, request, pk=None):
@@ -175,48 +431,177 @@ class ReservationViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['GET'])
     def pending_reservations(self, request):
-        reservations = Reservation.objects.filter(accepted_status=False)
-        serializer = ReservationSerializer(reservations, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        reservations = self.get_queryset().filter(status=Reservation.Status.PENDING)
+        return self.paginated_response(reservations)
     
         
+class QuoteView(APIView):
+    permission_classes = [permissions.AllowAny]
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'quotes'
+
+    def post(self, request, *args, **kwargs):
+        items = request.data.get('quotes')
+        if not isinstance(items, list) or not items:
+            return Response({'message': 'Quotes must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > MAX_QUOTES:
+            return Response({'message': f'At most {MAX_QUOTES} quotes can be requested at once'}, status=status.HTTP_400_BAD_REQUEST)
+
+        valid, results = [], []
+        for item in items:
+            try:
+                parsed = {
+                    'tub': int(item['tub']),
+                    'start_date': parse_date(item['start_date']),
+                    'end_date': parse_date(item['end_date']),
+                    'code': str(item.get('code') or '').strip() or None,
+                }
+            except (TypeError, ValueError, KeyError):
+                parsed = None
+            if not parsed or not parsed['start_date'] or not parsed['end_date'] or parsed['end_date'] < parsed['start_date'] \
+                    or (parsed['end_date'] - parsed['start_date']).days >= MAX_WINDOW_DAYS:
+                results.append({'error': f'Each quote needs a tub id and a YYYY-MM-DD date range of at most {MAX_WINDOW_DAYS} days'})
+            else:
+                valid.append(parsed)
+                results.append(None)
+
+        if len({item['code'] for item in valid if item['code']}) > MAX_QUOTE_CODES:
+            return Response({'message': f'At most {MAX_QUOTE_CODES} different discount codes can be quoted at once'}, status=status.HTTP_400_BAD_REQUEST)
+
+        priced = iter(batch_quote(valid)) if valid else iter(())
+        return Response({'quotes': [result or next(priced) for result in results]}, status=status.HTTP_200_OK)
+
+
+class AvailabilityView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            tub_ids, start_date, end_date = parse_window(request.query_params)
+        except ValueError as e:
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'from': start_date,
+            'to': end_date,
+            'tubs': tub_availability(tub_ids, start_date, end_date),
+        }, status=status.HTTP_200_OK)
+
+
+class SearchView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    @conditional('tubs', 'faq')
+    @cached('tubs', 'faq')
+    def get(self, request, *args, **kwargs):
+        try:
+            terms, scopes, page, page_size = parse_search(request.query_params)
+        except ValueError as e:
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        hits = search(terms, scopes, page_size + 1, (page - 1) * page_size)
+        url = request.build_absolute_uri()
+        return Response({
+            'next': replace_query_param(url, 'page', page + 1) if len(hits) > page_size else None,
+            'previous': replace_query_param(url, 'page', page - 1) if page > 1 else None,
+            'results': hits[:page_size],
+        }, status=status.HTTP_200_OK)
+
+
+class MetricsView(APIView):
+    permission_classes = [IsManager]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(render_prometheus(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ImageDerivativeView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, kind, pk, size, fmt):
+        if kind not in DERIVATIVE_TARGETS or size not in DERIVATIVE_SIZES or fmt not in DERIVATIVE_FORMATS:
+            return Response({'message': 'Unknown image derivative'}, status=status.HTTP_404_NOT_FOUND)
+
+        model, field_name, map_field = DERIVATIVE_TARGETS[kind]
+        instance = get_object_or_404(model, pk=pk)
+        field_file = getattr(instance, field_name)
+        if not field_file:
+            return Response({'message': 'This object has no image'}, status=status.HTTP_404_NOT_FOUND)
+
+        if not is_current(instance, field_name, map_field):
+            # Built in the background; until then, or if the source is unreadable, serve the original.
+            schedule_derivatives(kind, instance.pk)
+            return HttpResponseRedirect(field_file.url)
+        return HttpResponseRedirect(field_file.storage.url(getattr(instance, map_field)[size][fmt]))
+
+
 class RatingViewSet(viewsets.ModelViewSet):
-    queryset = Rating.objects.all()
+    queryset = Rating.objects.select_related('tub')
     serializer_class = RatingSerializer
     permission_classes = [AllowAny]
     
     @action(detail=True, methods=['POST'])
     def create_rating(self, request, pk=None):
         tub = get_object_or_404(Tub, pk=pk)
-        user = self.request.user if request.user.is_authenticated else None
+        user_id = request.user.id if request.user.is_authenticated else None
         stars = request.data.get('stars')
         
-        if stars is not None:
-            try:
-                rating = Rating.objects.get(user=user, tub=tub)
-                rating.stars = stars
-                rating.save()
-                serializer = RatingSerializer(rating, many=False)
-                return Response({'message':'Rating updated', 'result': serializer.data}, status=status.HTTP_200_OK)
-            except Rating.DoesNotExist:
-                rating = Rating.objects.create(user=user, tub=tub, stars=stars)
-                serializer = RatingSerializer(rating, many=False)
-                return Response({'message': 'Rating Created', 'result': serializer.data}, status=status.HTTP_200_OK)
-        else:
+        if stars is None:
             return Response({'message':'You need to provide starts'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            stars = int(stars)
+        except (TypeError, ValueError):
+            stars = None
+        if stars not in STARS:
+            return Response({'message': 'Stars must be a number from 1 to 5'}, status=status.HTTP_400_BAD_REQUEST)
+
+        rating, created = upsert_rating(tub, user_id, stars)
+        serializer = RatingSerializer(rating, many=False)
+        message = 'Rating Created' if created else 'Rating updated'
+        return Response({'message': message, 'result': serializer.data}, status=status.HTTP_200_OK)
+
+    def perform_update(self, serializer):
+        previous_stars = serializer.instance.stars
+        with transaction.atomic():
+            rating = serializer.save()
+            apply_rating_change(rating.tub_id, previous_stars, rating.stars)
     
     @action(detail=True, methods=['GET'])
     def rating_list(self, request, pk=None):
         tub = get_object_or_404(Tub, pk=pk)
-        rating = Rating.objects.filter(tub=tub)
-        serializer = RatingSerializer(rating, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        rating = self.get_queryset().filter(tub=tub)
+        page = self.paginate_queryset(rating)
+        serializer = RatingSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
         
                 
 class DiscountViewSet(viewsets.ModelViewSet):
     queryset = Discount.objects.all()
     serializer_class = DiscountSerializer
-    permission_classes = [AllowAny]
+    # Rows carry the codes themselves; guests only ever redeem a code they were given.
+    permission_classes = [IsManager]
+
+    @action(detail=False, methods=['POST'])
+    def generate(self, request):
+        try:
+            count, value, prefix = validate_generation(request.data.get('count'), request.data.get('value'), request.data.get('prefix'))
+        except ValueError as e:
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        tub_id = request.data.get('tub')
+        if tub_id not in (None, ''):
+            tub_id = get_object_or_404(Tub, pk=tub_id).pk
+        else:
+            tub_id = None
+
+        batch = generate_codes(count, value, tub_id=tub_id, prefix=prefix)
+        codes = Discount.objects.filter(batch=batch).order_by('id')
+        content_type, stream = export_stream(codes, DISCOUNT_EXPORT_COLUMNS, 'csv')
+        response = StreamingHttpResponse(stream, content_type=content_type, status=status.HTTP_201_CREATED)
+        response['Content-Disposition'] = f'attachment; filename="discounts-{batch}.csv"'
+        response['X-Discount-Batch'] = batch
+        return response
 
 
 class UserFaqQuestionView(generics.CreateAPIView):
@@ -224,7 +609,7 @@ class UserFaqQuestionView(generics.CreateAPIView):
     permission_classes = [permissions.AllowAny]
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        serializer.save(user_id=self.request.user.id)
 
 class ManagerFaqListView(generics.ListAPIView):
     serializer_class = FaqSerializer
@@ -240,6 +625,11 @@ class PublishedFaqListView(generics.ListAPIView):
     def get_queryset(self):
         return Faq.objects.filter(is_published=True)
 
+    @conditional('faq')
+    @cached('faq')
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 class UpdateFaqStatusView(APIView):
     permission_classes = [permissions.AllowAny]
 
@@ -0,0 +1,73 @@
+import copy
+
+from django.utils.functional import SimpleLazyObject, empty
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+
+class ClaimsUser(SimpleLazyObject):
+    """
+    ``request.user`` backed by the access token claims.
+
+    ``id``/``pk`` and the role claims (``is_manager``) are answered from the
+    token without touching the database. Anything else, including passing
+    the object where a ``CustomUser`` instance is expected, loads the user
+    row once on first access.
+    """
+
+    def __init__(self, token, load):
+        super().__init__(load)
+        self.__dict__['token'] = token
+
+    @property
+    def id(self):
+        return self.token[api_settings.USER_ID_CLAIM]
+
+    pk = id
+
+    @property
+    def is_manager(self):
+        if 'is_manager' in self.token:
+            return self.token['is_manager']
+        return self.__getattr__('is_manager')
+
+    @property
+    def is_authenticated(self):
+        return True
+
+    @property
+    def is_anonymous(self):
+        return False
+
+    def __bool__(self):
+        return True
+
+    def __copy__(self):
+        if self._wrapped is empty:
+            return type(self)(self.token, self._setupfunc)
+        return copy.copy(self._wrapped)
+
+    def __deepcopy__(self, memo):
+        if self._wrapped is empty:
+            result = type(self)(self.token, self._setupfunc)
+            memo[id(self)] = result
+            return result
+        return copy.deepcopy(self._wrapped, memo)
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that skips the per-request user query.
+
+    Role claims come from ``CustomTokenObtainPairSerializer`` and are
+    refreshed together with the access token, so a role change applies
+    within one ``ACCESS_TOKEN_LIFETIME``. Missing or inactive users are
+    rejected when the full user is first loaded.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        return ClaimsUser(validated_token, lambda: super(StatelessJWTAuthentication, self).get_user(validated_token))
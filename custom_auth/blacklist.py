@@ -0,0 +1,137 @@
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import Q
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+
+GENERATION_KEY = 'jwt:blacklist:generation'
+
+# Ids below the high-water mark that were not visible yet (in-flight or rolled back
+# inserts) are re-checked on later syncs for this long. Only the ids just below it:
+# in-flight inserts are recent, older holes are rows prune_tokens deleted.
+GAP_TTL = 60
+GAP_WINDOW = 1000
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings: no false negatives, tunable false positives."""
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class BlacklistFilter:
+    """
+    Per-process Bloom filter of blacklisted JTIs used as a pre-check before
+    the database lookup.
+
+    Processes learn about each other's blacklisting through a generation
+    counter in the shared cache: when it moves, only rows newer than this
+    process' high-water mark are loaded. This relies on CACHES being shared
+    between workers (Redis in production); with a per-process backend the
+    filter would have to sync on every check, so is_blacklisted() skips it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.bloom = BloomFilter(settings.JWT_BLACKLIST_FILTER_CAPACITY, settings.JWT_BLACKLIST_FILTER_ERROR_RATE)
+        self.count = 0
+        self.high_water = 0
+        self.gaps = {}
+        self.generation = None
+
+    def sync(self):
+        generation = cache.get(GENERATION_KEY)
+        if generation is None:
+            # Never set or evicted: start one, or every check would resync.
+            cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+            generation = cache.get(GENERATION_KEY)
+        if generation is not None and generation == self.generation:
+            return
+
+        with self.lock:
+            if generation is not None and generation == self.generation:
+                return
+            if self.count >= settings.JWT_BLACKLIST_FILTER_CAPACITY:
+                # Over capacity the false positive rate climbs; rebuild from scratch.
+                self.reset()
+
+            now = time.monotonic()
+            self.gaps = {pk: seen for pk, seen in self.gaps.items() if now - seen < GAP_TTL}
+            rows = BlacklistedToken.objects.filter(Q(id__gt=self.high_water) | Q(id__in=list(self.gaps))).order_by('id').values_list('id', 'token__jti')
+
+            loaded = set()
+            for pk, jti in rows.iterator(chunk_size=5000):
+                self.bloom.add(jti)
+                loaded.add(pk)
+            self.count += len(loaded)
+
+            for pk in loaded:
+                self.gaps.pop(pk, None)
+            new_high_water = max(loaded, default=self.high_water)
+            for pk in range(max(self.high_water + 1, new_high_water - GAP_WINDOW), new_high_water):
+                if pk not in loaded:
+                    self.gaps[pk] = now
+            self.high_water = max(self.high_water, new_high_water)
+            self.generation = generation
+
+    def add(self, jti):
+        with self.lock:
+            self.bloom.add(jti)
+            self.count += 1
+
+    def might_contain(self, jti):
+        self.sync()
+        return jti in self.bloom
+
+
+blacklist_filter = BlacklistFilter()
+
+
+def _cache_is_shared():
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def bump_generation():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        # Missing or evicted: any new value forces every process to resync.
+        cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+
+
+def is_blacklisted(jti):
+    # Without a shared cache the filter cannot save the query, only add one.
+    if _cache_is_shared() and not blacklist_filter.might_contain(jti):
+        return False
+    return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+
+def mark_blacklisted(jti):
+    blacklist_filter.add(jti)
+    transaction.on_commit(bump_generation)
@@ -1,8 +1,8 @@
 from rest_framework import serializers
-from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
 
 from .models import CustomUser
+from .tokens import RefreshToken, add_role_claims
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -27,7 +27,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         }
     
     def get_token(self, obj):
-        refresh = RefreshToken.for_user(obj)
+        refresh = CustomTokenObtainPairSerializer.get_token(obj)
         return {
             'refresh': str(refresh),
             'access': str(refresh.access_token),
@@ -42,8 +42,15 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
     
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = RefreshToken
+
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
         token['username'] = user.username
-        return token
\ No newline at end of file
+        add_role_claims(token, user)
+        return token
+
+
+class CustomTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = RefreshToken
\ No newline at end of file
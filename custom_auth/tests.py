@@ -1,3 +1,152 @@
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
 from django.test import TestCase
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+from .authentication import ClaimsUser, StatelessJWTAuthentication
+from .blacklist import BlacklistFilter, BloomFilter, blacklist_filter, bump_generation, is_blacklisted
+from .models import CustomUser
+from .serializers import CustomTokenObtainPairSerializer
+from .tokens import RefreshToken
+
+
+def access_for(user):
+    return str(CustomTokenObtainPairSerializer.get_token(user).access_token)
+
+
+class ClaimsUserTests(TestCase):
+    """Requests authenticate from the token claims; the user row is read only when something needs it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = CustomUser.objects.create_user('manager', 'manager@example.com', 'password', is_manager=True)
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        user, _ = StatelessJWTAuthentication().authenticate(request)
+        return user
+
+    def test_claims_without_queries(self):
+        token = access_for(self.manager)
+        with self.assertNumQueries(0):
+            user = self.authenticate(token)
+            self.assertIsInstance(user, ClaimsUser)
+            self.assertEqual((user.id, user.pk, user.is_manager, user.is_authenticated), (self.manager.pk, self.manager.pk, True, True))
+
+    def test_other_fields_load_the_user_once(self):
+        user = self.authenticate(access_for(self.manager))
+        with self.assertNumQueries(1):
+            self.assertEqual(user.username, 'manager')
+            self.assertEqual(user.email, 'manager@example.com')
+
+    def test_inactive_user_rejected_on_load(self):
+        token = access_for(self.manager)
+        CustomUser.objects.filter(pk=self.manager.pk).update(is_active=False)
+        user = self.authenticate(token)
+        with self.assertRaises(AuthenticationFailed):
+            user.username
+
+    def test_refresh_rereads_the_role(self):
+        refresh = CustomTokenObtainPairSerializer.get_token(self.manager)
+        CustomUser.objects.filter(pk=self.manager.pk).update(is_manager=False)
+        self.assertFalse(self.authenticate(str(refresh.access_token)).is_manager)
+
+
+class BlacklistTests(TestCase):
+    """A refresh token stops working once it is blacklisted, whatever the Bloom filter last saw."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('guest', 'guest@example.com', 'password')
+
+    def setUp(self):
+        # Process-wide filter; row ids can repeat between rolled back tests.
+        blacklist_filter.reset()
+        # The local memory cache stands in for a shared one within this process.
+        self.enterContext(patch('custom_auth.blacklist._cache_is_shared', return_value=True))
+        self.client = APIClient()
+
+    def login(self):
+        response = self.client.post('/auth/login/', {'username': 'guest', 'password': 'password'})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_refresh_after_logout_rejected(self):
+        tokens = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+        self.assertEqual(self.client.post('/auth/logout/', {'refresh_token': tokens['refresh']}).status_code, 205)
+        self.assertEqual(self.client.post('/auth/refresh/', {'refresh': tokens['refresh']}).status_code, 401)
+
+    def test_rotated_token_rejected(self):
+        tokens = self.login()
+        rotated = self.client.post('/auth/refresh/', {'refresh': tokens['refresh']})
+        self.assertEqual(rotated.status_code, 200)
+        self.assertEqual(self.client.post('/auth/refresh/', {'refresh': tokens['refresh']}).status_code, 401)
+        self.assertEqual(self.client.post('/auth/refresh/', {'refresh': rotated.data['refresh']}).status_code, 200)
+
+    def test_blacklisted_elsewhere_rejected(self):
+        tokens = self.login()
+        # Let this process load the filter first, then blacklist the way another worker would.
+        blacklist_filter.sync()
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=RefreshToken(tokens['refresh'])['jti']))
+        # What mark_blacklisted() in that worker does once its transaction commits.
+        bump_generation()
+        self.assertEqual(self.client.post('/auth/refresh/', {'refresh': tokens['refresh']}).status_code, 401)
+
+    def test_filter_skips_the_database(self):
+        blacklist_filter.sync()
+        with self.assertNumQueries(0):
+            self.assertFalse(is_blacklisted('never-issued'))
+
+    def test_local_cache_queries_once(self):
+        # Without a shared cache every check would sync first; the filter is skipped instead.
+        with patch('custom_auth.blacklist._cache_is_shared', return_value=False), self.assertNumQueries(1):
+            self.assertFalse(is_blacklisted('never-issued'))
+
+    def test_gaps_only_just_below_high_water(self):
+        now = aware_utcnow()
+        tokens = [
+            OutstandingToken.objects.create(user=self.user, jti=f'jti-{i}', token=f'token-{i}', expires_at=now + timedelta(days=1))
+            for i in range(6)
+        ]
+        rows = [BlacklistedToken.objects.create(token=token) for token in tokens]
+        # Pruned rows leave holes far below the newest id.
+        BlacklistedToken.objects.filter(pk__in=[row.pk for row in rows[1:5]]).delete()
+        blacklist = BlacklistFilter()
+        with patch('custom_auth.blacklist.GAP_WINDOW', 2):
+            blacklist.sync()
+        self.assertEqual(blacklist.high_water, rows[5].pk)
+        self.assertEqual(sorted(blacklist.gaps), [rows[3].pk, rows[4].pk])
+        self.assertIn('jti-0', blacklist.bloom)
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        values = [f'jti-{i}' for i in range(1000)]
+        for value in values:
+            bloom.add(value)
+        self.assertTrue(all(value in bloom for value in values))
+        self.assertLess(sum(f'other-{i}' in bloom for i in range(1000)), 50)
+
+
+class PruneTokensTests(TestCase):
+    def test_prunes_expired_only(self):
+        user = CustomUser.objects.create_user('guest', 'guest@example.com', 'password')
+        now = aware_utcnow()
+        tokens = [
+            OutstandingToken.objects.create(user=user, jti=f'jti-{i}', token=f'token-{i}', created_at=now - timedelta(days=8), expires_at=expires_at)
+            for i, expires_at in enumerate([now - timedelta(days=1), now - timedelta(hours=1), now + timedelta(days=1)])
+        ]
+        BlacklistedToken.objects.create(token=tokens[0])
+        BlacklistedToken.objects.create(token=tokens[2])
 
-# Create your tests here.
+        out = StringIO()
+        call_command('prune_tokens', batch_size=2, stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Pruned 2 outstanding and 1 blacklisted tokens')
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), ['jti-2'])
+        self.assertEqual(BlacklistedToken.objects.get().token_id, tokens[2].pk)
@@ -0,0 +1,41 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken as BaseRefreshToken
+
+from .blacklist import is_blacklisted, mark_blacklisted
+from .models import CustomUser
+
+
+ROLE_CLAIMS = ('is_manager',)
+
+
+def add_role_claims(token, user):
+    for claim in ROLE_CLAIMS:
+        token[claim] = getattr(user, claim)
+    return token
+
+
+class RefreshToken(BaseRefreshToken):
+    @property
+    def access_token(self):
+        access = super().access_token
+        # Claims are copied from the refresh token, which may be days old; re-read the
+        # role so revoking is_manager takes effect on the next refresh.
+        user = CustomUser.objects.filter(
+            **{api_settings.USER_ID_FIELD: self[api_settings.USER_ID_CLAIM]}
+        ).values('is_active', *ROLE_CLAIMS).first()
+        if user is None or not user['is_active']:
+            raise TokenError(_('User not found or inactive'))
+        for claim in ROLE_CLAIMS:
+            access[claim] = user[claim]
+        return access
+
+    def check_blacklist(self):
+        if is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_('Token is blacklisted'))
+
+    def blacklist(self):
+        blacklisted = super().blacklist()
+        mark_blacklisted(self.payload[api_settings.JTI_CLAIM])
+        return blacklisted
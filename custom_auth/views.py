@@ -2,7 +2,7 @@ from django.shortcuts import render
 from drf_spectacular.utils import extend_schema, extend_schema_view
 
 from .models import CustomUser
-from .serializers import UserRegistrationSerializer, CustomTokenObtainPairSerializer, UserSerializer
+from .serializers import UserRegistrationSerializer, CustomTokenObtainPairSerializer, CustomTokenRefreshSerializer, UserSerializer
 
 from rest_framework import viewsets, status, permissions
 from rest_framework.views import APIView
@@ -10,7 +10,7 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from rest_framework_simplejwt.tokens import RefreshToken
+from .tokens import RefreshToken
 
 @extend_schema_view(create=extend_schema(exclude=True))
 class RegistrationViewSet(viewsets.ViewSet):
@@ -42,7 +42,7 @@ class LogoutView(APIView):
         
 
 class CustomTokenRefreshView(TokenRefreshView):
-    pass
+    serializer_class = CustomTokenRefreshSerializer
 
 
 @extend_schema_view(create=extend_schema(exclude=True))
@@ -0,0 +1,120 @@
+"""
+Gunicorn settings, picked up automatically from the project root.
+
+Every value can be overridden through the environment:
+
+    SERVER_MODE=wsgi|asgi     gthread workers or uvicorn workers (see settings.SERVER_MODE)
+    WEB_CONCURRENCY           worker processes, defaults to the number of usable cores
+    GUNICORN_THREADS          threads per gthread worker, default 4
+    GUNICORN_PRELOAD          import the app once in the master before forking, default 1
+    GUNICORN_MAX_REQUESTS     recycle a worker after this many requests, default 1000 (0 disables)
+    GUNICORN_MAX_REQUESTS_JITTER, GUNICORN_TIMEOUT, GUNICORN_GRACEFUL_TIMEOUT, GUNICORN_KEEPALIVE
+    METRICS_DIR               where workers share request metrics, a per-master directory in /dev/shm by default
+"""
+import gc
+import os
+import tempfile
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    return value.lower() in ('1', 'true', 'yes', 'on') if value not in (None, '') else default
+
+
+def _usable_cores():
+    # Respects CPU affinity (taskset, container cpusets); cpu_count() reports the whole host.
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+
+bind = f'0.0.0.0:{os.environ.get("PORT", "8000")}'
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'Balie_Sauny.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'Balie_Sauny.wsgi:application'
+    worker_class = 'gthread'
+    threads = _env_int('GUNICORN_THREADS', 4)
+
+# One process per core: gthread threads and the uvicorn event loop cover concurrency within it.
+workers = _env_int('WEB_CONCURRENCY', _usable_cores())
+
+preload_app = _env_bool('GUNICORN_PRELOAD', True)
+
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', max_requests // 10)
+
+timeout = _env_int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = _env_int('GUNICORN_KEEPALIVE', 5)
+
+# The heartbeat file is touched constantly; keep it off disk-backed /tmp where available.
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+# Set before the app is loaded so settings.METRICS_DIR picks it up in every worker.
+METRICS_DIR = os.environ.setdefault(
+    'METRICS_DIR', os.path.join(worker_tmp_dir if os.path.isdir('/dev/shm') else tempfile.gettempdir(), f'balie-metrics-{os.getpid()}')
+)
+
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    from base.metrics import clear_snapshots
+    clear_snapshots(METRICS_DIR)
+
+
+def on_exit(server):
+    from base.metrics import clear_snapshots
+    clear_snapshots(METRICS_DIR)
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    # Import the URLconf, and with it every view, serializer and drf-spectacular,
+    # in the master so the workers share those pages instead of importing them each.
+    from django.urls import get_resolver
+    get_resolver().urlconf_module
+
+    _close_connections()
+    # Move everything loaded so far out of the collector's reach, otherwise the
+    # first collection in each worker writes to every page and undoes copy-on-write.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Connections opened in the master must never be shared with a child.
+    if preload_app:
+        _close_connections()
+
+
+def worker_exit(server, worker):
+    # Last snapshot of a worker going away (max_requests, reload, shutdown) before the master retires it.
+    from base.metrics import flush
+    flush()
+
+
+def child_exit(server, worker):
+    from base.metrics import retire_worker
+    retire_worker(worker.pid, METRICS_DIR)
+
+
+def _close_connections():
+    from django.core.cache import caches
+    from django.db import connections
+
+    connections.close_all()
+    caches.close_all()